@@ -9,15 +9,18 @@ This module contains functions to read and convert CSU .bin data for GPROF
 import asyncio
 import contextlib
 import logging
-import multiprocessing
 from pathlib import Path
 from concurrent.futures import ProcessPoolExecutor
 import re
 
+import netCDF4
 from netCDF4 import Dataset
 import numpy as np
 import tqdm.asyncio
 
+from regn.data.csu.manifest import Manifest, truncate_samples
+from regn.utils import atomic_write
+
 LOGGER = logging.getLogger(__name__)
 
 N_LAYERS = 28
@@ -71,7 +74,8 @@ class GPROFGMIBinFile:
     """
     def __init__(self,
                  filename,
-                 include_profiles=False):
+                 include_profiles=False,
+                 mmap=False):
         """
         Open file.
 
@@ -79,6 +83,10 @@ class GPROFGMIBinFile:
             filename(``str``): File to open
             include_profiles(``bool``): Whether or not to include profiles
                  in the extracted data.
+            mmap(``bool``): If ``True`` the records in the file are
+                 memory-mapped instead of being read into memory. Only the
+                 records that are actually requested in ``load_data`` are
+                 then read from disk.
         """
         self.filename = filename
         self.include_profiles = include_profiles
@@ -102,10 +110,22 @@ class GPROFGMIBinFile:
                                   GMI_BIN_HEADER_TYPES,
                                   count=1)
 
-        self.handle = np.fromfile(self.filename,
-                                  GMI_BIN_RECORD_TYPES,
-                                  offset=GMI_BIN_HEADER_TYPES.itemsize)
-        self.n_profiles = self.handle.shape[0]
+        if mmap:
+            self.n_profiles = _get_n_profiles(self.filename)
+            if self.n_profiles > 0:
+                self.handle = np.memmap(self.filename,
+                                        GMI_BIN_RECORD_TYPES,
+                                        mode="r",
+                                        offset=GMI_BIN_HEADER_TYPES.itemsize,
+                                        shape=(self.n_profiles,))
+            else:
+                # Empty files can't be memory-mapped.
+                self.handle = np.zeros(0, dtype=GMI_BIN_RECORD_TYPES)
+        else:
+            self.handle = np.fromfile(self.filename,
+                                      GMI_BIN_RECORD_TYPES,
+                                      offset=GMI_BIN_HEADER_TYPES.itemsize)
+            self.n_profiles = self.handle.shape[0]
 
         np.random.seed(np.array([(self.temperature),
                                  self.tpw,
@@ -127,39 +147,63 @@ class GPROFGMIBinFile:
         }
         return attributes
 
-    def load_data(self, start=0.0, end=1.0):
+    def load_data(self, start=0.0, end=1.0, n_samples=None):
         """
         Load data as dictionary of variables.
 
         Args:
             start: Fractional position from which to start reading the data.
             end: Fractional position up to which to read the data.
+            n_samples: If given, at most this number of samples from the
+                given range are loaded.
 
         Returns:
             Dictionary containing each database variables as numpy array.
         """
         n_start = int(start * self.n_profiles)
         n_end = int(end * self.n_profiles)
+        if n_samples is not None:
+            n_end = min(n_end, n_start + max(int(n_samples), 0))
         indices = self.indices[n_start:n_end]
 
+        # Gather the requested records in file order, so that only the
+        # corresponding parts of memory-mapped files are read, and restore
+        # the permuted order afterwards.
+        order = np.argsort(indices)
+        records = np.empty(indices.size, dtype=GMI_BIN_RECORD_TYPES)
+        records[order] = self.handle[indices[order]]
+
         results = {}
         for k, t in GMI_BIN_RECORD_TYPES.descr:
 
             if (not self.include_profiles) and k in PROFILE_NAMES:
                 continue
             if type(t) is str:
-                view = self.handle[k].view(t)
-                results[k] = view[indices]
+                results[k] = records[k].view(t)
             else:
-                view = self.handle[k].view(f"{len(t)}{t[0][1]}")
-                results[k] = view[indices]
+                results[k] = records[k].view(f"{len(t)}{t[0][1]}")
         results["surface_type"] = self.surface_type * np.ones(1, dtype=np.int)
         results["airmass_type"] = self.airmass_type * np.ones(1, dtype=np.int)
         results["tpw"] = self.tpw * np.ones(1, dtype=np.float)
         results["temperature"] = self.temperature * np.ones(1)
         return results
 
-def load_data(filename, start=0.0, end=1.0):
+
+def _get_n_profiles(filename):
+    """
+    Determine the number of profiles in a bin file from its size.
+
+    Args:
+        filename: Path to the bin file.
+
+    Returns:
+        The number of records in the file.
+    """
+    size = Path(filename).stat().st_size - GMI_BIN_HEADER_TYPES.itemsize
+    return max(size, 0) // GMI_BIN_RECORD_TYPES.itemsize
+
+
+def load_data(filename, start=0.0, end=1.0, mmap=False):
     """
     Wrapper function to load data from a file.
 
@@ -167,11 +211,13 @@ def load_data(filename, start=0.0, end=1.0):
         filename: The path of the file to load the data from.
         start: Fractional position from which to start reading the data.
         end: Fractional position up to which to read the data.
+        mmap: Whether to memory-map the file instead of reading it
+            completely.
 
     Returns:
         Dictionary containing each database variables as numpy array.
     """
-    input_file = GPROFGMIBinFile(filename)
+    input_file = GPROFGMIBinFile(filename, mmap=mmap)
     return input_file.load_data(start, end)
 
 ###############################################################################
@@ -183,6 +229,18 @@ EXPECTED_DIMENSIONS = {N_FREQS: "channel",
                        N_LAYERS: "layers",
                        None: "samples"}
 
+# Number of samples that are buffered before being written to the output file.
+BUFFER_SIZE = 2 ** 18
+
+# Chunk size along samples dimension, which matches the size of the batches
+# in which GPROFDataset loads the data.
+CHUNK_SIZE = 8192
+
+# Number of significant decimal digits of the profile variables retained in
+# compact output files. Quantization bounds the relative error of each value
+# independent of its magnitude and makes the data much more compressible.
+PROFILE_SIGNIFICANT_DIGITS = 4
+
 
 class GPROFGMIOutputFile:
     """
@@ -190,27 +248,121 @@ class GPROFGMIOutputFile:
     store the extracted GPROF data.
 
     The data in the file consists of GMI observations and corresponding
-    precipitation. Observations are stored along an infinite dimension
-    `samples`.
+    precipitation. Observations are stored along the dimension `samples`,
+    which is unlimited unless the total number of samples is known in
+    advance, in which case it can be preallocated by providing ``size``.
+    Variables are chunked along the samples dimension with a chunk size of
+    ``chunk_size`` and can optionally be compressed.
+
+    If ``compact_profiles`` is set, the profile variables are quantized
+    to ``PROFILE_SIGNIFICANT_DIGITS`` significant digits and are always
+    compressed. The quantized values are stored as regular floating point
+    values, so no decoding is required when the file is read. Quantization
+    requires a NetCDF4 library with quantization support, otherwise the
+    profiles are only compressed.
+
+    While the file is opened, either using the ``open`` method or a with
+    statement, data added to the file is buffered and appended to the file
+    in batches of at least ``buffer_size`` samples. Otherwise, the file is
+    reopened each time data is added.
+
+    The input files from which data is added to the file can be recorded
+    in a ``Manifest``, which is committed each time data is written to the
+    file. This allows resuming interrupted extractions by skipping input
+    files that are already contained in the file.
+
+    Attributes:
+        filename: The path of the NetCDF4 file.
+        manifest: ``Manifest`` recording the input files whose data has been
+            written to the file.
+        n_samples: The number of samples written to the file.
     """
-    def __init__(self, filename):
+    def __init__(self,
+                 filename,
+                 buffer_size=BUFFER_SIZE,
+                 resume=False,
+                 size=None,
+                 chunk_size=CHUNK_SIZE,
+                 compression=None,
+                 compact_profiles=False):
         """
         Create a new output file with the given name.
+
+        Args:
+            filename: The name of the file to create.
+            buffer_size: The number of samples to buffer before appending
+                them to the file.
+            resume: If ``True`` and the file exists, new data is appended
+                to the data committed to the file in a previous run.
+            size: If given, the samples dimension is created with this fixed
+                size instead of as unlimited dimension.
+            chunk_size: Chunk size along the samples dimension. If ``None``
+                the NetCDF4 library's default chunking is used.
+            compression: If given, variables are compressed using zlib with
+                this compression level and the shuffle filter.
+            compact_profiles: Whether to store profile variables quantized
+                and compressed.
         """
-        print("Createin output file: ", filename)
         self.filename = filename
-        Dataset(filename, "w").close()
-        manager = multiprocessing.Manager()
-        self.lock = manager.Lock()
+        self.buffer_size = buffer_size
+        self.size = size
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.compact_profiles = compact_profiles
+        self._handle = None
+        self._buffer = []
+        self._n_buffered = 0
+        self._sources = []
+        self.manifest = Manifest(filename)
+
+        if resume and Path(filename).exists():
+            print("Resuming output file: ", filename)
+            n_samples = 0
+            with Dataset(filename, "r") as handle:
+                samples = handle.dimensions.get("samples")
+                # Preallocated files are filled in place.
+                if samples is not None and samples.isunlimited():
+                    n_samples = samples.size
+            if n_samples > self.manifest.n_samples:
+                truncate_samples(filename, self.manifest.n_samples)
+            self.n_samples = self.manifest.n_samples
+        else:
+            print("Createin output file: ", filename)
+            Dataset(filename, "w").close()
+            self.manifest.clear()
+            self.n_samples = 0
 
     @property
     def handle(self):
         """
+        Context manager providing access to the NetCDF4 file handle.
+        """
+        if self._handle is not None:
+            return contextlib.nullcontext(self._handle)
+        return contextlib.closing(Dataset(self.filename, "r+"))
 
+    def open(self):
+        """
+        Open the output file and keep it open until ``close`` is called.
+        """
+        if self._handle is None:
+            self._handle = Dataset(self.filename, "r+")
+        return self
 
+    def close(self):
         """
-        return contextlib.closing(Dataset(self.filename, "r+"))
+        Write remaining buffered data and close the output file.
+        """
+        if self._handle is not None:
+            self.flush()
+            self._handle.close()
+            self._handle = None
+
+    def __enter__(self):
+        return self.open()
 
+    def __exit__(self, *args):
+        self.close()
 
     def add_attributes(self, attributes):
         """
@@ -233,65 +385,555 @@ class GPROFGMIOutputFile:
                 to add to store in the output file.
         """
         for n, name in EXPECTED_DIMENSIONS.items():
+            if name == "samples":
+                n = self.size
             handle.createDimension(name, n)
 
         for k in data:
             d = data[k]
             dims = ("samples",)
             dims += tuple([EXPECTED_DIMENSIONS[i] for i in d.shape[1:]])
-            handle.createVariable(k, d.dtype, dims)
+            chunksizes = None
+            if self.chunk_size is not None:
+                chunk_size = self.chunk_size
+                if self.size is not None:
+                    chunk_size = max(min(chunk_size, self.size), 1)
+                chunksizes = (chunk_size,) + d.shape[1:]
+            compression = {}
+            if self.compression is not None:
+                compression = {"zlib": True,
+                               "complevel": self.compression,
+                               "shuffle": True}
+            if self._is_compact(k):
+                compression = {"zlib": True,
+                               "complevel": self.compression or 4,
+                               "shuffle": True}
+                if netCDF4.__has_quantization_support__:
+                    compression["significant_digits"] = PROFILE_SIGNIFICANT_DIGITS
+            handle.createVariable(k,
+                                  d.dtype,
+                                  dims,
+                                  chunksizes=chunksizes,
+                                  **compression)
+
+    def _is_compact(self, name):
+        """
+        Whether the variable with the given name is stored quantized.
+        """
+        return self.compact_profiles and name in PROFILE_NAMES
+
+    def _write(self, data, handle):
+        """
+        Append data to the samples dimension of the file.
 
-    def add_data(self, data):
+        Args:
+            data: Dictionary containing variable names and data
+                to add to store in the output file.
+            handle: The handle of the opened NetCDF4 file.
+        """
+        if data:
+            if len(handle.variables) == 0:
+                self._initialize_file(data, handle)
+
+            i = self.n_samples
+            n = 0
+            for k in data:
+                d = data[k]
+                n = d.shape[0]
+                handle.variables[k][i:i + n] = d
+            handle.sync()
+            self.n_samples += n
+
+        if self._sources:
+            self.manifest.commit(self._sources, self.n_samples)
+            self._sources = []
+
+    def add_data(self, data, sources=None):
         """
         Adds the given data to the file along the samples dimension.
 
         Args:
             data: Dictionary containing variable names and data
                 to add to store in the output file.
+            sources: Optional list of the input files from which the data
+                was extracted. They are recorded in the manifest of the file
+                once the data has been written.
         """
-        with self.lock:
-            with self.handle as handle:
-                if len(handle.variables) == 0:
-                    self._initialize_file(data, handle)
+        if sources is not None:
+            self._sources += list(sources)
 
+        n = 0
+        for k in data:
+            n = max(data[k].shape[0], n)
+            if data[k].shape[0] == 0:
                 n = 0
-                for k in data:
-                    n = max(data[k].shape[0], n)
-                    if data[k].shape[0] == 0:
-                        return
-
-                i = handle.dimensions["samples"].size
-                for k in data:
-                    v = handle.variables[k]
-                    d = data[k]
-                    if d.size == 1:
-                        v[i:i + n] = d[0]
-                    else:
-                        v[i:i + n] = d
+                break
+
+        if n == 0:
+            data = {}
+        else:
+            # Expand scalar variables along samples dimension.
+            data = {k: np.broadcast_to(d, (n,) + d.shape[1:]) if d.size == 1 else d
+                    for k, d in data.items()}
+
+        if self._handle is None:
+            with self.handle as handle:
+                self._write(data, handle)
+            return
+
+        if data:
+            self._buffer.append(data)
+            self._n_buffered += n
+        if self._n_buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered data to the file.
+        """
+        if not self._buffer and not self._sources:
+            return
+        data = {}
+        if self._buffer:
+            data = {k: np.concatenate([b[k] for b in self._buffer])
+                    for k in self._buffer[0]}
+        self._buffer = []
+        self._n_buffered = 0
+        with self.handle as handle:
+            self._write(data, handle)
 
     def __repr__(self):
         return (f"GPROFGMIOutputFile(filename={self.filename})")
 
+def merge_output_files(input_files,
+                       output_file,
+                       buffer_size=BUFFER_SIZE,
+                       preallocate=False,
+                       chunk_size=CHUNK_SIZE,
+                       compression=None,
+                       compact_profiles=False):
+    """
+    Merge extracted data from several files into a single output file.
+
+    The data is concatenated along the samples dimension in the order
+    of the input files. The attributes of the output file are taken from
+    the first input file.
+
+    Args:
+        input_files: List of the files to merge.
+        output_file: Filename of the merged output file.
+        buffer_size: The number of samples to copy at once.
+        preallocate: Whether to create the samples dimension of the
+            output file with the total number of samples in the input files.
+        chunk_size: Chunk size along the samples dimension of the output
+            file.
+        compression: Optional zlib compression level for the output file.
+        compact_profiles: Whether to store profile variables quantized
+            and compressed in the output file.
+
+    Returns:
+        The GPROFGMIOutputFile object representing the merged file.
+    """
+    sizes = []
+    for f in input_files:
+        with Dataset(f, "r") as input_file:
+            samples = input_file.dimensions.get("samples")
+            sizes.append(samples.size if samples is not None else 0)
+
+    output_file = GPROFGMIOutputFile(output_file,
+                                     buffer_size=buffer_size,
+                                     size=sum(sizes) if preallocate else None,
+                                     chunk_size=chunk_size,
+                                     compression=compression,
+                                     compact_profiles=compact_profiles)
+    with Dataset(input_files[0], "r") as input_file:
+        attributes = {k: np.asarray(input_file.getncattr(k))
+                      for k in input_file.ncattrs()}
+    output_file.add_attributes(attributes)
+
+    with output_file:
+        for f, n in zip(input_files, sizes):
+            with Dataset(f, "r") as input_file:
+                input_file.set_auto_mask(False)
+                for i in range(0, n, buffer_size):
+                    data = {k: v[i:i + buffer_size]
+                            for k, v in input_file.variables.items()}
+                    output_file.add_data(data)
+            output_file.add_data({}, sources=Manifest(f).files)
+    return output_file
+
 ###############################################################################
 # File processor.
 ###############################################################################
 
 GPM_FILE_REGEXP = re.compile(r"gpm_(\d\d\d)_(\d\d)(_(\d\d))?_(\d\d).bin")
 
+CATALOG_FILENAME = ".gpm_catalog.npz"
+
+# Catalog fields defining the bins for stratified extraction.
+BIN_KEY = ("surface_type", "temperature", "tpw")
+
+CATALOG_TYPES = np.dtype(
+    [("filename", "U64"),
+     ("mtime", "f8"),
+     ("size", "i8"),
+     ("n_profiles", "i8"),
+     ("temperature", "f4"),
+     ("tpw", "f4"),
+     ("surface_type", "i4"),
+     ("airmass_type", "i4"),
+     ("frequencies", f"{N_FREQS}f4"),
+     ("nominal_eia", f"{N_FREQS}f4")]
+)
+
+
+class BinFileCatalog:
+    """
+    Persistent catalog of the bin files in a folder.
+
+    The catalog records the bin parameters, the file header and the number
+    of profiles of each file and is stored as a sidecar file in the folder.
+    When the catalog is updated, only files that have been added or whose
+    modification time or size has changed are read.
+
+    Attributes:
+        path: The folder containing the bin files.
+        filename: The file in which the catalog is stored.
+        entries: Structured numpy array of dtype ``CATALOG_TYPES`` with one
+            entry per bin file.
+    """
+    def __init__(self, path, filename=None, update=True):
+        """
+        Load catalog for given folder.
+
+        Args:
+            path: The folder containing the bin files.
+            filename: The file to store the catalog in. Defaults to
+                ``CATALOG_FILENAME`` in the given folder.
+            update: Whether to update the catalog when it is loaded.
+        """
+        self.path = Path(path)
+        if filename is None:
+            filename = self.path / CATALOG_FILENAME
+        self.filename = Path(filename)
+
+        self.entries = np.zeros(0, dtype=CATALOG_TYPES)
+        if self.filename.exists():
+            with np.load(self.filename) as catalog:
+                self.entries = catalog["entries"].astype(CATALOG_TYPES)
+        if update:
+            self.update()
+
+    @staticmethod
+    def _read_entry(filename, stat):
+        """
+        Read catalog entry for a bin file.
+        """
+        entry = np.zeros(1, dtype=CATALOG_TYPES)
+        groups = GPM_FILE_REGEXP.match(filename.name).groups()
+        entry["filename"] = filename.name
+        entry["mtime"] = stat.st_mtime
+        entry["size"] = stat.st_size
+        entry["n_profiles"] = _get_n_profiles(filename)
+        entry["temperature"] = float(groups[0])
+        entry["tpw"] = float(groups[1])
+        entry["airmass_type"] = int(groups[3]) if groups[3] else 0
+        entry["surface_type"] = int(groups[4])
+        header = np.fromfile(filename, GMI_BIN_HEADER_TYPES, count=1)
+        if header.size > 0:
+            entry["frequencies"] = header["frequencies"].view("15f4")
+            entry["nominal_eia"] = header["nominal_eia"].view("15f4")
+        return entry[0]
+
+    def update(self):
+        """
+        Update catalog entries of new or modified files and remove entries
+        of deleted files. The catalog is saved if it has changed.
+        """
+        entries = {e["filename"]: e for e in self.entries}
+        new_entries = []
+        changed = False
+        for f in sorted(self.path.iterdir()):
+            if not GPM_FILE_REGEXP.match(f.name):
+                continue
+            stat = f.stat()
+            entry = entries.get(f.name)
+            if (entry is None
+                    or entry["mtime"] != stat.st_mtime
+                    or entry["size"] != stat.st_size):
+                entry = self._read_entry(f, stat)
+                changed = True
+            new_entries.append(entry)
+
+        changed |= len(new_entries) != self.entries.size
+        self.entries = np.array(new_entries, dtype=CATALOG_TYPES)
+        if changed:
+            self.save()
+
+    def save(self):
+        """
+        Atomically write catalog to its file.
+        """
+        try:
+            with atomic_write(self.filename) as file:
+                np.savez(file, entries=self.entries)
+        except OSError as error:
+            LOGGER.warning("Could not write catalog file %s: %s",
+                           self.filename, error)
+
+    def select(self,
+               st_min=-np.inf,
+               st_max=np.inf,
+               tpw_min=-np.inf,
+               tpw_max=np.inf,
+               surface_types=None,
+               airmass_types=None,
+               min_samples=0):
+        """
+        Select catalog entries matching given criteria.
+
+        Args:
+            st_min: The minimum bin surface temperature.
+            st_max: The maximum bin surface temperature.
+            tpw_min: The minimum bin-tpw value.
+            tpw_max: The maximum bin-tpw value.
+            surface_types: If given, only files with these surface types
+                are selected.
+            airmass_types: If given, only files with these airmass types
+                are selected.
+            min_samples: The minimum number of profiles in a file.
+
+        Returns:
+            Structured array containing the selected catalog entries.
+        """
+        e = self.entries
+        mask = ((e["temperature"] >= st_min) * (e["temperature"] <= st_max)
+                * (e["tpw"] >= tpw_min) * (e["tpw"] <= tpw_max)
+                * (e["n_profiles"] >= min_samples))
+        if surface_types is not None:
+            mask *= np.isin(e["surface_type"], surface_types)
+        if airmass_types is not None:
+            mask *= np.isin(e["airmass_type"], airmass_types)
+        return e[mask]
+
+    def __len__(self):
+        return self.entries.size
+
+    def __repr__(self):
+        return f"BinFileCatalog(path={self.path}, n_files={len(self)})"
+
+
+
+def _process_input(input_filename, ranges, quotas=None, include_profiles=False):
+    """
+    Extract data from an input file for a list of fractional ranges.
+
+    Args:
+        input_filename: The input file to process.
+        ranges: List of ``(start, end)`` tuples of fractional positions
+            defining the samples to extract.
+        quotas: Optional list containing the maximum number of samples to
+            extract for each range.
+        include_profiles: Whether to include the profile variables in the
+            extracted data.
+
+    Returns:
+        List containing a dictionary of extracted data for each range.
+    """
+    input_file = GPROFGMIBinFile(input_filename,
+                                 include_profiles=include_profiles,
+                                 mmap=True)
+    if quotas is None:
+        quotas = [None] * len(ranges)
+    return [input_file.load_data(start, end, n_samples=n)
+            for (start, end), n in zip(ranges, quotas)]
+
+
+def get_quotas(entries, ranges, max_samples, bin_key=BIN_KEY):
+    """
+    Calculate the number of samples to extract from each bin file so that
+    the number of samples per bin key doesn't exceed a given maximum.
+
+    The quotas are calculated from the number of profiles in the files,
+    so no record data needs to be read. If the files of a bin key contain
+    more samples than allowed, the maximum number of samples is distributed
+    across them proportionally to the number of samples they contain.
+
+    Args:
+        entries: Structured array of ``BinFileCatalog`` entries of the files
+            to extract the data from.
+        ranges: List of ``(start, end)`` tuples of fractional positions
+            defining the samples to extract.
+        max_samples: The maximum number of samples to extract for each bin
+            key and range.
+        bin_key: Tuple of the names of the catalog fields that define the
+            bins.
+
+    Returns:
+        Integer array of shape ``(n_files, n_ranges)`` containing the number
+        of samples to extract from each file for each range.
+    """
+    n = entries["n_profiles"]
+    keys = np.stack([entries[k].astype(np.float64) for k in bin_key], axis=-1)
+    _, bins = np.unique(keys.reshape(-1, len(bin_key)),
+                        axis=0,
+                        return_inverse=True)
+    bins = bins.ravel()
+
+    quotas = np.zeros((n.size, len(ranges)), dtype=np.int64)
+    for i, (start, end) in enumerate(ranges):
+        available = (end * n).astype(np.int64) - (start * n).astype(np.int64)
+        totals = np.bincount(bins, weights=available)
+        for j in np.where(totals > max_samples)[0]:
+            indices = np.where(bins == j)[0]
+            shares = max_samples * available[indices] / totals[j]
+            q = np.floor(shares).astype(np.int64)
+            remainder = max_samples - q.sum()
+            q[np.argsort(q - shares)[:remainder]] += 1
+            available[indices] = q
+        quotas[:, i] = available
+    return quotas
+
+
+def _process_shard(input_filenames,
+                   shard_filenames,
+                   ranges,
+                   resume=False,
+                   quotas=None,
+                   sizes=None,
+                   layout=None,
+                   include_profiles=False):
+    """
+    Extract data from a list of input files into separate output files.
+
+    Args:
+        input_filenames: The input files to process.
+        shard_filenames: The files to write the extracted data to. One
+            for each range.
+        ranges: List of ``(start, end)`` tuples of fractional positions
+            defining the samples to extract into each shard.
+        resume: Whether to resume the extraction into existing shards.
+        quotas: Optional list containing the maximum numbers of samples to
+            extract for each range from each input file.
+        sizes: Optional list containing the number of samples to preallocate
+            in each shard.
+        layout: Dictionary of keyword arguments defining the chunking and
+            compression of the shards.
+        include_profiles: Whether to include the profile variables in the
+            extracted data.
+
+    Returns:
+        The filenames of the shards.
+    """
+    if sizes is None:
+        sizes = [None] * len(shard_filenames)
+    if layout is None:
+        layout = {}
+    output_files = [GPROFGMIOutputFile(f, resume=resume, size=size, **layout)
+                    for f, size in zip(shard_filenames, sizes)]
+    attributes = GPROFGMIBinFile(input_filenames[0]).get_attributes()
+    if quotas is None:
+        quotas = [None] * len(input_filenames)
+    with contextlib.ExitStack() as stack:
+        for output_file in output_files:
+            if output_file.n_samples == 0:
+                output_file.add_attributes(attributes)
+            stack.enter_context(output_file)
+        for f, q in zip(input_filenames, quotas):
+            if all([f in output_file.manifest for output_file in output_files]):
+                continue
+            data = _process_input(f, ranges, q, include_profiles)
+            for output_file, d in zip(output_files, data):
+                if f not in output_file.manifest:
+                    output_file.add_data(d, sources=[f])
+    for output_file in output_files:
+        _check_size(output_file)
+    return shard_filenames
+
+
+def _check_size(output_file):
+    """
+    Truncate a preallocated output file if fewer samples than expected
+    have been written to it.
+    """
+    if output_file.size is not None and output_file.n_samples < output_file.size:
+        LOGGER.warning("Only %s of %s preallocated samples written to %s.",
+                       output_file.n_samples,
+                       output_file.size,
+                       output_file.filename)
+        truncate_samples(output_file.filename, output_file.n_samples)
+
+
+def _get_sizes(entries, ranges, quotas=None):
+    """
+    Calculate the number of samples that will be extracted from given
+    files.
+
+    Args:
+        entries: Catalog entries of the files to extract the data from.
+        ranges: List of ``(start, end)`` tuples of fractional positions
+            defining the samples to extract.
+        quotas: Optional array of shape ``(n_files, n_ranges)`` containing
+            the maximum numbers of samples to extract.
+
+    Returns:
+        List containing the number of samples for each range.
+    """
+    n = entries["n_profiles"]
+    sizes = []
+    for i, (start, end) in enumerate(ranges):
+        available = (end * n).astype(np.int64) - (start * n).astype(np.int64)
+        if quotas is not None:
+            available = np.minimum(available, quotas[:, i])
+        sizes.append(int(available.sum()))
+    return sizes
+
+
+def _partition_files(files, n, sizes):
+    """
+    Partition files into groups of approximately equal size.
+
+    Args:
+        files: List of files, or file indices, to partition.
+        n: The number of groups.
+        sizes: The sizes of the files, e.g. their number of profiles.
+
+    Returns:
+        List of at most ``n`` lists of files.
+    """
+    groups = [[] for i in range(n)]
+    group_sizes = np.zeros(n)
+    for j in np.argsort(sizes, kind="stable")[::-1]:
+        i = np.argmin(group_sizes)
+        groups[i].append(files[j])
+        group_sizes[i] += sizes[j]
+    return [g for g in groups if g]
+
+
+def get_shard_filename(output_file, i):
+    """
+    Filename of the ith shard of a given output file.
+
+    Shards are written next to the output file by concurrent writers and
+    merged into it once all data has been written.
+
+    Args:
+        output_file: The output file.
+        i: The index of the shard.
+
+    Returns:
+        Path object pointing to the shard file.
+    """
+    output_file = Path(output_file)
+    return output_file.parent / f"{output_file.stem}_{i:03}{output_file.suffix}"
 
-def _process_input(input_filename,
-                   output_file,
-                   start=1.0,
-                   end=1.0):
-    data = load_data(input_filename, start, end)
-    output_file.add_data(data)
 
 async def process_input(loop,
                         pool,
                         input_filename,
-                        output_file,
-                        start=0.0,
-                        end=1.0):
+                        ranges,
+                        quotas=None,
+                        include_profiles=False):
     """
     Asynchronous processing of an intput file.
 
@@ -299,24 +941,47 @@ async def process_input(loop,
         loop: Event loop to execute in.
         pool: Executor to use for concurrent processing.
         input_filename: The input file to process.
-        output_file: The output file object to store the data in.
-        output_file_lock: asyncio.lock to use to gain access to output file.
-        start: Fractional position from which to start reading the data.
-        end: Fractional position up to which to read the data.
+        ranges: List of ``(start, end)`` tuples of fractional positions
+            defining the samples to extract.
+        quotas: Optional list containing the maximum number of samples to
+            extract for each range.
+        include_profiles: Whether to include the profile variables in the
+            extracted data.
+
+    Returns:
+        Tuple ``(input_filename, data)`` containing the name of the
+        processed file and a list of dictionaries of extracted data for
+        each range.
     """
-    await loop.run_in_executor(pool, _process_input, input_filename, output_file, start, end)
+    data = await loop.run_in_executor(pool,
+                                      _process_input,
+                                      input_filename,
+                                      ranges,
+                                      quotas,
+                                      include_profiles)
+    return input_filename, data
 
 
 class FileProcessor:
     """
     File processor class to process GPROF .bin files in given folder.
+
+    Attributes:
+        path: The folder containing the files to process.
+        catalog: The ``BinFileCatalog`` of the folder.
+        entries: The catalog entries of the files to process.
+        files: List of the files to process.
     """
     def __init__(self,
                  path,
                  st_min=227.0,
                  st_max=307.0,
                  tpw_min=0.0,
-                 tpw_max=76.0):
+                 tpw_max=76.0,
+                 surface_types=None,
+                 airmass_types=None,
+                 min_samples=0,
+                 catalog_file=None):
         """
         Create file processor to process file in given path.
 
@@ -326,28 +991,40 @@ class FileProcessor:
             st_max: The maximum bin surface temperature for which to consider bins.
             tpw_min: The minimum bin-tpw value to consider.
             tpw_max: The maximum bin-tpw value to consider.
-
+            surface_types: If given, only bins with these surface types are
+                considered.
+            airmass_types: If given, only bins with these airmass types are
+                considered.
+            min_samples: The minimum number of profiles in a bin file.
+            catalog_file: Location of the catalog file to use. Defaults to
+                ``CATALOG_FILENAME`` in ``path``.
         """
         self.path = path
-
-        self.files = []
-
-        for f in Path(path).iterdir():
-            match = re.match(GPM_FILE_REGEXP, f.name)
-            if match:
-                groups = match.groups()
-                t = float(groups[0])
-                tpw = float(groups[1])
-                if t < st_min or t > st_max or tpw < tpw_min or tpw > tpw_max:
-                    continue
-                self.files.append(f)
-
+        self.catalog = BinFileCatalog(path, filename=catalog_file)
+        self.entries = self.catalog.select(st_min=st_min,
+                                           st_max=st_max,
+                                           tpw_min=tpw_min,
+                                           tpw_max=tpw_max,
+                                           surface_types=surface_types,
+                                           airmass_types=airmass_types,
+                                           min_samples=min_samples)
+        self.files = [Path(path) / f for f in self.entries["filename"]]
 
     def run_async(self,
                   output_file,
                   start_fraction,
                   end_fraction,
-                  n_processes=4):
+                  n_processes=4,
+                  n_shards=None,
+                  merge=True,
+                  resume=False,
+                  max_samples=None,
+                  bin_key=BIN_KEY,
+                  preallocate=False,
+                  chunk_size=CHUNK_SIZE,
+                  compression=None,
+                  include_profiles=False,
+                  compact_profiles=False):
         """
         Asynchronous processing of files in folder.
 
@@ -359,25 +1036,231 @@ class FileProcessor:
                  to extract from each bin file.
             n_processes(``int``): How many processes to use for the parallel reading
                  of input files.
+            n_shards(``int``): If given, the input files are split into
+                 ``n_shards`` groups and the data from each group is written
+                 by a separate process to its own shard file.
+            merge(``bool``): Whether to merge the shards into ``output_file``
+                 and remove them afterwards.
+            resume(``bool``): Whether to resume a previous, interrupted
+                 extraction into the same output file.
+            max_samples(``int``): If given, the number of samples extracted
+                 for each bin key is limited to this number.
+            bin_key(``tuple``): The catalog fields defining the bins to which
+                 ``max_samples`` applies.
+            preallocate(``bool``): Whether to create the output file with
+                 a fixed-size samples dimension.
+            chunk_size(``int``): Chunk size along the samples dimension of
+                 the output file.
+            compression(``int``): If given, the zlib compression level to
+                 use for the output file.
+            include_profiles(``bool``): Whether to extract the profile
+                 variables.
+            compact_profiles(``bool``): Whether to store the profile
+                 variables quantized and compressed.
+
+        Returns:
+            The list of shard filenames if shards are written but not merged.
         """
+        shards = self.run_async_splits({output_file: (start_fraction,
+                                                      end_fraction)},
+                                       n_processes=n_processes,
+                                       n_shards=n_shards,
+                                       merge=merge,
+                                       resume=resume,
+                                       max_samples=max_samples,
+                                       bin_key=bin_key,
+                                       preallocate=preallocate,
+                                       chunk_size=chunk_size,
+                                       compression=compression,
+                                       include_profiles=include_profiles,
+                                       compact_profiles=compact_profiles)
+        if shards is not None:
+            return shards[output_file]
+
+    def run_async_splits(self,
+                         splits,
+                         n_processes=4,
+                         n_shards=None,
+                         merge=True,
+                         resume=False,
+                         max_samples=None,
+                         bin_key=BIN_KEY,
+                         preallocate=False,
+                         chunk_size=CHUNK_SIZE,
+                         compression=None,
+                         include_profiles=False,
+                         compact_profiles=False):
+        """
+        Asynchronous extraction of several splits, e.g. training, validation
+        and test data, reading each file in the folder only once.
+
+        Args:
+            splits(``dict``): Dictionary mapping the filenames of the output
+                 files to tuples ``(start_fraction, end_fraction)`` of the
+                 fractional ranges of the observations to extract from each
+                 bin file into the respective output file.
+            n_processes(``int``): How many processes to use for the parallel reading
+                 of input files.
+            n_shards(``int``): If given, the input files are split into
+                 ``n_shards`` groups and the data from each group is written
+                 by a separate process to its own shard files.
+            merge(``bool``): Whether to merge the shards into the output files
+                 and remove them afterwards.
+            resume(``bool``): Whether to resume a previous, interrupted
+                 extraction into the same output files. Input files that
+                 are recorded in the manifests of the output files are
+                 skipped.
+            max_samples(``int``): If given, the number of samples extracted
+                 into each output file for each bin key is limited to this
+                 number. The samples are drawn from all files of the bin
+                 proportionally to the number of profiles they contain.
+            bin_key(``tuple``): The catalog fields defining the bins to which
+                 ``max_samples`` applies.
+            preallocate(``bool``): Whether to create the output files with
+                 a fixed-size samples dimension. The number of samples is
+                 calculated from the file catalog.
+            chunk_size(``int``): Chunk size along the samples dimension of
+                 the output files.
+            compression(``int``): If given, the zlib compression level to
+                 use for the output files.
+            include_profiles(``bool``): Whether to extract the profile
+                 variables.
+            compact_profiles(``bool``): Whether to store the profile
+                 variables quantized and compressed, which reduces the
+                 size of the output files considerably.
+
+        Returns:
+            Dictionary mapping output filenames to lists of shard filenames
+            if shards are written but not merged.
+        """
+        output_files = list(splits.keys())
+        ranges = [splits[f] for f in output_files]
+        layout = {"chunk_size": chunk_size,
+                  "compression": compression,
+                  "compact_profiles": compact_profiles}
+
+        quotas = None
+        if max_samples is not None:
+            quotas = get_quotas(self.entries, ranges, max_samples, bin_key)
+            print(f"Extracting {quotas.sum()} samples from bins with quota "
+                  f"{max_samples}.")
+
+        if n_shards is not None:
+            return self._run_sharded(output_files,
+                                     ranges,
+                                     n_processes,
+                                     n_shards,
+                                     merge,
+                                     resume,
+                                     quotas,
+                                     preallocate,
+                                     layout,
+                                     include_profiles)
+
         pool = ProcessPoolExecutor(max_workers=n_processes)
         loop = asyncio.new_event_loop()
 
-        output_file = GPROFGMIOutputFile(output_file)
+        sizes = [None] * len(ranges)
+        if preallocate:
+            sizes = _get_sizes(self.entries, ranges, quotas)
+        output_files = [GPROFGMIOutputFile(f, resume=resume, size=size, **layout)
+                        for f, size in zip(output_files, sizes)]
         input_file = GPROFGMIBinFile(self.files[0])
-        output_file.add_attributes(input_file.get_attributes())
+        for output_file in output_files:
+            if output_file.n_samples == 0:
+                output_file.add_attributes(input_file.get_attributes())
+
+        indices = [i for i, f in enumerate(self.files)
+                   if not all([f in o.manifest for o in output_files])]
+        if len(indices) < len(self.files):
+            print(f"Skipping {len(self.files) - len(indices)} processed files.")
 
         async def coro():
             tasks = [process_input(loop,
                                    pool,
-                                   f,
-                                   output_file,
-                                   start=start_fraction,
-                                   end=end_fraction)
-                     for f in self.files]
+                                   self.files[i],
+                                   ranges,
+                                   quotas[i].tolist() if quotas is not None else None,
+                                   include_profiles)
+                     for i in indices]
+            for t in tqdm.asyncio.tqdm.as_completed(tasks):
+                input_filename, data = await t
+                for output_file, d in zip(output_files, data):
+                    if input_filename not in output_file.manifest:
+                        output_file.add_data(d, sources=[input_filename])
+
+        # Workers only read the input files, the data is written to the
+        # output files from this process.
+        with contextlib.ExitStack() as stack:
+            for output_file in output_files:
+                stack.enter_context(output_file)
+            loop.run_until_complete(coro())
+        loop.close()
+        pool.shutdown()
+
+        for output_file in output_files:
+            _check_size(output_file)
+
+    def _run_sharded(self,
+                     output_files,
+                     ranges,
+                     n_processes,
+                     n_shards,
+                     merge,
+                     resume,
+                     quotas,
+                     preallocate,
+                     layout,
+                     include_profiles):
+        """
+        Processing of files in folder with each worker writing to a
+        separate shard file.
+        """
+        pool = ProcessPoolExecutor(max_workers=n_processes)
+        loop = asyncio.new_event_loop()
+
+        if quotas is None:
+            sizes = self.entries["n_profiles"]
+        else:
+            sizes = quotas.sum(axis=1)
+        groups = _partition_files(list(range(len(self.files))), n_shards, sizes)
+        shards = {f: [get_shard_filename(f, i) for i in range(len(groups))]
+                  for f in output_files}
+
+        def get_arguments(i, group):
+            files = [self.files[j] for j in group]
+            shard_files = [shards[f][i] for f in output_files]
+            group_quotas = None
+            if quotas is not None:
+                group_quotas = quotas[group].tolist()
+            shard_sizes = None
+            if preallocate:
+                shard_sizes = _get_sizes(self.entries[group],
+                                         ranges,
+                                         None if quotas is None else quotas[group])
+            return (files, shard_files, ranges, resume, group_quotas,
+                    shard_sizes, layout, include_profiles)
+
+        async def coro():
+            tasks = [loop.run_in_executor(pool,
+                                          _process_shard,
+                                          *get_arguments(i, g))
+                     for i, g in enumerate(groups)]
             for t in tqdm.asyncio.tqdm.as_completed(tasks):
                 await t
 
         loop.run_until_complete(coro())
         loop.close()
-
+        pool.shutdown()
+
+        if not merge:
+            return shards
+
+        for output_file in output_files:
+            merge_output_files(shards[output_file],
+                               output_file,
+                               preallocate=preallocate,
+                               **layout)
+            for shard in shards[output_file]:
+                shard.unlink()
+                Manifest(shard).clear()
@@ -0,0 +1,197 @@
+"""
+===================
+regn.data.csu.cache
+===================
+
+This module provides the PreprocessorCache class, which stores the decoded
+preprocessor data for L1C files, so that repeated extraction runs over
+the same files neither run the preprocessor nor decode its output again.
+
+Each entry is an uncompressed .npz file whose name is derived from the
+L1C file and the version of the preprocessor executable. Entries are written atomically,
+so that the cache can be shared between worker processes, and the least
+recently used entries are removed when the size of the cache exceeds its
+limit.
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+
+import numpy as np
+import xarray
+
+from regn.utils import atomic_write
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_CACHE_SIZE = 50 * 2 ** 30
+
+
+def get_preprocessor_version(preprocessor):
+    """
+    Identifier of the version of a preprocessor executable.
+
+    The identifier consists of the resolved path, the size and the
+    modification time of the executable, so that it changes when the
+    executable is rebuilt or replaced.
+
+    Args:
+        preprocessor: The name or path of the preprocessor executable.
+
+    Returns:
+        String identifying the executable. If the executable can't be
+        found, the given name is returned.
+    """
+    executable = shutil.which(str(preprocessor))
+    if executable is None:
+        LOGGER.warning("Could not find preprocessor executable %s.",
+                       preprocessor)
+        return str(preprocessor)
+    executable = Path(executable).resolve()
+    stat = executable.stat()
+    return f"{executable}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class PreprocessorCache:
+    """
+    Size-bounded, least-recently-used cache of decoded preprocessor data.
+
+    Attributes:
+        path: The directory containing the cache entries.
+        max_size: The maximum total size of the cache entries in bytes.
+        version: The preprocessor version identifying the entries.
+    """
+    def __init__(self,
+                 path,
+                 version,
+                 max_size=MAX_CACHE_SIZE):
+        """
+        Open cache.
+
+        Args:
+            path: The directory containing the cache entries. Created if
+                it doesn't exist.
+            version: The preprocessor version as returned by
+                ``get_preprocessor_version``, which is included in the
+                key of the entries so that data produced by different
+                versions of the preprocessor is never mixed.
+            max_size: The maximum total size of the cache entries in bytes.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.version = version
+
+    def get_filename(self, l1c_file):
+        """
+        The cache file for a given L1C file.
+
+        The key is computed from the absolute path, size and modification
+        time of the L1C file and the preprocessor version.
+
+        Args:
+            l1c_file: Path of the L1C file.
+
+        Returns:
+            Path object pointing to the cache file.
+        """
+        l1c_file = Path(l1c_file).resolve()
+        stat = l1c_file.stat()
+        key = f"{l1c_file}:{stat.st_size}:{stat.st_mtime_ns}:{self.version}"
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return self.path / f"{digest}.npz"
+
+    def get(self, l1c_file):
+        """
+        Load the cached data for an L1C file.
+
+        Args:
+            l1c_file: Path of the L1C file.
+
+        Returns:
+            xarray.Dataset containing the cached preprocessor data or None
+            if the cache contains no data for the file.
+        """
+        filename = self.get_filename(l1c_file)
+        try:
+            with np.load(filename) as entry:
+                dims = json.loads(str(entry["__dims__"]))
+                data = {k: (d, entry[k]) for k, d in dims.items()}
+            os.utime(filename)
+        except (OSError, ValueError, KeyError) as error:
+            if filename.exists():
+                LOGGER.warning("Could not read cache file %s: %s",
+                               filename, error)
+            return None
+        return xarray.Dataset(data)
+
+    def put(self, l1c_file, data):
+        """
+        Store data for an L1C file in the cache and remove the least
+        recently used entries if the cache exceeds its size limit.
+
+        Args:
+            l1c_file: Path of the L1C file.
+            data: xarray.Dataset containing the decoded preprocessor data.
+        """
+        filename = self.get_filename(l1c_file)
+        arrays = {k: data[k].data for k in data.variables}
+        dims = {k: list(data[k].dims) for k in data.variables}
+        arrays["__dims__"] = np.array(json.dumps(dims))
+
+        try:
+            with atomic_write(filename) as file:
+                np.savez(file, **arrays)
+        except OSError as error:
+            LOGGER.warning("Could not write cache file %s: %s",
+                           filename, error)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size of the
+        cache is below its limit.
+        """
+        evict_lru(self.path, self.max_size, "*.npz")
+
+
+def evict_lru(path, max_size, pattern="*"):
+    """
+    Remove the least recently used files in a directory until their total
+    size is below a given limit.
+
+    The time of the last use of a file is its modification time, so
+    caches should update it using ``os.utime`` whenever an entry is used.
+    Temporary files of writes that are still in progress and directories
+    are ignored.
+
+    Args:
+        path: The directory containing the files.
+        max_size: The maximum total size of the files in bytes.
+        pattern: Glob pattern matching the files to consider.
+    """
+    entries = []
+    for f in Path(path).glob(pattern):
+        if f.suffix == ".tmp" or not f.is_file():
+            continue
+        try:
+            stat = f.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, f))
+    entries.sort()
+
+    size = sum([e[1] for e in entries])
+    for _, entry_size, f in entries:
+        if size <= max_size:
+            break
+        try:
+            f.unlink()
+            LOGGER.info("Removed cache file %s.", f)
+        except FileNotFoundError:
+            pass
+        size -= entry_size
@@ -0,0 +1,317 @@
+"""
+===================
+regn.data.csu.index
+===================
+
+This module provides the GranuleIndex class, which records the granule
+number, sensor, time range and number of scans of the preprocessor and
+retrieval files in a directory tree, so that the files covering a given
+time range or granule can be found without opening every file.
+"""
+from datetime import datetime
+from fnmatch import fnmatch
+import gzip
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from regn.data.csu import preprocessor, retrieval
+from regn.utils import atomic_write
+
+LOGGER = logging.getLogger(__name__)
+
+INDEX_FILENAME = ".granule_index.npz"
+
+PREPROCESSOR_PATTERNS = ["*.pp"]
+RETRIEVAL_PATTERNS = ["*.BIN", "*.BIN.gz"]
+
+INDEX_TYPES = np.dtype(
+    [("type", "U12"),
+     ("mtime", "f8"),
+     ("size", "i8"),
+     ("granule", "i8"),
+     ("sensor", "U12"),
+     ("start_time", "datetime64[s]"),
+     ("end_time", "datetime64[s]"),
+     ("n_scans", "i8")]
+)
+
+
+def get_index_types(n_chars):
+    """
+    The data type of the index entries.
+
+    Args:
+        n_chars: The maximum length of the file names in the index.
+
+    Returns:
+        ``INDEX_TYPES`` extended with a ``filename`` field.
+    """
+    return np.dtype([("filename", f"U{max(n_chars, 1)}")] + INDEX_TYPES.descr)
+
+
+def _to_datetime64(date):
+    """
+    Convert a date record from a GPROF file to ``numpy.datetime64``.
+
+    Returns:
+        The date as ``numpy.datetime64`` or ``NaT`` if the record doesn't
+        contain a valid date.
+    """
+    fields = ["year", "month", "day", "hour", "minute", "second"]
+    try:
+        date = datetime(*[int(date[k]) for k in fields])
+    except ValueError:
+        return np.datetime64("NaT", "s")
+    return np.datetime64(date, "s")
+
+
+def _read_preprocessor_entry(filename, entry):
+    """
+    Fill index entry from the orbit header and the first and last scan
+    headers of a preprocessor file.
+    """
+    header = np.fromfile(filename, preprocessor.ORBIT_HEADER_TYPES, count=1)
+    if header.size == 0:
+        return
+    n_scans = int(header["number_of_scans"][0])
+    n_pixels = int(header["number_of_pixels"][0])
+    entry["granule"] = header["granule_number"][0]
+    entry["sensor"] = header["sensor"][0].decode(errors="ignore").strip()
+    entry["n_scans"] = n_scans
+
+    scan_size = preprocessor.get_scan_types(n_pixels).itemsize
+    offset = preprocessor.ORBIT_HEADER_TYPES.itemsize
+    for i, k in [(0, "start_time"), (n_scans - 1, "end_time")]:
+        scan_header = np.fromfile(filename,
+                                  preprocessor.SCAN_HEADER_TYPES,
+                                  count=1,
+                                  offset=offset + i * scan_size)
+        if scan_header.size > 0:
+            entry[k] = _to_datetime64(scan_header["scan_date"][0])
+
+
+def _read_retrieval_entry(filename, entry):
+    """
+    Fill index entry from the orbit header of a, possibly gzip-compressed,
+    retrieval file.
+
+    If the orbit header doesn't contain valid granule dates, the dates of
+    the first and last scan headers are used instead.
+    """
+    size = retrieval.ORBIT_HEADER_TYPES.itemsize
+    opener = gzip.open if filename.suffix == ".gz" else open
+    with opener(filename, "rb") as file:
+        data = file.read(size)
+        if len(data) < size:
+            return
+        header = np.frombuffer(data, retrieval.ORBIT_HEADER_TYPES, count=1)
+        n_scans = int(header["number_of_scans"][0])
+        n_pixels = int(header["number_of_pixels"][0])
+        entry["granule"] = header["granule_number"][0]
+        entry["sensor"] = header["sensor"][0].decode(errors="ignore").strip()
+        entry["n_scans"] = n_scans
+        entry["start_time"] = _to_datetime64(header["granule_start_date"][0])
+        entry["end_time"] = _to_datetime64(header["granule_end_date"][0])
+
+        scan_size = retrieval.get_scan_types(n_pixels).itemsize
+        offset = size + retrieval.PROFILE_INFO_TYPES.itemsize
+        header_size = retrieval.SCAN_HEADER_TYPES.itemsize
+        for i, k in [(0, "start_time"), (n_scans - 1, "end_time")]:
+            if i < 0 or not np.isnat(entry[k]):
+                continue
+            file.seek(offset + i * scan_size)
+            data = file.read(header_size)
+            if len(data) < header_size:
+                continue
+            scan_header = np.frombuffer(data, retrieval.SCAN_HEADER_TYPES)
+            entry[k] = _to_datetime64(scan_header["scan_date"][0])
+
+
+READERS = {
+    "preprocessor": (PREPROCESSOR_PATTERNS, _read_preprocessor_entry),
+    "retrieval": (RETRIEVAL_PATTERNS, _read_retrieval_entry),
+}
+
+
+class GranuleIndex:
+    """
+    Persistent index of the preprocessor and retrieval files in a directory
+    tree.
+
+    The index is stored as a sidecar file in the root of the tree. Only
+    the headers of the files are read and, when the index is updated, only
+    files that have been added or whose modification time or size has
+    changed are read.
+
+    Attributes:
+        path: The root of the directory tree.
+        filename: The file in which the index is stored.
+        entries: Structured numpy array with one entry per file containing
+            the fields of ``INDEX_TYPES`` and the name of the file relative
+            to ``path``.
+    """
+    def __init__(self, path, filename=None, update=True):
+        """
+        Load index for given directory tree.
+
+        Args:
+            path: The root of the directory tree containing the files.
+            filename: The file to store the index in. Defaults to
+                ``INDEX_FILENAME`` in the given folder.
+            update: Whether to update the index when it is loaded.
+        """
+        self.path = Path(path)
+        if filename is None:
+            filename = self.path / INDEX_FILENAME
+        self.filename = Path(filename)
+
+        self.entries = np.zeros(0, dtype=get_index_types(1))
+        if self.filename.exists():
+            with np.load(self.filename) as index:
+                entries = index["entries"]
+                n_chars = entries.dtype["filename"].itemsize // 4
+                self.entries = entries.astype(get_index_types(n_chars))
+        if update:
+            self.update()
+
+    def _read_entry(self, name, file_type, stat):
+        """
+        Read index entry for a file.
+        """
+        filename = self.path / name
+        entry = np.zeros(1, dtype=get_index_types(len(name)))
+        entry["filename"] = name
+        entry["type"] = file_type
+        entry["mtime"] = stat.st_mtime
+        entry["size"] = stat.st_size
+        entry["start_time"] = np.datetime64("NaT")
+        entry["end_time"] = np.datetime64("NaT")
+        _, reader = READERS[file_type]
+        try:
+            reader(filename, entry[0])
+        except (OSError, EOFError) as error:
+            LOGGER.warning("Could not read file %s: %s", filename, error)
+        return entry[0]
+
+    def _find_files(self):
+        """
+        Find the files to index in the directory tree.
+
+        Returns:
+            Sorted list of tuples ``(name, file_type)`` containing the
+            names of the files to index relative to ``path`` and their
+            types.
+        """
+        files = []
+        root_path = str(self.path)
+        for root, _, names in os.walk(root_path):
+            root = os.path.relpath(root, root_path)
+            for name in names:
+                for file_type, (patterns, _) in READERS.items():
+                    if any([fnmatch(name, p) for p in patterns]):
+                        files.append((os.path.normpath(os.path.join(root, name)),
+                                      file_type))
+                        break
+        return sorted(files)
+
+    def update(self):
+        """
+        Update index entries of new or modified files and remove entries
+        of deleted files. The index is saved if it has changed.
+        """
+        files = self._find_files()
+        n_chars = max([len(name) for name, _ in files], default=1)
+        entries = np.zeros(len(files), dtype=get_index_types(n_chars))
+
+        indices = {n: i for i, n in enumerate(self.entries["filename"].tolist())}
+        mtimes = self.entries["mtime"].tolist()
+        sizes = self.entries["size"].tolist()
+        unchanged = []
+        changed = len(files) != self.entries.size
+        for i, (name, file_type) in enumerate(files):
+            stat = os.stat(self.path / name)
+            j = indices.get(name)
+            if (j is not None
+                    and mtimes[j] == stat.st_mtime
+                    and sizes[j] == stat.st_size):
+                unchanged.append((i, j))
+                continue
+            entries[i] = self._read_entry(name, file_type, stat)
+            changed = True
+
+        if unchanged:
+            i, j = np.array(unchanged).T
+            changed |= np.any(i != j)
+            entries[i] = self.entries[j].astype(entries.dtype)
+        self.entries = entries
+        if changed:
+            self.save()
+
+    def save(self):
+        """
+        Atomically write index to its file.
+        """
+        try:
+            with atomic_write(self.filename) as file:
+                np.savez(file, entries=self.entries)
+        except OSError as error:
+            LOGGER.warning("Could not write index file %s: %s",
+                           self.filename, error)
+
+    def select(self,
+               start=None,
+               end=None,
+               granules=None,
+               sensor=None,
+               file_type=None):
+        """
+        Select index entries matching given criteria.
+
+        Args:
+            start: If given, only files with data after this time are
+                selected.
+            end: If given, only files with data before this time are
+                selected.
+            granules: If given, only files with these granule numbers
+                are selected.
+            sensor: If given, only files of this sensor are selected.
+            file_type: If given, only files of this type, i.e.
+                ``"preprocessor"`` or ``"retrieval"``, are selected.
+
+        Returns:
+            Structured array containing the selected index entries sorted
+            by start time.
+        """
+        e = self.entries
+        mask = np.ones(e.size, dtype=bool)
+        if start is not None:
+            mask *= e["end_time"] >= np.datetime64(start, "s")
+        if end is not None:
+            mask *= e["start_time"] <= np.datetime64(end, "s")
+        if granules is not None:
+            mask *= np.isin(e["granule"], granules)
+        if sensor is not None:
+            mask *= e["sensor"] == sensor
+        if file_type is not None:
+            mask *= e["type"] == file_type
+        e = e[mask]
+        return e[np.argsort(e["start_time"], kind="stable")]
+
+    def find_files(self, *args, **kwargs):
+        """
+        Find files matching given criteria. Takes the same arguments as
+        ``select``.
+
+        Returns:
+            List of the paths of the selected files sorted by start time.
+        """
+        return [self.path / f for f in self.select(*args, **kwargs)["filename"]]
+
+    def __len__(self):
+        return self.entries.size
+
+    def __repr__(self):
+        return f"GranuleIndex(path={self.path}, n_files={len(self)})"
@@ -0,0 +1,271 @@
+"""
+====================
+regn.data.csu.level3
+====================
+
+This module provides the Level3Grid class, which accumulates retrieved
+precipitation from GPROF retrieval files, or from the results of
+``regn.gprof.InputData.run_retrieval``, on a regular latitude-longitude
+grid. Only the sums and counts of the retrieved quantities in each grid
+cell are kept in memory, so that the memory use doesn't depend on the
+number of orbits that are accumulated. Partial grids can be saved,
+loaded and merged, which allows the accumulation to be split across
+processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import logging
+
+import numpy as np
+import xarray
+
+from regn.data.csu.retrieval import RetrievalFile
+from regn.utils import atomic_write
+
+LOGGER = logging.getLogger(__name__)
+
+VARIABLES = ["surface_precip", "precip_1st_tertial", "precip_3rd_tertial"]
+
+# Names of the accumulated variables in the results of
+# InputData.run_retrieval.
+RESULT_VARIABLES = {"surface_precip": "precip_mean",
+                    "precip_1st_tertial": "precip_1st_tertial",
+                    "precip_3rd_tertial": "precip_3rd_tertial"}
+
+
+class Level3Grid:
+    """
+    Accumulator for gridded precipitation statistics.
+
+    Attributes:
+        resolution: The size of the grid cells in degrees.
+        latitudes: The latitudes of the cell centers.
+        longitudes: The longitudes of the cell centers.
+        sums: Dictionary mapping the names of the accumulated variables
+            to arrays of shape ``(n_lats, n_lons)`` containing the sums of
+            the valid values in each cell.
+        counts: Dictionary mapping the names of the accumulated variables
+            to arrays of shape ``(n_lats, n_lons)`` containing the numbers
+            of valid values in each cell.
+    """
+    def __init__(self, resolution=1.0, variables=None):
+        """
+        Create empty grid.
+
+        Args:
+            resolution: The size of the grid cells in degrees. Must divide
+                180.
+            variables: The names of the variables to accumulate. Defaults
+                to ``VARIABLES``.
+        """
+        n_lats = int(round(180.0 / resolution))
+        if not np.isclose(n_lats * resolution, 180.0):
+            raise ValueError(
+                f"The resolution {resolution} does not divide 180 degrees."
+            )
+        self.resolution = resolution
+        self.n_lats = n_lats
+        self.n_lons = 2 * n_lats
+        self.latitudes = -90.0 + resolution * (np.arange(self.n_lats) + 0.5)
+        self.longitudes = -180.0 + resolution * (np.arange(self.n_lons) + 0.5)
+
+        if variables is None:
+            variables = VARIABLES
+        shape = (self.n_lats, self.n_lons)
+        self.sums = {k: np.zeros(shape, dtype=np.float64) for k in variables}
+        self.counts = {k: np.zeros(shape, dtype=np.int64) for k in variables}
+
+    @property
+    def variables(self):
+        return list(self.sums.keys())
+
+    def _get_cell_indices(self, latitude, longitude):
+        """
+        Flat indices of the grid cells containing given coordinates.
+
+        Returns:
+            Tuple ``(indices, valid)`` containing the flat cell indices and
+            a mask of the coordinates that are valid.
+        """
+        latitude = np.asarray(latitude, dtype=np.float64).ravel()
+        longitude = np.asarray(longitude, dtype=np.float64).ravel()
+        valid = ((latitude >= -90.0) * (latitude <= 90.0)
+                 * (longitude >= -180.0) * (longitude <= 360.0))
+
+        i = np.floor((latitude + 90.0) / self.resolution)
+        i = np.clip(np.nan_to_num(i), 0, self.n_lats - 1).astype(np.int64)
+        j = np.floor((longitude + 180.0) / self.resolution)
+        j = np.nan_to_num(j).astype(np.int64) % self.n_lons
+        return i * self.n_lons + j, valid
+
+    def add(self, latitude, longitude, data):
+        """
+        Add observations to the grid.
+
+        Values that are negative or not finite are treated as missing.
+
+        Args:
+            latitude: Array containing the latitudes of the observations.
+            longitude: Array of the same shape as ``latitude`` containing
+                the longitudes of the observations.
+            data: Dictionary mapping the names of the accumulated variables
+                to arrays of the same shape as ``latitude``.
+        """
+        indices, valid = self._get_cell_indices(latitude, longitude)
+        size = self.n_lats * self.n_lons
+        for k in self.variables:
+            x = np.asarray(data[k]).ravel()
+            mask = valid * np.isfinite(x) * (x >= 0.0)
+            cells = indices[mask]
+            self.sums[k] += np.bincount(cells,
+                                        weights=x[mask],
+                                        minlength=size).reshape(self.sums[k].shape)
+            self.counts[k] += np.bincount(cells,
+                                          minlength=size).reshape(self.counts[k].shape)
+
+    def add_retrieval_file(self, retrieval_file):
+        """
+        Add the retrieval results in a GPROF retrieval file to the grid.
+
+        Args:
+            retrieval_file: A ``RetrievalFile`` object or the path of the
+                file to add.
+        """
+        if not isinstance(retrieval_file, RetrievalFile):
+            retrieval_file = RetrievalFile(retrieval_file)
+        pixels = retrieval_file.scan_data["data"]
+        self.add(pixels["latitude"],
+                 pixels["longitude"],
+                 {k: pixels[k] for k in self.variables})
+
+    def add_results(self, input_data, results):
+        """
+        Add results of ``regn.gprof.InputData.run_retrieval`` to the grid.
+
+        Args:
+            input_data: The ``InputData`` object on which the retrieval
+                was run.
+            results: The ``xarray.Dataset`` returned by ``run_retrieval``.
+        """
+        self.add(input_data.data["latitude"].data,
+                 input_data.data["longitude"].data,
+                 {k: results[RESULT_VARIABLES.get(k, k)].data
+                  for k in self.variables})
+
+    def merge(self, other):
+        """
+        Add the data accumulated in another grid to this grid.
+
+        Args:
+            other: The ``Level3Grid`` to merge into this grid. Must have
+                the same resolution and variables.
+
+        Returns:
+            This grid.
+        """
+        if (not np.isclose(other.resolution, self.resolution)
+                or set(other.variables) != set(self.variables)):
+            raise ValueError(
+                "Only grids with the same resolution and variables can be "
+                "merged."
+            )
+        for k in self.variables:
+            self.sums[k] += other.sums[k]
+            self.counts[k] += other.counts[k]
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def save(self, filename):
+        """
+        Atomically write the accumulated sums and counts to a file, from
+        which the grid can be restored using ``load``.
+
+        Args:
+            filename: The path of the .npz file to write.
+        """
+        arrays = {"resolution": self.resolution}
+        for k in self.variables:
+            arrays[f"sum_{k}"] = self.sums[k]
+            arrays[f"count_{k}"] = self.counts[k]
+        with atomic_write(filename) as file:
+            np.savez(file, **arrays)
+
+    @staticmethod
+    def load(filename):
+        """
+        Load grid written with ``save``.
+
+        Args:
+            filename: The path of the .npz file to load.
+
+        Returns:
+            The loaded ``Level3Grid``.
+        """
+        with np.load(filename) as data:
+            variables = [k[4:] for k in data.files if k.startswith("sum_")]
+            grid = Level3Grid(float(data["resolution"]), variables=variables)
+            for k in variables:
+                grid.sums[k][:] = data[f"sum_{k}"]
+                grid.counts[k][:] = data[f"count_{k}"]
+        return grid
+
+    def to_xarray_dataset(self):
+        """
+        Return the mean and count of each accumulated variable as xarray
+        dataset. The means of cells without valid observations are NAN.
+        """
+        dims = ("latitude", "longitude")
+        data = {}
+        for k in self.variables:
+            counts = self.counts[k]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                data[k] = (dims, (self.sums[k] / counts).astype(np.float32))
+            data[f"{k}_count"] = (dims, counts)
+        return xarray.Dataset(data,
+                              coords={"latitude": self.latitudes,
+                                      "longitude": self.longitudes})
+
+
+def _grid_files(files, resolution, variables):
+    """
+    Accumulate retrieval files on a new grid.
+    """
+    grid = Level3Grid(resolution, variables=variables)
+    for f in files:
+        try:
+            grid.add_retrieval_file(f)
+        except (OSError, EOFError, ValueError) as error:
+            LOGGER.warning("Could not read file %s: %s", f, error)
+    return grid
+
+
+def grid_retrieval_files(files, resolution=1.0, variables=None, n_processes=1):
+    """
+    Accumulate retrieval files on a Level 3 grid.
+
+    The files are split into one chunk per process, each process
+    accumulates its files on a separate grid and the partial grids are
+    merged.
+
+    Args:
+        files: List of the retrieval files to accumulate.
+        resolution: The size of the grid cells in degrees.
+        variables: The variables to accumulate. Defaults to ``VARIABLES``.
+        n_processes: The number of processes to use.
+
+    Returns:
+        The ``Level3Grid`` containing the data from all files.
+    """
+    files = list(files)
+    if n_processes <= 1:
+        return _grid_files(files, resolution, variables)
+
+    chunks = [files[i::n_processes] for i in range(n_processes)]
+    grid = Level3Grid(resolution, variables=variables)
+    with ProcessPoolExecutor(max_workers=n_processes) as executor:
+        tasks = [executor.submit(_grid_files, c, resolution, variables)
+                 for c in chunks if c]
+        for t in tasks:
+            grid.merge(t.result())
+    return grid
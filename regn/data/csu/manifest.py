@@ -0,0 +1,171 @@
+"""
+======================
+regn.data.csu.manifest
+======================
+
+This module provides the Manifest class, which keeps track of the input
+files whose data has been written to an output file, so that interrupted
+extraction runs can be resumed.
+"""
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+from tempfile import mkstemp
+
+from netCDF4 import Dataset
+
+from regn.utils import atomic_write
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _get_key(filename):
+    """
+    The key used to identify an input file in a manifest.
+    """
+    return str(Path(filename).resolve())
+
+
+class Manifest:
+    """
+    Record of the input files whose data has been written to an output
+    file.
+
+    The manifest is stored as a JSON sidecar next to the output file. Each
+    commit records the input files together with the number of samples
+    that have been written to the output file at that point and replaces
+    the previous manifest atomically. Data beyond the committed number of
+    samples stems from an interrupted write and must be discarded when an
+    extraction is resumed.
+
+    Attributes:
+        filename: The path of the manifest file.
+        files: Set of the input files whose data has been committed.
+        n_samples: The number of committed samples in the output file.
+    """
+    def __init__(self, output_file):
+        """
+        Load manifest for given output file.
+
+        Args:
+            output_file: The output file to which the manifest belongs.
+        """
+        output_file = Path(output_file)
+        self.filename = output_file.parent / (output_file.name + ".manifest.json")
+        self.files = set()
+        self.n_samples = 0
+        if self.filename.exists():
+            with open(self.filename) as file:
+                manifest = json.load(file)
+            self.files = set(manifest["files"])
+            self.n_samples = manifest["n_samples"]
+
+    def __contains__(self, filename):
+        return _get_key(filename) in self.files
+
+    def __len__(self):
+        return len(self.files)
+
+    def commit(self, files, n_samples):
+        """
+        Add input files to manifest and write it to disk.
+
+        Args:
+            files: Iterable of input files whose data has been written to
+                 the output file.
+            n_samples: The number of samples in the output file after the
+                 data of the input files has been written.
+        """
+        self.files.update([_get_key(f) for f in files])
+        self.n_samples = int(n_samples)
+        with atomic_write(self.filename, mode="w", fsync=True) as file:
+            json.dump({"n_samples": self.n_samples,
+                       "files": sorted(self.files)},
+                      file)
+
+    def clear(self):
+        """
+        Remove all entries from the manifest and delete its file.
+        """
+        self.files = set()
+        self.n_samples = 0
+        if self.filename.exists():
+            self.filename.unlink()
+
+    def __repr__(self):
+        return f"Manifest(filename={self.filename}, n_files={len(self)})"
+
+
+def truncate_samples(filename, n_samples, chunk_size=8192):
+    """
+    Truncate the samples dimension of a NetCDF4 file.
+
+    NetCDF4 doesn't support shrinking a dimension, so the data is copied to
+    a uniquely named temporary file, which then replaces the original one.
+    The temporary file is removed if the copy fails.
+
+    Args:
+        filename: The NetCDF4 file to truncate.
+        n_samples: The number of samples to keep.
+        chunk_size: The number of samples to copy at once.
+    """
+    filename = Path(filename)
+    handle, tmp = mkstemp(dir=filename.parent,
+                          prefix=filename.name + ".",
+                          suffix=".tmp")
+    os.close(handle)
+    LOGGER.info("Truncating %s to %s samples.", filename, n_samples)
+    try:
+        _copy_samples(filename, tmp, n_samples, chunk_size)
+        shutil.copymode(filename, tmp)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    os.replace(tmp, filename)
+
+
+def _copy_samples(filename, tmp, n_samples, chunk_size):
+    """
+    Copy the first ``n_samples`` samples of a NetCDF4 file to a new file.
+    """
+    with Dataset(filename, "r") as source, Dataset(tmp, "w") as target:
+        source.set_auto_maskandscale(False)
+        target.setncatts({k: source.getncattr(k) for k in source.ncattrs()})
+        for name, dim in source.dimensions.items():
+            if name == "samples":
+                size = None if dim.isunlimited() else n_samples
+            else:
+                size = None if dim.isunlimited() else dim.size
+            target.createDimension(name, size)
+
+        for name, v in source.variables.items():
+            filters = v.filters() or {}
+            chunking = v.chunking()
+            if chunking != "contiguous":
+                chunking = [min(c, max(len(target.dimensions[d]), 1))
+                            if not target.dimensions[d].isunlimited() else c
+                            for c, d in zip(chunking, v.dimensions)]
+            fill_value = v.getncattr("_FillValue") if "_FillValue" in v.ncattrs() else None
+            target_v = target.createVariable(
+                name,
+                v.datatype,
+                v.dimensions,
+                zlib=filters.get("zlib", False),
+                complevel=filters.get("complevel", 4),
+                shuffle=filters.get("shuffle", False),
+                chunksizes=None if chunking == "contiguous" else chunking,
+                contiguous=chunking == "contiguous",
+                fill_value=fill_value
+            )
+            target_v.set_auto_maskandscale(False)
+            target_v.setncatts({k: v.getncattr(k) for k in v.ncattrs()
+                                if k != "_FillValue"})
+
+            if "samples" not in v.dimensions or v.dimensions[0] != "samples":
+                target_v[:] = v[:]
+                continue
+            for i in range(0, n_samples, chunk_size):
+                i_end = min(i + chunk_size, n_samples)
+                target_v[i:i_end] = v[i:i_end]
@@ -6,12 +6,13 @@ regn.data.csu.preprocessor
 This module contains the PreprocessorFile class which provides an interface
 to read CSU preprocessor files.
 """
+from datetime import datetime
 import logging
 
 import numpy as np
 import xarray
 
-from regn.data.csu import retrieval
+from regn.data.csu import retrieval, structs
 from pathlib import Path
 
 LOGGER = logging.getLogger(__name__)
@@ -25,6 +26,8 @@ N_TEMPERATURES = 12
 N_LAYERS = 28
 N_PROFILES = 80
 N_CHANNELS = 15
+N_SURFACE_TYPES = 19
+N_AIRMASS_TYPES = 4
 
 DATE_TYPE = np.dtype(
     [("year", "i2"),
@@ -76,9 +79,65 @@ DATA_RECORD_TYPES = np.dtype(
     )
 
 
-################################################################################
-# Functions to write retrieval output
-################################################################################
+def get_scan_types(n_pixels):
+    """
+    The data type of a scan in a preprocessor file, i.e. a scan header
+    followed by the records of its pixels.
+
+    Args:
+        n_pixels: The number of pixels per scan.
+
+    Returns:
+        Numpy structured data type with fields ``scan_header`` and
+        ``data``.
+    """
+    return structs.get_scan_types(SCAN_HEADER_TYPES,
+                                  DATA_RECORD_TYPES,
+                                  n_pixels)
+
+
+###############################################################################
+# Retrieval input
+###############################################################################
+
+def get_input_features(bts, t2m, tcwv, surface_type, airmass_type):
+    """
+    Assemble the input features of the single-pixel retrieval.
+
+    The features consist of the brightness temperatures, the two-meter
+    temperature, the total column water vapor and the one-hot encoded
+    surface and airmass types.
+
+    Args:
+        bts: Array of shape ``(..., N_CHANNELS)`` containing the brightness
+            temperatures.
+        t2m: Array containing the two-meter temperature.
+        tcwv: Array containing the total column water vapor.
+        surface_type: Array containing the surface types.
+        airmass_type: Array containing the airmass types.
+
+    Returns:
+        Array of shape ``(n, N_CHANNELS + 2 + N_SURFACE_TYPES +
+        N_AIRMASS_TYPES)`` containing the input features of the ``n``
+        pixels.
+    """
+    bts = np.asarray(bts).reshape(-1, N_CHANNELS)
+    n = bts.shape[0]
+    x = np.zeros((n, N_CHANNELS + 2 + N_SURFACE_TYPES + N_AIRMASS_TYPES),
+                 dtype=bts.dtype)
+    x[:, :N_CHANNELS] = bts
+    x[:, N_CHANNELS] = np.asarray(t2m).ravel()
+    x[:, N_CHANNELS + 1] = np.asarray(tcwv).ravel()
+
+    offset = N_CHANNELS + 2
+    st = np.asarray(surface_type).ravel().astype(int)
+    x[np.arange(n), offset + st] = 1.0
+
+    offset += N_SURFACE_TYPES
+    am = np.maximum(np.asarray(airmass_type).ravel().astype(int), 0)
+    x[np.arange(n), offset + am] = 1.0
+    return x
+
 
 ###############################################################################
 # Preprocessor file class
@@ -93,22 +152,34 @@ class PreprocessorFile:
         orbit_header: Numpy structured array containing the orbit header.
         n_scans: The number of scans in the file.
         n_pixels: The number of pixels in the file.
+        scan_data: Numpy structured array view of the scans in the file.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, mmap=False):
         """
         Read preprocessor file.
 
         Args:
             filename: Path to the file to read.
+            mmap: If ``True`` the file is memory-mapped instead of being
+                read into memory. Only the parts of the file that are
+                required to decode the requested variables are then read
+                from disk.
         """
         self.filename = filename
-        with open(self.filename, "rb") as file:
-            self.data = file.read()
+        if mmap:
+            self.data = np.memmap(self.filename, dtype=np.uint8, mode="r")
+        else:
+            with open(self.filename, "rb") as file:
+                self.data = file.read()
         self.orbit_header = np.frombuffer(self.data,
                                           ORBIT_HEADER_TYPES,
                                           count=1)
         self.n_scans = self.orbit_header["number_of_scans"][0]
         self.n_pixels = self.orbit_header["number_of_pixels"][0]
+        self.scan_data = np.frombuffer(self.data,
+                                       get_scan_types(self.n_pixels),
+                                       count=self.n_scans,
+                                       offset=ORBIT_HEADER_TYPES.itemsize)
 
     @property
     def satellite(self):
@@ -174,52 +245,101 @@ class PreprocessorFile:
                              count=1,
                              offset=offset)
 
-    def to_xarray_dataset(self):
+    def get_input_blocks(self, scans_per_block=128):
+        """
+        Iterate over the retrieval input in blocks of scans.
+
+        Only the data of one block is decoded at a time, so the memory
+        required is bounded by the block size and decoding can be
+        interleaved with the processing of the previous block.
+
+        Args:
+            scans_per_block: The number of scans per block. The last block
+                contains the remaining scans.
+
+        Returns:
+            Generator yielding arrays of shape
+            ``(n_scans_block * n_pixels, 40)`` containing the input features
+            of the pixels of the ``i``th block of scans, i.e. scans
+            ``i * scans_per_block`` to ``(i + 1) * scans_per_block``.
+        """
+        for i in range(0, self.n_scans, scans_per_block):
+            pixels = self.scan_data["data"][i:i + scans_per_block]
+            yield get_input_features(pixels["brightness_temperatures"],
+                                     pixels["two_meter_temperature"],
+                                     pixels["total_column_water_vapor"],
+                                     pixels["surface_type"],
+                                     pixels["airmass_type"])
+
+    def get_variable(self, name):
+        """
+        Decode a single variable of the pixel data.
+
+        Args:
+            name: The name of the variable, i.e. a field of
+                ``DATA_RECORD_TYPES``.
+
+        Returns:
+            Numpy array of shape ``(n_scans, n_pixels, ...)`` containing
+            the data of the variable.
+        """
+        return structs.get_variable(self.scan_data, name, "preprocessor")
+
+    def to_xarray_dataset(self, variables=None):
         """
         Return data in file as xarray dataset.
+
+        Args:
+            variables: If given, only these variables are decoded and
+                included in the dataset.
         """
-        data = {k: np.zeros((self.n_scans, self.n_pixels), dtype=d[0])
-                for k, d in DATA_RECORD_TYPES.fields.items()}
-        for i, s in enumerate(self.scans):
-            for k, d in data.items():
-                d[i] = s[k]
+        if variables is None:
+            variables = DATA_RECORD_TYPES.fields
+        data = {k: self.get_variable(k) for k in variables}
 
         dims = ["scans", "pixels", "channels"]
         data = {k: (dims[:len(d.shape)], d) for k, d in data.items()}
         return xarray.Dataset(data)
 
-    def write_retrieval_results(self, path, results):
+    def write_retrieval_results(self,
+                                path,
+                                results,
+                                compress=False,
+                                n_threads=None):
         """
         Write retrieval result to GPROF binary format.
 
+        The orbit header and scans of the output are assembled from this
+        file and the results and written using ``RetrievalFile.write``.
+
         Args:
             path: The folder to which to write the result. The filename
-                  itself follows the GPORF naming scheme.
+                  itself follows the GPORF naming scheme. Alternatively,
+                  an open binary file object to which to write the
+                  result.
             results: Dictionary containing the retrieval results.
+            compress: Whether to compress the output using gzip.
+            n_threads: The number of threads to use for the compression.
 
         Returns:
 
-            Path object to the created binary file.
+            Path object to the created binary file or the file object
+            to which the results were written.
         """
-        path = Path(path)
-        filename = path / self._get_retrieval_filename()
-
-        with open(filename, "wb") as file:
-            self._write_retrieval_orbit_header(file)
-            self._write_retrieval_profile_info(file)
-            for i in range(self.n_scans):
-                self._write_retrieval_scan_header(file, i)
-
-                precip_mean = results["precip_mean"][i]
-                precip_1st_tertial = results["precip_1st_tertial"][i]
-                precip_3rd_tertial = results["precip_3rd_tertial"][i]
-                pop = results["precip_pop"][i]
-
-                self._write_retrieval_scan(file,
-                                           precip_mean,
-                                           precip_1st_tertial,
-                                           precip_3rd_tertial,
-                                           pop)
+        orbit_header, scan_data = self._get_retrieval_data(results)
+
+        if hasattr(path, "write"):
+            filename = path
+        else:
+            filename = Path(path) / self._get_retrieval_filename()
+            if compress:
+                filename = filename.parent / (filename.name + ".gz")
+
+        retrieval.RetrievalFile.write(filename,
+                                      orbit_header,
+                                      scan_data,
+                                      compress=compress,
+                                      n_threads=n_threads)
         return filename
 
     def _get_retrieval_filename(self):
@@ -245,78 +365,51 @@ class PreprocessorFile:
 
         return name
 
-    def _write_retrieval_orbit_header(self, file):
+    def _get_retrieval_data(self, results):
         """
-        Writes the retrieval orbit header to an opened binary file..
+        Assemble the orbit header and scans of the retrieval output file.
 
         Args:
-            file: Handle to the binary file to write the data to.
+            results: Dictionary containing the retrieval results.
+
+        Returns:
+            Tuple ``(orbit_header, scan_data)`` containing the orbit header
+            as structured array of size 1 and the scans as structured
+            array of size ``n_scans``.
         """
-        new_header = np.recarray(1, dtype=retrieval.ORBIT_HEADER_TYPES)
+        orbit_header = np.zeros(1, dtype=retrieval.ORBIT_HEADER_TYPES)
         for k in retrieval.ORBIT_HEADER_TYPES.fields:
             if not k in self.orbit_header.dtype.fields:
                 continue
-            new_header[k] = self.orbit_header[k]
-
-        new_header["algorithm"] = "QPROF"
-        new_header.tofile(file)
-
-    def _write_retrieval_profile_info(self, file):
-        """
-        Write the retrieval profile info to an opened binary file.
-
-        Args:
-            file: Handle to the binary file to write the data to.
-        """
-        profile_info = np.recarray(1, dtype=retrieval.PROFILE_INFO_TYPES)
-        profile_info.tofile(file)
-
-    def _write_retrieval_scan_header(self, file, i):
-        """
-        Write the scan header corresponding to the ith header in the file
-        to a given file stream.
-
-        Args:
-            file: Handle to the binary file to write the data to.
-            i: The index of the scan for which to write the header.
-        """
-        header = self.get_scan_header(i)
-        scan_header = np.recarray(1, dtype=retrieval.SCAN_HEADER_TYPES)
-        scan_header["scan_latitude"] = header["scan_latitude"]
-        scan_header["scan_longitude"] = header["scan_longitude"]
-        scan_header["scan_altitude"] = header["scan_altitude"]
-        scan_header["scan_date"]["year"] = header["scan_date"]["year"]
-        scan_header["scan_date"]["month"] = header["scan_date"]["month"]
-        scan_header["scan_date"]["day"] = header["scan_date"]["day"]
-        scan_header["scan_date"]["hour"] = header["scan_date"]["hour"]
-        scan_header["scan_date"]["minute"] = header["scan_date"]["minute"]
-        scan_header["scan_date"]["second"] = header["scan_date"]["second"]
-        scan_header["scan_date"]["millisecond"] = 0.0
-        scan_header.tofile(file)
-
-    def _write_retrieval_scan(self,
-                              file,
-                              precip_mean,
-                              precip_1st_tertial,
-                              precip_3rd_tertial,
-                              precip_pop):
-        """
-        Write retrieval data from a full scan to a binary stream.
-
-
-        Args:
-            file: Handle to the binary file to write the data to.
-            precip_mean: 1D array containing the mean retrieved precipitation for
-                 each pixel.
-            precip_1st_tertial: 1D array containing the 1st tertial retrieved from the data.
-            precip_3rd_tertial: 1D array containing the 3rd tertial retrieved from the data
-            precip_pop: 1D array containing the probability of precipitation in the scan.
-        """
-        n_pixels = precip_mean.shape[-1]
-        pixels = np.recarray(n_pixels, dtype=retrieval.DATA_RECORD_TYPES)
-
-        pixels["surface_precip"] = precip_mean
-        pixels["precip_1st_tertial"] = precip_1st_tertial
-        pixels["precip_3rd_tertial"] = precip_3rd_tertial
-        pixels["pop_index"] = precip_pop.astype(np.dtype("i1"))
-        pixels.tofile(file)
+            orbit_header[k] = self.orbit_header[k]
+        orbit_header["algorithm"] = "QPROF"
+
+        scans = np.zeros(self.n_scans,
+                         dtype=retrieval.get_scan_types(self.n_pixels))
+        source = self.scan_data["scan_header"]
+        scan_header = scans["scan_header"]
+        for k in ["scan_latitude", "scan_longitude", "scan_altitude"]:
+            scan_header[k] = source[k]
+        for k in DATE_TYPE.fields:
+            scan_header["scan_date"][k] = source["scan_date"][k]
+
+        # The granule covers the time range of the scans.
+        for k in DATE_TYPE.fields:
+            orbit_header["granule_start_date"][k] = source["scan_date"][k][0]
+            orbit_header["granule_end_date"][k] = source["scan_date"][k][-1]
+        now = datetime.utcnow()
+        orbit_header["creation_date"] = (now.year,
+                                         now.month,
+                                         now.day,
+                                         now.hour,
+                                         now.minute,
+                                         now.second)
+
+        pixels = scans["data"]
+        pixels["latitude"] = self.scan_data["data"]["latitude"]
+        pixels["longitude"] = self.scan_data["data"]["longitude"]
+        pixels["surface_precip"] = results["precip_mean"]
+        pixels["precip_1st_tertial"] = results["precip_1st_tertial"]
+        pixels["precip_3rd_tertial"] = results["precip_3rd_tertial"]
+        pixels["pop_index"] = np.asarray(results["precip_pop"]).astype(np.dtype("i1"))
+        return orbit_header, scans
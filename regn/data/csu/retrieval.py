@@ -4,12 +4,21 @@ regn.data.csu.retrieval
 =======================
 
 This module contains functions to read and convert GPROF retrieval .bin files for GPROF v. 7. """
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import logging
 import gzip
+import os
+from pathlib import Path
+import shutil
 
 import numpy as np
 import xarray
 
+from regn.data.csu import structs
+from regn.data.csu.cache import MAX_CACHE_SIZE, evict_lru
+from regn.utils import atomic_write
+
 LOGGER = logging.getLogger(__name__)
 
 N_SPECIES = 5
@@ -103,21 +112,182 @@ DATA_RECORD_TYPES = np.dtype(
      ]
 )
 
+
+def get_scan_types(n_pixels):
+    """
+    The data type of a scan in a retrieval file, i.e. a scan header
+    followed by the records of its pixels.
+
+    Args:
+        n_pixels: The number of pixels per scan.
+
+    Returns:
+        Numpy structured data type with fields ``scan_header`` and
+        ``data``.
+    """
+    return structs.get_scan_types(SCAN_HEADER_TYPES,
+                                  DATA_RECORD_TYPES,
+                                  n_pixels)
+
+
+def get_file_types(n_scans, n_pixels):
+    """
+    The data type of the complete content of a retrieval file.
+
+    Args:
+        n_scans: The number of scans in the file.
+        n_pixels: The number of pixels per scan.
+
+    Returns:
+        Numpy structured data type with fields ``orbit_header``,
+        ``profile_info`` and ``scans``.
+    """
+    return np.dtype(
+        [("orbit_header", ORBIT_HEADER_TYPES),
+         ("profile_info", PROFILE_INFO_TYPES),
+         ("scans", get_scan_types(n_pixels), (n_scans,))]
+    )
+
+
+# Size of the blocks that are compressed in parallel by write_gzip.
+BLOCK_SIZE = 2 ** 22
+
+
+def write_gzip(file, data, compresslevel=6, n_threads=None, block_size=BLOCK_SIZE):
+    """
+    Write gzip-compressed data using multiple threads.
+
+    The data is split into blocks, which are compressed in parallel into
+    separate gzip members. The members are written in order, so the output
+    is a valid, multi-member gzip file that can be read with any gzip
+    decompressor.
+
+    Args:
+        file: Path of the output file or an open binary file object.
+        data: Bytes-like object containing the data to compress.
+        compresslevel: The compression level.
+        n_threads: The number of threads to use. Defaults to the number
+            of CPUs.
+        block_size: The size of the blocks in bytes.
+    """
+    if not hasattr(file, "write"):
+        with open(file, "wb") as output:
+            return write_gzip(output, data, compresslevel, n_threads, block_size)
+
+    data = memoryview(data).cast("B")
+    blocks = [data[i:i + block_size] for i in range(0, len(data), block_size)]
+
+    def compress(block):
+        return gzip.compress(block, compresslevel=compresslevel, mtime=0)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        for member in pool.map(compress, blocks):
+            file.write(member)
+
+
+# Glob pattern matching the names returned by get_cache_filename.
+CACHE_PATTERN = "[0-9a-f]" * 16 + "_*"
+
+
+def get_cache_filename(filename, cache):
+    """
+    The name of the decompressed copy of a retrieval file in a cache
+    directory.
+
+    The name is derived from the path, size and modification time of the
+    file, so that modified files are decompressed again.
+
+    Args:
+        filename: The compressed retrieval file.
+        cache: The cache directory.
+
+    Returns:
+        Path object pointing to the decompressed file in the cache.
+    """
+    filename = Path(filename)
+    stat = filename.stat()
+    key = f"{filename.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    key = hashlib.sha1(key.encode()).hexdigest()[:16]
+    name = filename.name
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return Path(cache) / f"{key}_{name}"
+
+
+def decompress(filename, output_file, chunk_size=2 ** 20):
+    """
+    Decompress gzip-compressed file.
+
+    The data is decompressed into a temporary file in the output folder,
+    which then replaces the output file, so that concurrent processes
+    never see a partially written file.
+
+    Args:
+        filename: The compressed file.
+        output_file: The file to write the decompressed data to.
+        chunk_size: The number of bytes to decompress at once.
+    """
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(output_file) as target:
+        with gzip.open(filename, "rb") as source:
+            shutil.copyfileobj(source, target, chunk_size)
+
+
 class RetrievalFile:
     """
     Interface for GPROF retrieval files.
 
-
+    Compressed files are by default decompressed into memory. If a cache
+    directory is given, they are instead decompressed once into the cache
+    and the decompressed file is memory-mapped, so that accessing a scan
+    reads only the corresponding part of the file. When the size of the
+    cache exceeds its limit, the least recently used files are removed.
+    Uncompressed files are always memory-mapped.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, cache=None, cache_size=MAX_CACHE_SIZE):
+        """
+        Open retrieval file.
+
+        Args:
+            filename: Path of the, possibly gzip-compressed, retrieval file.
+            cache: Optional directory in which decompressed copies of
+                compressed files are stored.
+            cache_size: The maximum total size of the decompressed files
+                in the cache in bytes.
+        """
         self.filename = filename
-        with gzip.open(filename, "rb") as file:
-            self.data = file.read()
+        if str(filename).endswith(".gz"):
+            if cache is None:
+                with gzip.open(filename, "rb") as file:
+                    self.data = file.read()
+            else:
+                cache_file = get_cache_filename(filename, cache)
+                try:
+                    os.utime(cache_file)
+                    self.data = np.memmap(cache_file, dtype=np.uint8, mode="r")
+                except FileNotFoundError:
+                    LOGGER.info("Decompressing %s to %s.", filename, cache_file)
+                    decompress(filename, cache_file)
+                    self.data = np.memmap(cache_file, dtype=np.uint8, mode="r")
+                    evict_lru(cache, cache_size, CACHE_PATTERN)
+        else:
+            self.data = np.memmap(filename, dtype=np.uint8, mode="r")
         self.orbit_header = np.frombuffer(self.data,
                                           ORBIT_HEADER_TYPES,
                                           count=1)
+        self.profile_info = np.frombuffer(self.data,
+                                          PROFILE_INFO_TYPES,
+                                          count=1,
+                                          offset=ORBIT_HEADER_TYPES.itemsize)
         self.n_scans = self.orbit_header["number_of_scans"][0]
         self.n_pixels = self.orbit_header["number_of_pixels"][0]
+        self.scan_data = np.frombuffer(
+            self.data,
+            get_scan_types(self.n_pixels),
+            count=self.n_scans,
+            offset=ORBIT_HEADER_TYPES.itemsize + PROFILE_INFO_TYPES.itemsize
+        )
 
         np.random.seed(self.orbit_header["granule_number"])
         self.scan_indices = np.random.permutation(np.arange(self.n_scans))
@@ -125,31 +295,51 @@ class RetrievalFile:
 
 
     @staticmethod
-    def write(path, retrieval_results):
-        path = Path(path)
-        filename = path / _get_filename(results)
-
-
-        with open(filename, "rb"):
-
-            orbit_header = retrieval_results["header"]
-            orbit_header["satellite"] = retrieval_results["satellite"]
-            orbit_header["sensor"] = retrieval_results["sensor"]
-            orbit_header["preprocessor"] = retrieval_results["preprocessor"]
-            orbit_header["algorithm"] = "QPROF"
-            orbit_header["profile_database_file"] = retrieval_results["profile_database"]
-            orbit_header["radiometer_file"] = retrieval_results["radiometer_file"]
-            orbit_header["creation_date"] = retrieval_results["creation_date"]
-            orbit_header["granule_start_date"] = retrieval_results["start_date"]
-            orbit_header["granule_end_date"] = retrieval_results["end_date"]
-
-
-
-
-            orbit_header["sensor"]
-
+    def write(filename,
+              orbit_header,
+              scan_data,
+              profile_info=None,
+              compress=None,
+              n_threads=None):
+        """
+        Write data to a file in GPROF retrieval format.
 
+        The file content is assembled in memory and written with a single
+        write or, if it is compressed, using ``write_gzip``.
 
+        Args:
+            filename: Path of the output file or an open binary file object.
+            orbit_header: Structured array of dtype ``ORBIT_HEADER_TYPES``
+                containing the orbit header. The number of scans and pixels
+                are set from ``scan_data``.
+            scan_data: Structured array of shape ``(n_scans,)`` and the
+                dtype returned by ``get_scan_types`` containing the scans.
+            profile_info: Optional structured array of dtype
+                ``PROFILE_INFO_TYPES``. Filled with zeros if not given.
+            compress: Whether to compress the file using gzip. Defaults
+                to ``True`` if ``filename`` ends with '.gz'.
+            n_threads: The number of threads to use for the compression.
+        """
+        n_scans = scan_data.shape[0]
+        n_pixels = scan_data.dtype["data"].shape[0]
+        image = np.zeros(1, dtype=get_file_types(n_scans, n_pixels))
+        image["orbit_header"] = orbit_header
+        image["orbit_header"]["number_of_scans"] = n_scans
+        image["orbit_header"]["number_of_pixels"] = n_pixels
+        if profile_info is not None:
+            image["profile_info"] = profile_info
+        image["scans"][0] = scan_data
+
+        if compress is None:
+            compress = str(filename).endswith(".gz")
+        data = memoryview(image.view(np.uint8))
+        if compress:
+            write_gzip(filename, data, n_threads=n_threads)
+        elif hasattr(filename, "write"):
+            filename.write(data)
+        else:
+            with open(filename, "wb") as file:
+                file.write(data)
 
     @property
     def satellite(self):
@@ -173,6 +363,9 @@ class RetrievalFile:
         Return scan as Numpy structured array of size n_pixels and dtype
         DATA_RECORD_TYPES.
         """
+        if i < 0:
+            i = self.n_scans + i
+
         offset = ORBIT_HEADER_TYPES.itemsize + PROFILE_INFO_TYPES.itemsize
         offset += i * (SCAN_HEADER_TYPES.itemsize
                        + self.n_pixels * DATA_RECORD_TYPES.itemsize)
@@ -202,15 +395,31 @@ class RetrievalFile:
                              count=1,
                              offset=offset)
 
-    def to_xarray_dataset(self):
+    def get_variable(self, name):
+        """
+        Decode a single variable of the pixel data.
+
+        Args:
+            name: The name of the variable, i.e. a field of
+                ``DATA_RECORD_TYPES``.
+
+        Returns:
+            Numpy array of shape ``(n_scans, n_pixels, ...)`` containing
+            the data of the variable in its native data type.
+        """
+        return structs.get_variable(self.scan_data, name, "retrieval")
+
+    def to_xarray_dataset(self, variables=None):
         """
         Return data in file as xarray dataset.
+
+        Args:
+            variables: If given, only these variables are decoded and
+                included in the dataset.
         """
-        data = {k: np.zeros((self.n_scans, self.n_pixels) + d[0].shape)
-                for k, d in DATA_RECORD_TYPES.fields.items()}
-        for i, s in enumerate(self.scans):
-            for k, d in data.items():
-                d[i] = s[k]
+        if variables is None:
+            variables = DATA_RECORD_TYPES.fields
+        data = {k: self.get_variable(k) for k in variables}
 
         dims = ["scans", "pixels", "channels"]
         data = {k: (dims[:len(d.shape)], d) for k, d in data.items()}
@@ -6,22 +6,33 @@ regn.data.csu.sim
 This module contains functions to read and convert CSU .sim files for GPROF
  v. 7.
 """
-from multiprocessing import Queue, Process, Manager
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import logging
+from multiprocessing import Queue, Process
+import os
 from pathlib import Path
 import queue
 import subprocess
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 
 import numpy as np
-import pyproj
+from numpy.lib.stride_tricks import sliding_window_view
 from pykdtree.kdtree import KDTree
 from netCDF4 import Dataset
+from regn.data.csu.bin import get_shard_filename
+from regn.data.csu.cache import (MAX_CACHE_SIZE,
+                                 PreprocessorCache,
+                                 get_preprocessor_version)
+from regn.data.csu.manifest import Manifest, truncate_samples
 from regn.data.csu.preprocessor import PreprocessorFile
+from regn.utils import to_ecef
 from tqdm import tqdm
+from tqdm.asyncio import tqdm_asyncio
 import xarray
 
-_ECEF = pyproj.Proj(proj='geocent', ellps='WGS84', datum='WGS84')
-_LLA = pyproj.Proj(proj='latlong', ellps='WGS84', datum='WGS84')
+LOGGER = logging.getLogger(__name__)
 
 ###############################################################################
 # Data types
@@ -29,6 +40,21 @@ _LLA = pyproj.Proj(proj='latlong', ellps='WGS84', datum='WGS84')
 
 N_LAYERS = 28
 N_FREQS = 15
+
+# The preprocessor executable and the arguments passed to it.
+PREPROCESSOR = "gprof2020pp_GMI_L1C"
+PREPROCESSOR_SETTINGS = ["CLIMATOLOGY",
+                         "/qdata2/archive/ERA5",
+                         "/qdata1/pbrown/gpm/ancillary",
+                         "/qdata1/pbrown/gpm/ppingest"]
+
+# Counter making the job IDs of concurrent preprocessor runs started from
+# the same process unique.
+_JOB_COUNTER = itertools.count()
+
+# Maximum distance in meters between a pixel in a .sim file and the
+# matched pixel of the preprocessor swath.
+MAX_MATCH_DISTANCE = 5e3
 DATE_TYPE = np.dtype(
     [("year", "i4"),
      ("month", "i4"),
@@ -82,14 +108,16 @@ class GPROFGMISimFile:
     """
     Interface class to read GPROF .sim files.
     """
-    def __init__(self, path):
+    def __init__(self, path, header_only=False):
         """
         Open .sim file.
 
         Args:
             path: Path to the .sim file to open.
+            header_only: If ``True`` only the header of the file is read
+                and the ``data`` attribute is ``None``.
         """
-        self.path = path
+        self.path = Path(path)
         parts = str(path).split(".")
         self.granule = int(parts[-2])
         self.year  = int(parts[-3][:4])
@@ -99,104 +127,248 @@ class GPROFGMISimFile:
         self.header = np.fromfile(self.path,
                                   GMI_HEADER_TYPES,
                                   count=1)
+        self.data = None
+        if header_only:
+            return
         offset = GMI_HEADER_TYPES.itemsize
         self.data = np.fromfile(self.path,
                                 GMI_PIXEL_TYPES,
                                 offset=offset)
 
     def match_surface_precip(self,
-                             input_data):
+                             input_data,
+                             max_distance=MAX_MATCH_DISTANCE):
         """
         Match surface precipitation from .sim file to points in xarray
         dataset.
 
+        Pixels of the .sim file without a preprocessor pixel within
+        ``max_distance`` are discarded.
+
         Args:
             input_data: xarray dataset containing the input data from
-            the preprocessor.
+                the preprocessor.
+            max_distance: The maximum distance in meters between matched
+                pixels.
 
         Return:
             The input dataset but with the surface_precip field added.
         """
-        n_scans = input_data.scans.size
-
-        dx = 40
-        i_c = 110
-        ix_start = i_c - dx // 2
-        ix_end = i_c + 1 + dx // 2
-
-        lats_1c = input_data["latitude"][:, ix_start:ix_end].data.reshape(-1, 1)
-        lons_1c = input_data["longitude"][:, ix_start:ix_end].data.reshape(-1, 1)
-        z = np.zeros_like(lats_1c)
-        coords_1c = pyproj.transform(_LLA,
-                                     _ECEF,
-                                     lons_1c,
-                                     lats_1c,
-                                     z,
-                                     radians=False)
-        coords_1c = np.concatenate(coords_1c, axis=1)
-
-        lats = self.data["latitude"].reshape(-1, 1)
-        lons = self.data["longitude"].reshape(-1, 1)
-        z = np.zeros_like(lats)
-        coords_sim = pyproj.transform(_LLA,
-                                      _ECEF,
-                                      lons,
-                                      lats,
-                                      z,
-                                      radians=False)
-        coords_sim = np.concatenate(coords_sim, 1)
-
-        kdtree = KDTree(coords_1c)
-        dists, indices = kdtree.query(coords_sim)
-        print(dists, indices)
-        surface_precip = np.zeros(n_scans * (dx + 1))
+        scans, pixels = match_swath(self.data["latitude"],
+                                    self.data["longitude"],
+                                    self.data["scan_index"] - 1,
+                                    self.data["pixel_index"] - 1,
+                                    input_data["latitude"].data,
+                                    input_data["longitude"].data,
+                                    max_distance=max_distance)
+        valid = scans >= 0
+
+        surface_precip = np.zeros(input_data["latitude"].shape, dtype=np.float32)
         surface_precip[:] = np.nan
-        surface_precip[indices] = self.data["surface_precip"]
-        surface_precip = surface_precip.reshape(n_scans, dx + 1)
-
-        surface_precip_full = np.zeros(input_data["latitude"].shape, dtype=np.float32)
-        surface_precip_full[:] = np.nan
-        surface_precip_full[:, ix_start: ix_end] = surface_precip
+        surface_precip[scans[valid], pixels[valid]] = \
+            self.data["surface_precip"][valid]
 
-        input_data["surface_precip"] = (("scans", "pixels"), surface_precip_full)
+        input_data["surface_precip"] = (("scans", "pixels"), surface_precip)
         return input_data
 
 ###############################################################################
 # Helper functions
 ###############################################################################
 
-def _extract_scenes(data):
+def match_swath(lats,
+                lons,
+                scan_indices,
+                pixel_indices,
+                lats_swath,
+                lons_swath,
+                search_radius=2,
+                max_distance=MAX_MATCH_DISTANCE):
     """
-    Extract 128 x 128 pixel wide scenes from dataset where
-    ground truth surface precipitation rain rates are
-    available.
+    Match points to the pixels of a satellite swath.
+
+    Points that are closer to the swath pixel at their expected scan and
+    pixel index than half the minimum distance between neighboring swath
+    pixels are matched to it directly. The remaining points are compared
+    to the swath pixels within ``search_radius`` scans and pixels of their
+    expected indices. Only points without a match within ``max_distance``
+    in this neighborhood are searched for using a KD-tree over the full
+    swath.
 
     Args:
-        xarray.Dataset containing the data from the preprocessor together
-        with the matches surface precipitation from the .sim file.
+        lats: 1D array containing the latitudes of the points to match.
+        lons: 1D array containing the longitudes of the points to match.
+        scan_indices: 1D array containing the expected zero-based scan
+            indices of the points.
+        pixel_indices: 1D array containing the expected zero-based pixel
+            indices of the points.
+        lats_swath: Array of shape ``(n_scans, n_pixels)`` containing the
+            latitudes of the swath.
+        lons_swath: Array of shape ``(n_scans, n_pixels)`` containing the
+            longitudes of the swath.
+        search_radius: The number of scans and pixels around the expected
+            indices that are searched.
+        max_distance: The maximum distance in meters between a point and
+            its matched pixel.
+
+    Returns:
+        Tuple ``(scans, pixels)`` of arrays containing the scan and pixel
+        indices of the matched swath pixels. Both are -1 for points
+        without a match within ``max_distance``.
+    """
+    n_scans, n_pixels = lats_swath.shape
+    coords_swath = to_ecef(lats_swath, lons_swath)
+    coords = to_ecef(lats, lons).astype(coords_swath.dtype, copy=False)
+
+    grid = coords_swath.reshape(n_scans, n_pixels, 3)
+    spacing = min([np.sqrt(np.min(np.sum(np.diff(grid, axis=a) ** 2, axis=-1)))
+                   for a in [0, 1] if grid.shape[a] > 1], default=0.0)
+
+    i_0 = np.clip(scan_indices, 0, n_scans - 1)
+    j_0 = np.clip(pixel_indices, 0, n_pixels - 1)
+    indices = i_0 * n_pixels + j_0
+    dists = np.sqrt(np.sum((coords_swath[indices] - coords) ** 2, axis=-1))
+
+    search = np.where(dists >= 0.5 * spacing)[0]
+    if search.size > 0:
+        d_min = dists[search] ** 2
+        k_min = indices[search]
+        for d_i in range(-search_radius, search_radius + 1):
+            i = np.clip(i_0[search] + d_i, 0, n_scans - 1)
+            for d_j in range(-search_radius, search_radius + 1):
+                j = np.clip(j_0[search] + d_j, 0, n_pixels - 1)
+                k = i * n_pixels + j
+                d = np.sum((coords_swath[k] - coords[search]) ** 2, axis=-1)
+                closer = d < d_min
+                d_min[closer] = d[closer]
+                k_min[closer] = k[closer]
+        dists[search] = np.sqrt(d_min)
+        indices[search] = k_min
+
+    missing = dists > max_distance
+    if np.any(missing):
+        LOGGER.info("Searching %s points not found near their expected "
+                    "swath indices.", missing.sum())
+        kdtree = KDTree(coords_swath)
+        d, k = kdtree.query(coords[missing])
+        dists[missing] = d
+        indices[missing] = k
+
+    invalid = dists > max_distance
+    if np.any(invalid):
+        LOGGER.warning("Discarding %s of %s points without a match within "
+                       "%s m.", invalid.sum(), invalid.size, max_distance)
+    indices[invalid] = -1
+    scans = np.where(invalid, -1, indices // n_pixels)
+    pixels = np.where(invalid, -1, indices % n_pixels)
+    return scans, pixels
+
+
+def _extract_scenes(data, size=128, stride=None, min_coverage=0.0):
+    """
+    Extract square scenes from dataset where ground truth surface
+    precipitation rain rates are available.
+
+    The scenes are centered on the center of the swath and start at the
+    first scan with valid surface precipitation. Consecutive scenes are
+    ``stride`` scans apart, so that they overlap if ``stride`` is smaller
+    than ``size``.
+
+    Args:
+        data: xarray.Dataset containing the data from the preprocessor
+            together with the matched surface precipitation from the .sim
+            file.
+        size: The number of scans and pixels of each scene.
+        stride: The number of scans between the first scans of consecutive
+            scenes. Defaults to ``size``.
+        min_coverage: The minimum fraction of the pixels in a scene that
+            must have valid surface precipitation.
 
     Return:
-        New xarray.Dataset which containing 128x128 patches of input data
-        and corresponding surface precipitation.
+        New xarray.Dataset containing the scenes of input data and
+        corresponding surface precipitation along the 'samples' dimension.
     """
-
-    n = 128
+    if stride is None:
+        stride = size
 
     sp = data["surface_precip"].data
     c_i = sp.shape[1] // 2
-    i_start, i_end = np.where(np.any(~np.isnan(sp), axis=1))[0][[0, -1]]
+    pixels = slice(c_i - size // 2, c_i - size // 2 + size)
+
+    valid = np.where(np.any(~np.isnan(sp), axis=1))[0]
+    if valid.size > 0:
+        i_start, i_end = valid[[0, -1]]
+        starts = np.arange(i_start, i_end - size, stride)
+    else:
+        starts = np.zeros(0, dtype=np.int64)
+
+    if min_coverage > 0.0 and starts.size > 0:
+        counts = np.cumsum(np.isfinite(sp[:, pixels]).sum(axis=1))
+        counts = np.concatenate([[0], counts])
+        coverage = (counts[starts + size] - counts[starts]) / size ** 2
+        starts = starts[coverage >= min_coverage]
+
+    scenes = {}
+    for k, v in data.variables.items():
+        if v.dims[:2] == ("scans", "pixels"):
+            x = v.data[:, pixels]
+        elif v.dims[:1] == ("scans",):
+            x = v.data
+        else:
+            scenes[k] = v
+            continue
+        output = np.empty((starts.size, size) + x.shape[1:], dtype=x.dtype)
+        if starts.size == 0:
+            scenes[k] = (("samples",) + v.dims, output)
+            continue
+        windows = sliding_window_view(x, size, axis=0)
+        for i, start in enumerate(starts):
+            np.copyto(output[i], np.moveaxis(windows[start], -1, 0))
+        scenes[k] = (("samples",) + v.dims, output)
+    return xarray.Dataset(scenes)
+
+
+def _get_preprocessor_filename(sim_file):
+    """
+    Name of the preprocessor file corresponding to a .sim file.
+    """
+    year = sim_file.year
+    month = sim_file.month
+    day = sim_file.day
+    return f"GMIERA5_{year:04}{month:02}{day:02}_{sim_file.granule:06}.pp"
+
 
-    scenes = []
-    i = i_start
-    while i_start + n < i_end:
-        scenes.append(data[{"scans": slice(i_start, i_start + 128),
-                            "pixels": slice(c_i - 64, c_i + 64)}])
-        i_start += n
+def _get_preprocessor_command(preprocessor, l1c_file, output_file):
+    """
+    Command line to run the preprocessor on an L1C file.
+
+    The job ID, which separates the working files of the preprocessor, is
+    unique for every command, so that several preprocessor runs can be
+    started concurrently from the same process.
+
+    Args:
+        preprocessor: The preprocessor executable.
+        l1c_file: Path of the L1C file to process.
+        output_file: Path of the file to write the preprocessor output to.
+
+    Returns:
+        List containing the executable and its arguments.
+    """
+    jobid = f"{os.getpid()}_{next(_JOB_COUNTER)}_pp"
+    prodtype, prepdir, ancdir, ingestdir = PREPROCESSOR_SETTINGS
+    return [str(preprocessor),
+            jobid,
+            prodtype,
+            str(l1c_file),
+            prepdir,
+            ancdir,
+            ingestdir,
+            str(output_file)]
 
-    return xarray.concat(scenes, "samples")
 
 def _run_preprocessor(sim_file,
-                      l1c_file):
+                      l1c_file,
+                      cache=None,
+                      preprocessor=PREPROCESSOR):
     """
     Run preprocessor on L1C GMI file.
 
@@ -205,43 +377,126 @@ def _run_preprocessor(sim_file,
              to process.
         l1c_file: Path of the L1C file for which to extract the input data
              using the preprocessor.
+        cache: Optional PreprocessorCache in which the decoded
+             preprocessor data is looked up and stored.
+        preprocessor: The preprocessor executable.
 
     Returns
         xarray.Dataset containing the retrieval input data for the given L1C file.
     """
-    year = sim_file.year
-    month = sim_file.month
-    day = sim_file.day
-    output_file = f"GMIERA5_{year:04}{month:02}{day:02}_{sim_file.granule:06}.pp"
-    output_file = sim_file.path.parent / output_file
+    if cache is not None:
+        data = cache.get(l1c_file)
+        if data is not None:
+            return data
 
-    print(output_file)
+    output_file = sim_file.path.parent / _get_preprocessor_filename(sim_file)
 
     if not output_file.exists():
         with NamedTemporaryFile(delete=False) as file:
+            filename = file.name
+        try:
+            subprocess.run(_get_preprocessor_command(preprocessor,
+                                                     l1c_file,
+                                                     filename),
+                           check=True)
+            data = PreprocessorFile(filename).to_xarray_dataset()
+        finally:
+            os.unlink(filename)
+    else:
+        data = PreprocessorFile(output_file).to_xarray_dataset()
 
-            file.close()
+    if cache is not None:
+        cache.put(l1c_file, data)
+    return data
 
-            jobid = str(os.getpid()) + "_pp"
-            prodtype = "CLIMATOLOGY"
-            prepdir = "/qdata2/archive/ERA5"
-            ancdir = "/qdata1/pbrown/gpm/ancillary"
-            ingestdir = "/qdata1/pbrown/gpm/ppingest"
 
-            subprocess.run(["gprof2020pp_GMI_L1C",
-                            jobid,
-                            prodtype,
-                            str(l1c_file),
-                            prepdir,
-                            ancdir,
-                            ingestdir,
-                            str(file)])
+async def run_preprocessor_async(l1c_file,
+                                 output_file,
+                                 preprocessor=PREPROCESSOR,
+                                 semaphore=None):
+    """
+    Asynchronously run the preprocessor on an L1C file.
 
-            data = PreprocessorFile(file).to_xarray_dataset()
-    else:
-        data = PreprocessorFile(output_file).to_xarray_dataset()
+    Args:
+        l1c_file: Path of the L1C file to process.
+        output_file: Path of the file to write the preprocessor output to.
+        preprocessor: The preprocessor executable.
+        semaphore: Optional ``asyncio.Semaphore`` limiting the number of
+            concurrently running preprocessor processes.
 
-    return data
+    Returns:
+        The path of the preprocessor output file.
+
+    Raises:
+        subprocess.CalledProcessError if the preprocessor fails.
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    command = _get_preprocessor_command(preprocessor, l1c_file, output_file)
+    async with semaphore:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode,
+                                            command,
+                                            stderr=stderr)
+    return output_file
+
+
+def _process_sim_file(sim_filename,
+                      l1c_file,
+                      preprocessor_file,
+                      cache=None,
+                      cache_size=MAX_CACHE_SIZE,
+                      preprocessor_version=None,
+                      scene_stride=None,
+                      min_coverage=0.0):
+    """
+    Match the surface precipitation in a .sim file to the preprocessor data
+    and extract the training scenes.
+
+    Args:
+        sim_filename: Path of the .sim file.
+        l1c_file: Path of the L1C file corresponding to the .sim file.
+        preprocessor_file: Path of the preprocessor output for the L1C file
+            or None if the data should be loaded from the cache.
+        cache: Optional directory in which the decoded preprocessor data is
+            cached.
+        cache_size: The maximum size of the cache in bytes.
+        preprocessor_version: The version of the preprocessor, as returned
+            by ``get_preprocessor_version``. Required if ``cache`` is given.
+        scene_stride: The number of scans between consecutive scenes.
+        min_coverage: The minimum fraction of valid surface precipitation
+            in the extracted scenes.
+
+    Returns:
+        Tuple ``(sim_filename, scenes)`` containing the name of the
+        processed file and the extracted scenes.
+    """
+    sim_file = GPROFGMISimFile(sim_filename)
+    data = None
+    if cache is not None:
+        cache = PreprocessorCache(cache,
+                                  preprocessor_version,
+                                  max_size=cache_size)
+        data = cache.get(l1c_file)
+    if data is None:
+        if preprocessor_file is None:
+            raise FileNotFoundError(
+                f"No cached preprocessor data found for {l1c_file}."
+            )
+        data = PreprocessorFile(preprocessor_file).to_xarray_dataset()
+        if cache is not None:
+            cache.put(l1c_file, data)
+    data = sim_file.match_surface_precip(data)
+    scenes = _extract_scenes(data,
+                             stride=scene_stride,
+                             min_coverage=min_coverage)
+    return sim_filename, scenes
 
 def _write_results(output_file, data):
     """
@@ -253,17 +508,63 @@ def _write_results(output_file, data):
     Args:
         output_file: Path to the output file to store the data in.
         data: xarray.Dataset containing the data to store in the output file.
+
+    Returns:
+        The number of samples in the output file after writing the data.
     """
+    n = data["samples"].size
     if not Path(output_file).exists():
         data.to_netcdf(path=output_file, unlimited_dims=["samples"])
+        return n
     else:
         with Dataset(output_file, "a") as output_file:
             i = output_file.dimensions["samples"].size
-            n = data["samples"].size
             for k in data:
                 v = data[k]
                 if v.dims.index("samples") == 0:
                     output_file.variables[k][i:i + n] = v.data
+        return i + n
+
+
+def merge_scene_files(input_files, output_file, buffer_size=64, remove=False):
+    """
+    Merge scenes from several files into a single output file.
+
+    The scenes are appended to the output file along the 'samples'
+    dimension in the order of the input files. After each input file the
+    manifest of the output file is updated with the sim files recorded in
+    the manifest of the input file. Input files whose sim files are all
+    recorded in the manifest of the output file have already been merged
+    and are skipped, so that an interrupted merge can be repeated.
+
+    Args:
+        input_files: List of the files to merge.
+        output_file: Path of the output file. If it exists, the scenes are
+            appended to it.
+        buffer_size: The number of scenes to copy at once.
+        remove: Whether to remove each input file and its manifest once
+            it has been merged.
+
+    Returns:
+        The number of samples in the output file.
+    """
+    manifest = Manifest(output_file)
+    n_samples = manifest.n_samples
+    for f in input_files:
+        input_manifest = Manifest(f)
+        if input_manifest.files <= manifest.files:
+            LOGGER.info("Skipping %s, which has already been merged.", f)
+        else:
+            with xarray.open_dataset(f) as data:
+                n = data["samples"].size
+                for i in range(0, n, buffer_size):
+                    scenes = data[{"samples": slice(i, i + buffer_size)}].load()
+                    n_samples = _write_results(output_file, scenes)
+            manifest.commit(input_manifest.files, n_samples)
+        if remove:
+            Path(f).unlink()
+            input_manifest.clear()
+    return n_samples
 
 
 def _find_l1c_file(path, sim_file):
@@ -291,52 +592,111 @@ def _find_l1c_file(path, sim_file):
 ###############################################################################
 
 
+def _truncate_to_manifest(output_file):
+    """
+    Truncate output file to the number of samples recorded in its manifest.
+    """
+    manifest = Manifest(output_file)
+    with Dataset(output_file, "r") as handle:
+        n_samples = handle.dimensions["samples"].size
+    if n_samples > manifest.n_samples:
+        truncate_samples(output_file, manifest.n_samples)
+
+
 class Worker(Process):
     """
     A worker process class for data processing of simulation files.
+
+    Each worker writes the extracted scenes to its own output file, so
+    that the workers don't need to synchronize their writes. For every
+    input file the worker puts the path of the file onto the done queue
+    or, if the processing failed, ``None``.
     """
     def __init__(self,
                  l1c_path,
                  output_file,
                  input_queue,
                  done_queue,
-                 lock):
+                 cache=None,
+                 cache_size=MAX_CACHE_SIZE,
+                 preprocessor=PREPROCESSOR,
+                 preprocessor_version=None,
+                 scene_stride=None,
+                 min_coverage=0.0):
         """
         Create new worker.
 
         Args:
-            output_path: The folder to which to write the retrieval results.
+            l1c_path: The root of the directory tree containing the L1C
+                files.
+            output_file: The shard file to which this worker writes the
+                extracted scenes.
             input_queue: The queue from which the input files are taken
             done_queue: The queue onto which the processed files are placed.
             input_class: The class used to read and process the input data.
+            cache: Optional directory in which to cache the decoded
+                preprocessor data.
+            cache_size: The maximum size of the cache in bytes.
+            preprocessor: The preprocessor executable.
+            preprocessor_version: The version of the preprocessor used to
+                key the cache. Derived from ``preprocessor`` if not given.
+            scene_stride: The number of scans between consecutive scenes.
+            min_coverage: The minimum fraction of valid surface
+                precipitation in the extracted scenes.
         """
         super().__init__()
         self.l1c_path = l1c_path
         self.output_file = output_file
         self.input_queue = input_queue
         self.done_queue = done_queue
-        self.lock = lock
+        self.cache = cache
+        self.cache_size = cache_size
+        self.preprocessor = preprocessor
+        if preprocessor_version is None:
+            preprocessor_version = get_preprocessor_version(preprocessor)
+        self.preprocessor_version = preprocessor_version
+        self.scene_stride = scene_stride
+        self.min_coverage = min_coverage
 
     def run(self):
         """
         Start the process.
         """
+        cache = None
+        if self.cache is not None:
+            cache = PreprocessorCache(self.cache,
+                                      self.preprocessor_version,
+                                      max_size=self.cache_size)
+        manifest = Manifest(self.output_file)
         while True:
             try:
-                sim_file = GPROFGMISimFile(self.input_queue.get(False))
+                sim_filename = self.input_queue.get(True, 1.0)
+            except queue.Empty:
+                break
+            try:
+                sim_file = GPROFGMISimFile(sim_filename)
 
                 l1c_file = _find_l1c_file(self.l1c_path, sim_file)
 
-                data_pp = _run_preprocessor(sim_file, l1c_file)
+                data_pp = _run_preprocessor(sim_file,
+                                            l1c_file,
+                                            cache=cache,
+                                            preprocessor=self.preprocessor)
                 data = sim_file.match_surface_precip(data_pp)
-                scenes = _extract_scenes(data)
+                scenes = _extract_scenes(data,
+                                         stride=self.scene_stride,
+                                         min_coverage=self.min_coverage)
 
-                with self.lock:
-                    _write_results(self.output_file, scenes)
+                n_samples = _write_results(self.output_file, scenes)
+                manifest.commit([sim_file.path], n_samples)
 
-                self.done_queue.put(sim_file)
-            except queue.Empty:
-                break
+                self.done_queue.put(sim_file.path)
+            except Exception as error:
+                LOGGER.error("Processing of %s failed: %s", sim_filename, error)
+                # Discard scenes of an interrupted write.
+                if Path(self.output_file).exists():
+                    _truncate_to_manifest(self.output_file)
+                self.done_queue.put(None)
 
 class SimFileProcessor:
     def __init__(self,
@@ -344,7 +704,13 @@ class SimFileProcessor:
                  l1c_path,
                  output_file,
                  n_workers=4,
-                 days=None):
+                 days=None,
+                 resume=False,
+                 cache=None,
+                 cache_size=MAX_CACHE_SIZE,
+                 preprocessor=PREPROCESSOR,
+                 scene_stride=None,
+                 min_coverage=0.0):
         """
         Create retrieval driver.
 
@@ -356,55 +722,245 @@ class SimFileProcessor:
             input_class: The class to use to read and process the input files.
             n_workers: The number of worker processes to use.
             days: The days of each month to process.
+            resume: Whether to resume a previous, interrupted extraction
+                 into the same output file. Sim files recorded in the
+                 manifest of the output file or of the shard files of
+                 the workers are skipped.
+            cache: Optional directory in which the decoded preprocessor
+                 data is cached, so that repeated runs over the same L1C
+                 files skip the preprocessor.
+            cache_size: The maximum size of the cache in bytes.
+            preprocessor: The preprocessor executable. Its path, size and
+                 modification time key the cached data.
+            scene_stride: The number of scans between the first scans of
+                 consecutive scenes. Scenes overlap if it is smaller than
+                 the scene size. Defaults to the scene size.
+            min_coverage: The minimum fraction of pixels with valid
+                 surface precipitation in the extracted scenes.
         """
 
         self.sim_file_path = Path(sim_file_path)
         self.l1c_path = Path(l1c_path)
         self.output_file = output_file
-        self.done_queue = Queue()
-        self.manager = Manager()
-        self.lock = self.manager.Lock()
-
-        self._fill_input_queue(days)
-
-        self.workers = [Worker(self.l1c_path,
-                               self.output_file,
-                               self.input_queue,
-                               self.done_queue,
-                               self.lock) for i in range(n_workers)]
+        self.shards = [get_shard_filename(output_file, i)
+                       for i in range(n_workers)]
+
+        self.manifest = Manifest(output_file)
+        if not Path(output_file).exists():
+            self.manifest.clear()
+        elif resume:
+            _truncate_to_manifest(output_file)
+        self.shard_manifests = []
+        for shard in self.shards:
+            if resume and shard.exists():
+                _truncate_to_manifest(shard)
+                self.shard_manifests.append(Manifest(shard))
+            else:
+                if shard.exists():
+                    shard.unlink()
+                Manifest(shard).clear()
+        self.resume = resume
+        self.n_workers = n_workers
+        self.cache = cache
+        self.cache_size = cache_size
+        self.preprocessor = preprocessor
+        self.preprocessor_version = get_preprocessor_version(preprocessor)
+        self.scene_stride = scene_stride
+        self.min_coverage = min_coverage
+
+        self.files = self._find_files(days)
         self.processed = []
 
-    def _fill_input_queue(self, days):
-        """
-        Scans the input folder for matching files and fills the input queue.
+    def _find_files(self, days):
         """
+        Scans the input folder for matching files.
 
-        self.input_queue = Queue()
+        Args:
+            days: The days of each month to process.
 
+        Returns:
+            List of the .sim files to process.
+        """
         if days is None:
-            for f in self.sim_file_path.glob("**/*.sim"):
-                print("putting on queue: ", f)
-                self.input_queue.put(f)
+            files = list(self.sim_file_path.glob("**/*.sim"))
         else:
+            files = []
             for d in days:
-                for f in self.sim_file_path.glob(f"**/*{d:02}/*.sim"):
-                    print("putting on queue: ", f)
-                    self.input_queue.put(f)
+                files += list(self.sim_file_path.glob(f"**/*{d:02}/*.sim"))
 
+        manifests = [self.manifest] + self.shard_manifests
+        return [f for f in files
+                if not (self.resume and any([f in m for m in manifests]))]
 
-    def run(self):
+    def _merge_shards(self):
+        """
+        Merge the shard files of the workers into the output file and
+        remove them.
+        """
+        shards = [f for f in self.shards if f.exists()]
+        merge_scene_files(shards, self.output_file, remove=True)
+        for shard in self.shards:
+            Manifest(shard).clear()
+
+    def run(self, merge=True):
         """
         Start the processing.
 
         This will start processing all suitable input files that have been found and
-        stores the names of the produced result files in the ``processed`` attribute
-        of the driver.
+        stores the names of the processed files in the ``processed`` attribute
+        of the driver. Each worker writes the extracted scenes to its own shard
+        file, the shards are merged into the output file once all files have
+        been processed.
+
+        Args:
+            merge: If ``False`` the shard files are not merged. They can be
+                opened as a single dataset using
+                ``xarray.open_mfdataset(shards, combine="nested",
+                concat_dim="samples")``.
+
+        Returns:
+            If ``merge`` is ``False``, the list of the shard files.
+        """
+        if len(self.processed) > 0:
+            print("This processor already ran.")
+            return
+
+        input_queue = Queue()
+        done_queue = Queue()
+        for f in self.files:
+            input_queue.put(f)
+
+        workers = [Worker(self.l1c_path,
+                          shard,
+                          input_queue,
+                          done_queue,
+                          cache=self.cache,
+                          cache_size=self.cache_size,
+                          preprocessor=self.preprocessor,
+                          preprocessor_version=self.preprocessor_version,
+                          scene_stride=self.scene_stride,
+                          min_coverage=self.min_coverage)
+                   for shard in self.shards]
+        [w.start() for w in workers]
+        n_done = 0
+        with tqdm(total=len(self.files)) as progress:
+            while n_done < len(self.files):
+                try:
+                    sim_file = done_queue.get(True, 1.0)
+                except queue.Empty:
+                    if not any([w.is_alive() for w in workers]):
+                        LOGGER.error("The worker processes exited before all "
+                                     "files were processed.")
+                        break
+                    continue
+                n_done += 1
+                progress.update()
+                if sim_file is not None:
+                    self.processed.append(sim_file)
+        [w.join() for w in workers]
+        input_queue.close()
+        done_queue.close()
+
+        if not merge:
+            return [f for f in self.shards if f.exists()]
+        self._merge_shards()
+
+    def run_async(self, n_preprocessors=4, scratch=None):
+        """
+        Process the input files with the preprocessor and the matching
+        running concurrently.
+
+        Up to ``n_preprocessors`` preprocessor processes are run
+        asynchronously from this process. As soon as the preprocessor has
+        finished for a file, the matching and extraction of the scenes are
+        run in a pool of ``n_workers`` worker processes while the
+        preprocessor is run on the following files. At most
+        ``n_preprocessors + n_workers`` files are processed at the same
+        time, so that the preprocessor outputs waiting for the matching
+        don't accumulate. The extracted scenes are written to the output
+        file from this process. Files whose processing fails are logged
+        and skipped.
+
+        Args:
+            n_preprocessors: The maximum number of concurrently running
+                preprocessor processes.
+            scratch: Directory in which the temporary directory for the
+                preprocessor outputs is created. Defaults to the default
+                temporary directory of the system.
         """
         if len(self.processed) > 0:
             print("This processor already ran.")
             return
 
-        n_files = self.input_queue.qsize()
-        [w.start() for w in self.workers]
-        for i in tqdm(range(n_files)):
-            self.processed.append(self.done_queue.get(True))
+        cache = None
+        if self.cache is not None:
+            cache = PreprocessorCache(self.cache,
+                                      self.preprocessor_version,
+                                      max_size=self.cache_size)
+
+        pool = ProcessPoolExecutor(max_workers=self.n_workers)
+        loop = asyncio.new_event_loop()
+
+        async def extract(sim_filename, tmp, semaphore):
+            sim_file = GPROFGMISimFile(sim_filename, header_only=True)
+            try:
+                l1c_file = _find_l1c_file(self.l1c_path, sim_file)
+            except StopIteration:
+                raise FileNotFoundError(
+                    f"No L1C file found for {sim_filename}."
+                ) from None
+            preprocessor_file = (sim_file.path.parent
+                                 / _get_preprocessor_filename(sim_file))
+            temporary = False
+            if cache is not None and cache.get_filename(l1c_file).exists():
+                preprocessor_file = None
+            elif not preprocessor_file.exists():
+                preprocessor_file = Path(tmp) / preprocessor_file.name
+                temporary = True
+                await run_preprocessor_async(l1c_file,
+                                             preprocessor_file,
+                                             preprocessor=self.preprocessor,
+                                             semaphore=semaphore)
+            try:
+                return await loop.run_in_executor(pool,
+                                                  _process_sim_file,
+                                                  sim_filename,
+                                                  l1c_file,
+                                                  preprocessor_file,
+                                                  self.cache,
+                                                  self.cache_size,
+                                                  self.preprocessor_version,
+                                                  self.scene_stride,
+                                                  self.min_coverage)
+            finally:
+                if temporary:
+                    preprocessor_file.unlink()
+
+        async def process(sim_filename, tmp, pending, semaphore):
+            async with pending:
+                try:
+                    return await extract(sim_filename, tmp, semaphore)
+                except Exception as error:
+                    LOGGER.error("Processing of %s failed: %s",
+                                 sim_filename, error)
+                    return sim_filename, None
+
+        async def coro(tmp):
+            pending = asyncio.Semaphore(n_preprocessors + self.n_workers)
+            semaphore = asyncio.Semaphore(n_preprocessors)
+            tasks = [process(f, tmp, pending, semaphore) for f in self.files]
+            for t in tqdm_asyncio.as_completed(tasks):
+                sim_filename, scenes = await t
+                if scenes is None:
+                    continue
+                n_samples = _write_results(self.output_file, scenes)
+                Manifest(self.output_file).commit([sim_filename], n_samples)
+                self.processed.append(sim_filename)
+
+        with TemporaryDirectory(dir=scratch) as tmp:
+            loop.run_until_complete(coro(tmp))
+        loop.close()
+        pool.shutdown()
+
+        # Shards left by a resumed run of the worker processes.
+        self._merge_shards()
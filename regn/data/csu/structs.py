@@ -0,0 +1,57 @@
+"""
+=====================
+regn.data.csu.structs
+=====================
+
+This module contains helper functions shared by the readers of the
+binary preprocessor and retrieval files, which both consist of an orbit
+header followed by scans of pixel records.
+"""
+import numpy as np
+
+
+def get_scan_types(scan_header_types, data_record_types, n_pixels):
+    """
+    The data type of a scan, i.e. a scan header followed by the records of
+    its pixels.
+
+    Args:
+        scan_header_types: The data type of the scan header.
+        data_record_types: The data type of the pixel records.
+        n_pixels: The number of pixels per scan.
+
+    Returns:
+        Numpy structured data type with fields ``scan_header`` and
+        ``data``.
+    """
+    return np.dtype(
+        [("scan_header", scan_header_types),
+         ("data", data_record_types, (n_pixels,))]
+    )
+
+
+def get_variable(scan_data, name, file_type):
+    """
+    Decode a single variable of the pixel data of a file.
+
+    Args:
+        scan_data: Structured array of shape ``(n_scans,)`` containing the
+            scans of the file.
+        name: The name of the variable, i.e. a field of the pixel records.
+        file_type: The name of the file type used in error messages.
+
+    Returns:
+        Numpy array of shape ``(n_scans, n_pixels, ...)`` containing
+        the data of the variable in its native data type.
+
+    Raises:
+        ValueError: If the pixel records have no field with the given
+            name.
+    """
+    fields = scan_data.dtype["data"].base.fields
+    if name not in fields:
+        raise ValueError(
+            f"{name} is not a variable of {file_type} files. Available "
+            f"variables are {list(fields)}."
+        )
+    return scan_data["data"][name].copy()
@@ -0,0 +1,534 @@
+"""
+=======================
+regn.data.csu.synthetic
+=======================
+
+This module provides functions to generate synthetic files in the binary
+formats used by GPROF: the .bin files of the retrieval database,
+preprocessor files, retrieval files and .sim files. The generated data is
+random but has realistic value ranges and, for the swath-based formats,
+a realistic observation geometry, so that the files can be used to test
+and benchmark the processing of the data at production scale.
+"""
+import gzip
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from regn.data.csu import preprocessor, retrieval, sim
+from regn.data.csu.bin import (GMI_BIN_HEADER_TYPES,
+                               GMI_BIN_RECORD_TYPES,
+                               N_FREQS,
+                               N_LAYERS)
+
+# Nominal frequencies and earth incidence angles of the GMI channels.
+GMI_FREQUENCIES = np.array([10.65, 10.65, 18.7, 18.7, 23.8, 23.8, 36.64,
+                            36.64, 89.0, 89.0, 166.0, 166.0, 186.31,
+                            190.31, 190.31], dtype=np.float32)
+GMI_EIA = np.array([52.8] * 10 + [49.19] * 5, dtype=np.float32)
+
+N_PIXELS = 221
+SCANS_PER_ORBIT = 2963
+# Time between two consecutive scans in milliseconds.
+SCAN_PERIOD = 1875
+# Width of the GMI swath in kilometers.
+SWATH_WIDTH = 885.0
+# Inclination of the GPM orbit in degrees.
+INCLINATION = 65.0
+ALTITUDE = 407.0
+EARTH_RADIUS = 6371.0
+
+
+def _get_rng(seed):
+    """
+    Random number generator used to generate the data for a file.
+    """
+    return np.random.default_rng(seed)
+
+
+def _get_tbs(rng, n, surface_precip=None):
+    """
+    Random brightness temperatures for all GMI channels.
+
+    Args:
+        rng: The random number generator to use.
+        n: The number of observations.
+        surface_precip: If given, the brightness temperatures at high
+            frequencies are depressed proportionally to the precipitation.
+
+    Returns:
+        Array of shape ``(n, 15)`` containing the brightness temperatures.
+    """
+    base = np.linspace(170.0, 260.0, N_FREQS, dtype=np.float32)
+    tbs = base + rng.normal(0.0, 10.0, size=(n, N_FREQS))
+    if surface_precip is not None:
+        scattering = np.linspace(0.0, 1.0, N_FREQS) ** 2
+        tbs -= 10.0 * np.log1p(surface_precip)[:, np.newaxis] * scattering
+    return tbs.astype(np.float32)
+
+
+def _get_precip(rng, n, p_rain=0.3):
+    """
+    Random surface precipitation with a fraction ``p_rain`` of raining
+    observations and log-normally distributed rain rates.
+    """
+    raining = rng.random(n) < p_rain
+    precip = np.where(raining, rng.lognormal(-0.5, 1.5, size=n), 0.0)
+    return precip.astype(np.float32)
+
+
+def _get_profiles(rng, precip):
+    """
+    Random hydrometeor and latent heat profiles consistent with the given
+    surface precipitation.
+
+    Returns:
+        Dictionary containing arrays of shape ``(n, 28)`` for each profile
+        variable.
+    """
+    n = precip.size
+    layers = np.arange(N_LAYERS)
+    decay = np.exp(-layers / 6.0)[np.newaxis]
+    rain = 0.05 * precip[:, np.newaxis] * decay
+    rain[:, 12:] = 0.0
+    snow = 0.02 * precip[:, np.newaxis] * (1.0 - decay)
+    cloud = rng.gamma(1.0, 2e-4, size=(n, N_LAYERS)) * decay
+    latent_heat = 2.0 * precip[:, np.newaxis] * np.sin(np.pi * layers / 28)
+    latent_heat[precip == 0] = 0.0
+    missing = rng.random(n) < 0.05
+    latent_heat[missing] = -999.0
+    return {"rain_water_content": rain.astype(np.float32),
+            "cloud_water_content": cloud.astype(np.float32),
+            "snow_water_content": snow.astype(np.float32),
+            "latent_heat": latent_heat.astype(np.float32)}
+
+
+def _fill_fields(records, data):
+    """
+    Copy arrays into the fields of a structured array. Fields with nested
+    structured types are filled from arrays with a trailing dimension
+    matching the number of sub-fields.
+    """
+    for k, d in data.items():
+        field = records[k]
+        if field.dtype.names is not None:
+            for i, name in enumerate(field.dtype.names):
+                field[name] = d[..., i]
+        else:
+            records[k] = d
+
+
+def _fill_dates(dates, times):
+    """
+    Fill structured array of date type from array of ``datetime64``
+    values.
+    """
+    times = times.astype("datetime64[ms]")
+    months = times.astype("datetime64[M]")
+    days = times.astype("datetime64[D]")
+    time_of_day = (times - days).astype(np.int64)
+    fields = {
+        "year": months.astype(np.int64) // 12 + 1970,
+        "month": months.astype(np.int64) % 12 + 1,
+        "day": (days - months).astype(np.int64) + 1,
+        "hour": time_of_day // 3_600_000,
+        "minute": time_of_day // 60_000 % 60,
+        "second": time_of_day // 1000 % 60,
+        "millisecond": time_of_day % 1000
+    }
+    for k in dates.dtype.names:
+        dates[k] = fields[k]
+
+
+###############################################################################
+# Swath geometry
+###############################################################################
+
+
+def get_swath_geometry(n_scans, n_pixels=N_PIXELS, orbit_phase=0.0):
+    """
+    Calculate the geolocation of the pixels of a conically-scanning
+    radiometer on a circular orbit.
+
+    Args:
+        n_scans: The number of scans.
+        n_pixels: The number of pixels per scan.
+        orbit_phase: Angle in degrees along the orbit of the first scan,
+            measured from the ascending node.
+
+    Returns:
+        Tuple ``(latitude, longitude, scan_latitude, scan_longitude)``
+        containing the pixel coordinates as arrays of shape
+        ``(n_scans, n_pixels)`` and the coordinates of the sub-satellite
+        points as arrays of shape ``(n_scans,)``.
+    """
+    phase = np.deg2rad(orbit_phase) + 2.0 * np.pi * np.arange(n_scans) / SCANS_PER_ORBIT
+    inclination = np.deg2rad(INCLINATION)
+    # Earth rotation during one orbit of 5550 s.
+    rotation = -2.0 * np.pi * 5550.0 / 86164.0 * np.arange(n_scans) / SCANS_PER_ORBIT
+
+    position = np.stack([np.cos(phase),
+                         np.sin(phase) * np.cos(inclination),
+                         np.sin(phase) * np.sin(inclination)], axis=-1)
+    velocity = np.stack([-np.sin(phase),
+                         np.cos(phase) * np.cos(inclination),
+                         np.cos(phase) * np.sin(inclination)], axis=-1)
+    cross_track = np.cross(position, velocity)
+
+    angle_max = 0.5 * SWATH_WIDTH / EARTH_RADIUS
+    angles = np.linspace(-angle_max, angle_max, n_pixels)[np.newaxis, :, np.newaxis]
+    pixels = (np.cos(angles) * position[:, np.newaxis]
+              + np.sin(angles) * cross_track[:, np.newaxis])
+
+    def to_lat_lon(xyz, rotation):
+        lat = np.rad2deg(np.arcsin(np.clip(xyz[..., 2], -1.0, 1.0)))
+        lon = np.rad2deg(np.arctan2(xyz[..., 1], xyz[..., 0]) + rotation)
+        lon = (lon + 180.0) % 360.0 - 180.0
+        return lat.astype(np.float32), lon.astype(np.float32)
+
+    lats, lons = to_lat_lon(pixels, rotation[:, np.newaxis])
+    scan_lats, scan_lons = to_lat_lon(position, rotation)
+    return lats, lons, scan_lats, scan_lons
+
+
+###############################################################################
+# Bin files
+###############################################################################
+
+
+def write_bin_file(path,
+                   temperature=300,
+                   tpw=40,
+                   surface_type=18,
+                   airmass_type=None,
+                   n_profiles=1000,
+                   seed=None):
+    """
+    Write a synthetic .bin file of the GPROF retrieval database.
+
+    Args:
+        path: The folder to write the file to.
+        temperature: The surface temperature of the bin.
+        tpw: The total precipitable water of the bin.
+        surface_type: The surface type of the bin.
+        airmass_type: The airmass type of the bin. If not given the
+            airmass type is omitted from the filename.
+        n_profiles: The number of profiles in the file.
+        seed: Seed for the random number generator.
+
+    Returns:
+        The path of the written file.
+    """
+    rng = _get_rng(seed)
+    name = f"gpm_{temperature:03}_{tpw:02}"
+    if airmass_type is not None:
+        name += f"_{airmass_type:02}"
+    filename = Path(path) / (name + f"_{surface_type:02}.bin")
+
+    header = np.zeros(1, dtype=GMI_BIN_HEADER_TYPES)
+    header["satellite_code"] = "GPM"
+    header["sensor"] = "GMI"
+    _fill_fields(header, {"frequencies": GMI_FREQUENCIES[np.newaxis],
+                          "nominal_eia": GMI_EIA[np.newaxis]})
+
+    precip = _get_precip(rng, n_profiles)
+    data = {
+        "dataset_number": rng.integers(0, 100, size=n_profiles),
+        "surface_precip": precip,
+        "convective_precip": precip * rng.random(n_profiles, dtype=np.float32),
+        "brightness_temps": _get_tbs(rng, n_profiles, precip),
+        "delta_tb": rng.normal(0.0, 1.0, size=(n_profiles, N_FREQS)),
+        "rain_water_path": 0.1 * precip,
+        "cloud_water_path": rng.gamma(1.0, 0.05, size=n_profiles),
+        "ice_water_path": 0.05 * precip,
+        "total_column_water_vapor": tpw + rng.uniform(0.0, 1.0, size=n_profiles),
+        "two_meter_temperature": temperature + rng.uniform(0.0, 1.0, size=n_profiles),
+    }
+    data.update(_get_profiles(rng, precip))
+    records = np.zeros(n_profiles, dtype=GMI_BIN_RECORD_TYPES)
+    _fill_fields(records, data)
+
+    with open(filename, "wb") as file:
+        header.tofile(file)
+        records.tofile(file)
+    return filename
+
+
+###############################################################################
+# Preprocessor files
+###############################################################################
+
+
+def write_preprocessor_file(filename,
+                            n_scans=SCANS_PER_ORBIT,
+                            n_pixels=N_PIXELS,
+                            granule=1,
+                            start_time=datetime(2019, 1, 1),
+                            seed=None):
+    """
+    Write a synthetic GPROF preprocessor file.
+
+    Args:
+        filename: The name of the file to write.
+        n_scans: The number of scans in the file.
+        n_pixels: The number of pixels per scan.
+        granule: The granule number of the file.
+        start_time: The time of the first scan.
+        seed: Seed for the random number generator.
+
+    Returns:
+        The path of the written file.
+    """
+    rng = _get_rng(seed)
+    header = np.zeros(1, dtype=preprocessor.ORBIT_HEADER_TYPES)
+    header["satellite"] = "GPM CO"
+    header["sensor"] = "GMI"
+    header["preprocessor"] = "GPM_PP"
+    header["granule_number"] = granule
+    header["number_of_scans"] = n_scans
+    header["number_of_pixels"] = n_pixels
+    header["n_channels"] = preprocessor.N_CHANNELS
+    header["frequencies"] = GMI_FREQUENCIES
+
+    scans = np.zeros(n_scans, dtype=[
+        ("header", preprocessor.SCAN_HEADER_TYPES),
+        ("pixels", preprocessor.DATA_RECORD_TYPES, (n_pixels,))
+    ])
+    lats, lons, scan_lats, scan_lons = get_swath_geometry(n_scans, n_pixels)
+    times = (np.datetime64(start_time, "ms")
+             + np.arange(n_scans) * np.timedelta64(SCAN_PERIOD, "ms"))
+    _fill_dates(scans["header"]["scan_date"], times)
+    scans["header"]["scan_latitude"] = scan_lats
+    scans["header"]["scan_longitude"] = scan_lons
+    scans["header"]["scan_altitude"] = ALTITUDE
+
+    shape = (n_scans, n_pixels)
+    n = n_scans * n_pixels
+    precip = _get_precip(rng, n)
+    t2m = 300.0 - 40.0 * np.abs(lats) / 90.0 + rng.normal(0.0, 2.0, size=shape)
+    pixels = scans["pixels"]
+    pixels["latitude"] = lats
+    pixels["longitude"] = lons
+    pixels["brightness_temperatures"] = _get_tbs(rng, n, precip).reshape(shape + (-1,))
+    pixels["earth_incidence_angle"] = GMI_EIA
+    pixels["two_meter_temperature"] = t2m
+    pixels["surface_temperature"] = t2m + rng.normal(0.0, 1.0, size=shape)
+    pixels["wet_bulb_temperature"] = t2m - rng.uniform(0.0, 5.0, size=shape)
+    pixels["lapse_rate"] = rng.uniform(4.0, 8.0, size=shape)
+    pixels["total_column_water_vapor"] = rng.gamma(4.0, 6.0, size=shape)
+    pixels["sunglint_angle"] = rng.integers(0, 90, size=shape)
+    pixels["surface_type"] = rng.integers(1, 19, size=shape)
+    pixels["airmass_type"] = rng.integers(0, 4, size=shape)
+
+    with open(filename, "wb") as file:
+        header.tofile(file)
+        scans.tofile(file)
+    return Path(filename)
+
+
+###############################################################################
+# Retrieval files
+###############################################################################
+
+
+def write_retrieval_file(filename,
+                         n_scans=SCANS_PER_ORBIT,
+                         n_pixels=N_PIXELS,
+                         granule=1,
+                         start_time=datetime(2019, 1, 1),
+                         compress=True,
+                         seed=None):
+    """
+    Write a synthetic GPROF retrieval file.
+
+    Args:
+        filename: The name of the file to write.
+        n_scans: The number of scans in the file.
+        n_pixels: The number of pixels per scan.
+        granule: The granule number of the file.
+        start_time: The time of the first scan.
+        compress: Whether to compress the file using gzip.
+        seed: Seed for the random number generator.
+
+    Returns:
+        The path of the written file.
+    """
+    rng = _get_rng(seed)
+    times = (np.datetime64(start_time, "ms")
+             + np.arange(n_scans) * np.timedelta64(SCAN_PERIOD, "ms"))
+
+    header = np.zeros(1, dtype=retrieval.ORBIT_HEADER_TYPES)
+    header["satellite"] = "GPM CO"
+    header["sensor"] = "GMI"
+    header["preprocessor"] = "GPM_PP"
+    header["algorithm"] = "GPROF"
+    _fill_dates(header["creation_date"], times[-1:])
+    _fill_dates(header["granule_start_date"], times[:1])
+    _fill_dates(header["granule_end_date"], times[-1:])
+    header["granule_number"] = granule
+    header["number_of_scans"] = n_scans
+    header["number_of_pixels"] = n_pixels
+
+    profile_info = np.zeros(1, dtype=retrieval.PROFILE_INFO_TYPES)
+    profile_info["n_species"] = retrieval.N_SPECIES
+    profile_info["n_temps"] = retrieval.N_TEMPERATURES
+    profile_info["n_layers"] = retrieval.N_LAYERS
+    profile_info["n_profiles"] = retrieval.N_PROFILES
+    profile_info["height_top_layers"] = np.linspace(0.5, 18.0, retrieval.N_LAYERS)
+    profile_info["temperature"] = np.linspace(270.0, 303.0, retrieval.N_TEMPERATURES)
+
+    scans = np.zeros(n_scans, dtype=[
+        ("header", retrieval.SCAN_HEADER_TYPES),
+        ("pixels", retrieval.DATA_RECORD_TYPES, (n_pixels,))
+    ])
+    lats, lons, scan_lats, scan_lons = get_swath_geometry(n_scans, n_pixels)
+    _fill_dates(scans["header"]["scan_date"], times)
+    scans["header"]["scan_latitude"] = scan_lats
+    scans["header"]["scan_longitude"] = scan_lons
+    scans["header"]["scan_altitude"] = ALTITUDE
+
+    shape = (n_scans, n_pixels)
+    precip = _get_precip(rng, n_scans * n_pixels).reshape(shape)
+    pixels = scans["pixels"]
+    pixels["latitude"] = lats
+    pixels["longitude"] = lons
+    pixels["surface_type_index"] = rng.integers(1, 19, size=shape)
+    pixels["tcwv_index"] = rng.integers(0, 78, size=shape)
+    pixels["t2m_index"] = rng.integers(230, 310, size=shape)
+    pixels["airmass_index"] = rng.integers(0, 4, size=shape)
+    pixels["pop_index"] = np.where(precip > 0, rng.integers(50, 101, size=shape), 0)
+    pixels["precip_flag"] = precip > 0
+    pixels["surface_precip"] = precip
+    pixels["frozen_precip"] = precip * (lats > 60)
+    pixels["convective_precip"] = precip * rng.random(shape, dtype=np.float32)
+    pixels["rain_water_path"] = 0.1 * precip
+    pixels["cloud_water_path"] = rng.gamma(1.0, 0.05, size=shape)
+    pixels["ice_water_path"] = 0.05 * precip
+    pixels["most_likely_precip"] = precip
+    pixels["precip_1st_tertial"] = 0.5 * precip
+    pixels["precip_3rd_tertial"] = 1.5 * precip
+    pixels["profile_t2m_index"] = rng.integers(0, retrieval.N_TEMPERATURES, size=shape)
+    pixels["profile_number"] = rng.integers(0,
+                                            retrieval.N_PROFILES,
+                                            size=shape + (retrieval.N_SPECIES,))
+    pixels["profile_scale"] = rng.random(shape + (retrieval.N_SPECIES,))
+
+    opener = gzip.open if compress else open
+    with opener(filename, "wb") as file:
+        file.write(header.tobytes())
+        file.write(profile_info.tobytes())
+        file.write(scans.tobytes())
+    return Path(filename)
+
+
+###############################################################################
+# Sim files
+###############################################################################
+
+
+def get_sim_filename(granule, start_time=datetime(2019, 1, 1)):
+    """
+    Filename of the .sim file of a given granule.
+    """
+    return f"GMI.dbsatTb.{start_time:%Y%m%d}.{granule:06}.sim"
+
+
+def get_preprocessor_filename(granule, start_time=datetime(2019, 1, 1)):
+    """
+    Filename of the preprocessor file corresponding to the .sim file
+    of a given granule.
+    """
+    return f"GMIERA5_{start_time:%Y%m%d}_{granule:06}.pp"
+
+
+def write_sim_file(path,
+                   n_scans=SCANS_PER_ORBIT,
+                   n_pixels=N_PIXELS,
+                   granule=1,
+                   start_time=datetime(2019, 1, 1),
+                   pixel_range=(90, 131),
+                   write_preprocessor=True,
+                   seed=None):
+    """
+    Write a synthetic .sim file.
+
+    The .sim file covers the pixels in ``pixel_range`` of all scans of
+    the swath, which is the part of the swath for which the simulations
+    are available. Since the preprocessor is run on the matching L1C
+    file, the preprocessor file corresponding to the .sim file can be
+    written as well, so that the two files can be matched.
+
+    Args:
+        path: The folder to write the files to.
+        n_scans: The number of scans of the swath.
+        n_pixels: The number of pixels per scan of the swath.
+        granule: The granule number.
+        start_time: The time of the first scan.
+        pixel_range: Tuple ``(start, end)`` of the pixels in each scan
+            included in the .sim file.
+        write_preprocessor: Whether to write the corresponding
+            preprocessor file.
+        seed: Seed for the random number generator.
+
+    Returns:
+        The path of the written .sim file.
+    """
+    rng = _get_rng(seed)
+    path = Path(path)
+    filename = path / get_sim_filename(granule, start_time)
+
+    if write_preprocessor:
+        write_preprocessor_file(path / get_preprocessor_filename(granule, start_time),
+                                n_scans=n_scans,
+                                n_pixels=n_pixels,
+                                granule=granule,
+                                start_time=start_time,
+                                seed=seed)
+
+    pixel_start, pixel_end = pixel_range
+    header = np.zeros(1, dtype=sim.GMI_HEADER_TYPES)
+    header["satellite_code"] = "GPM"
+    header["sensor"] = "GMI"
+    header["frequencies"] = GMI_FREQUENCIES
+    header["nominal_eia"] = GMI_EIA
+    header["start_pixel"] = pixel_start + 1
+    header["end_pixel"] = pixel_end
+    header["start_scan"] = 1
+    header["end_scan"] = n_scans
+
+    lats, lons, _, _ = get_swath_geometry(n_scans, n_pixels)
+    lats = lats[:, pixel_start:pixel_end].ravel()
+    lons = lons[:, pixel_start:pixel_end].ravel()
+    scans, pixels = np.meshgrid(np.arange(n_scans),
+                                np.arange(pixel_start, pixel_end),
+                                indexing="ij")
+    times = (np.datetime64(start_time, "ms")
+             + scans.ravel() * np.timedelta64(SCAN_PERIOD, "ms"))
+
+    n = lats.size
+    precip = _get_precip(rng, n)
+    profiles = _get_profiles(rng, precip)
+    tbs = _get_tbs(rng, n, precip)
+    data = np.zeros(n, dtype=sim.GMI_PIXEL_TYPES)
+    # Scan and pixel indices are one-based.
+    data["scan_index"] = scans.ravel() + 1
+    data["pixel_index"] = pixels.ravel() + 1
+    data["latitude"] = lats
+    data["longitude"] = lons
+    data["elevation"] = rng.uniform(0.0, 0.5, size=n)
+    _fill_dates(data["scan_time"], times)
+    data["surface_type"] = rng.integers(1, 19, size=n)
+    data["surface_precip"] = precip
+    data["convective_precip"] = precip * rng.random(n, dtype=np.float32)
+    data["emissivity"] = rng.uniform(0.5, 1.0, size=(n, sim.N_FREQS))
+    for k, d in profiles.items():
+        data[k] = d
+    data["tbs_observed"] = tbs
+    data["tbs_simulated"] = tbs + rng.normal(0.0, 1.0, size=tbs.shape)
+    data["d_tbs"] = data["tbs_observed"] - data["tbs_simulated"]
+
+    with open(filename, "wb") as file:
+        header.tofile(file)
+        data.tofile(file)
+    return filename
@@ -11,10 +11,11 @@ from datetime import datetime
 
 import numpy as np
 import netCDF4
-import pyproj
 from pykdtree.kdtree import KDTree
 from h5py import File
 
+from regn.utils import to_ecef
+
 
 def to_euclidean(lats, lons):
     """
@@ -27,18 +28,7 @@ def to_euclidean(lats, lons):
         n x 3 array containing the points along first dimension and the
         3 coordinates along the second axis.
     """
-    lats = lats.ravel()
-    lons = lons.ravel()
-    alts = np.zeros(lats.size)
-    ecef = pyproj.Proj(proj='geocent', ellps='WGS84', datum='WGS84')
-    lla = pyproj.Proj(proj='latlong', ellps='WGS84', datum='WGS84')
-    x_coords, y_coords, z_coords = pyproj.transform(lla, ecef, lons, lats,
-                                                    alts, radians=False)
-
-    return np.concatenate([x_coords.reshape(-1, 1),
-                           y_coords.reshape(-1, 1),
-                           z_coords.reshape(-1, 1)],
-                          axis=-1)
+    return to_ecef(lats, lons)
 
 
 def get_files(base_path, year, month, day):
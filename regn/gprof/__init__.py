@@ -7,7 +7,7 @@ This module contains the interface for the operational processing of GPROF
 data.
 """
 from torch.utils.data import Dataset
-from regn.data.csu.preprocessor import PreprocessorFile
+from regn.data.csu.preprocessor import PreprocessorFile, get_input_features
 import numpy as np
 import quantnn.quantiles as qq
 import xarray
@@ -15,6 +15,15 @@ import torch
 
 N_CHANNELS = 15
 
+# Preprocessor variables loaded by InputData.
+INPUT_VARIABLES = ["latitude",
+                   "longitude",
+                   "brightness_temperatures",
+                   "two_meter_temperature",
+                   "total_column_water_vapor",
+                   "surface_type",
+                   "airmass_type"]
+
 class InputData(Dataset):
     """
     PyTorch dataset interface class for GPORF preprocessor files.
@@ -22,9 +31,11 @@ class InputData(Dataset):
     def __init__(self,
                  filename,
                  normalizer,
-                 scans_per_batch=4):
+                 scans_per_batch=4,
+                 variables=INPUT_VARIABLES):
         self.filename = filename
-        self.data = PreprocessorFile(filename).to_xarray_dataset()
+        preprocessor_file = PreprocessorFile(filename, mmap=True)
+        self.data = preprocessor_file.to_xarray_dataset(variables=variables)
         self.normalizer = normalizer
 
         self.n_scans = self.data.scans.size
@@ -44,32 +55,12 @@ class InputData(Dataset):
         i_start = i * self.scans_per_batch
         i_end = (i + 1) * self.scans_per_batch
 
-        bts = self.data["brightness_temperatures"][i_start:i_end, :, :].data
-        bts = bts.reshape(-1, N_CHANNELS)
-
-        # 2m temperature
-        t2m = self.data["two_meter_temperature"][i_start:i_end, :].data
-        t2m = t2m.reshape(-1, 1)
-        # Total precipitable water.
-        tcwv = self.data["total_column_water_vapor"][i_start:i_end, :].data
-        tcwv = tcwv.reshape(-1, 1)
-
-        # Surface type
-        n = bts.shape[0]
-        st = self.data["surface_type"][i_start:i_end, :].data
-        st = st.reshape(-1, 1).astype(int)
-        n_types = 19
-        st_1h = np.zeros((n, n_types), dtype=np.float32)
-        st_1h[np.arange(n), st.ravel()] = 1.0
-
-        # Airmass type
-        am = self.data["airmass_type"][i_start:i_end, :].data
-        am = np.maximum(am.reshape(-1, 1).astype(int), 0)
-        n_types = 4
-        am_1h = np.zeros((n, n_types), dtype=np.float32)
-        am_1h[np.arange(n), am.ravel()] = 1.0
-
-        x = np.concatenate([bts, t2m, tcwv, st_1h, am_1h], axis=1)
+        data = self.data[{"scans": slice(i_start, i_end)}]
+        x = get_input_features(data["brightness_temperatures"].data,
+                               data["two_meter_temperature"].data,
+                               data["total_column_water_vapor"].data,
+                               data["surface_type"].data,
+                               data["airmass_type"].data)
         return self.normalizer(x)
 
     def get_conv_input(self, i):
@@ -1,5 +1,93 @@
+from contextlib import contextmanager
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
 import numpy as np
 
+# Semi-major axis and flattening of the WGS84 ellipsoid.
+WGS84_A = 6378137.0
+WGS84_F = 1.0 / 298.257223563
+
+
+@contextmanager
+def atomic_write(filename, mode="wb", fsync=False):
+    """
+    Context manager to atomically write a file.
+
+    The content is written to a temporary file in the same directory,
+    which replaces the target file only if the block exits without an
+    exception. Readers therefore see either the old or the complete new
+    file and concurrent writers never write to the same temporary file.
+
+    Args:
+        filename: The file to write.
+        mode: The mode in which to open the temporary file.
+        fsync: Whether to flush the file to disk before it replaces the
+            target file.
+
+    Yields:
+        The open temporary file.
+    """
+    filename = Path(filename)
+    with NamedTemporaryFile(mode=mode,
+                            dir=filename.parent,
+                            prefix=filename.name + ".",
+                            suffix=".tmp",
+                            delete=False) as file:
+        try:
+            yield file
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, filename)
+
+
+def to_ecef(lats, lons, alts=None):
+    """
+    Convert geodetic coordinates on the WGS84 ellipsoid to Earth-centered,
+    Earth-fixed (ECEF) Cartesian coordinates.
+
+    The conversion is computed in closed form in the floating point
+    precision of the input, but at least single precision.
+
+    Args:
+        lats: Array containing the latitudes in degrees.
+        lons: Array of the same shape as ``lats`` containing the longitudes
+            in degrees.
+        alts: Optional array containing the altitudes above the ellipsoid
+            in meters. Defaults to zero.
+    Return:
+        Array of shape ``(n, 3)`` containing the x, y and z coordinates in
+        meters of the flattened input points.
+    """
+    lats = np.asarray(lats).ravel()
+    lons = np.asarray(lons).ravel()
+    dtype = np.result_type(lats, lons, np.float32)
+
+    lats = np.deg2rad(lats, dtype=dtype)
+    lons = np.deg2rad(lons, dtype=dtype)
+    if alts is None:
+        alts = dtype.type(0.0)
+    else:
+        alts = np.asarray(alts, dtype=dtype).ravel()
+
+    e_2 = WGS84_F * (2.0 - WGS84_F)
+    sin_lats = np.sin(lats)
+    cos_lats = np.cos(lats)
+    n = dtype.type(WGS84_A) / np.sqrt(1.0 - dtype.type(e_2) * sin_lats ** 2)
+
+    coords = np.empty((lats.size, 3), dtype=dtype)
+    coords[:, 0] = (n + alts) * cos_lats * np.cos(lons)
+    coords[:, 1] = (n + alts) * cos_lats * np.sin(lons)
+    coords[:, 2] = (dtype.type(1.0 - e_2) * n + alts) * sin_lats
+    return coords
+
+
 def compute_roc(p,
                 y_true,
                 thresholds=np.linspace(0, 1, 11)):
@@ -0,0 +1,89 @@
+"""
+Benchmark comparing the in-memory and the memory-mapped reader modes of
+GPROFGMIBinFile.
+
+For each mode, the extraction of the requested fraction of every bin file
+is run in a fresh process so that the reported peak resident set size
+(RSS) is not influenced by the other mode. Since memory-mapped pages
+are shared through the page cache, the peak private (anonymous) RSS,
+which is what each worker process of the FileProcessor adds, is reported
+as well.
+"""
+import argparse
+from multiprocessing import get_context
+from pathlib import Path
+import resource
+from time import perf_counter
+
+from regn.data.csu.bin import GPM_FILE_REGEXP, GPROFGMIBinFile
+
+
+def _get_private_rss():
+    """
+    Return the anonymous (private) part of the resident set size in kB.
+    Memory-mapped file pages are shared through the page cache and are
+    therefore not included.
+    """
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _run(files, start, end, mmap, results):
+    """
+    Extract data from all files and report timing and peak RSS.
+    """
+    n_samples = 0
+    private_rss = 0
+    time = 0.0
+    for f in files:
+        t_start = perf_counter()
+        input_file = GPROFGMIBinFile(f, mmap=mmap)
+        data = input_file.load_data(start, end)
+        time += perf_counter() - t_start
+        n_samples += data["surface_precip"].size
+        private_rss = max(private_rss, _get_private_rss())
+        del input_file, data
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((time, peak_rss, private_rss, n_samples))
+
+
+if __name__ == "__main__":
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(
+        description="Benchmark memory-mapped reading of GPROF bin files."
+    )
+    parser.add_argument('input_path', metavar='path', type=str, nargs=1,
+                        help='Path to a bin file or a folder containing bin files.')
+    parser.add_argument('--start', metavar='start_fraction', type=float, default=0.0,
+                        help='Fractional start of sample range to extract from each bin file.')
+    parser.add_argument('--end', metavar='end_fraction', type=float, default=0.1,
+                        help='Fractional end of sample range to extract from each bin file.')
+    args = parser.parse_args()
+    input_path = Path(args.input_path[0])
+
+    if input_path.is_dir():
+        files = sorted([f for f in input_path.iterdir()
+                        if GPM_FILE_REGEXP.match(f.name)])
+    else:
+        files = [input_path]
+    size = sum([f.stat().st_size for f in files]) / 1e6
+
+    print(f"\nExtracting fraction [{args.start}, {args.end}) from {len(files)} "
+          f"files ({size:.1f} MB).\n")
+    print(f"{'Mode':>10} {'Time / file [ms]':>18} {'Peak RSS [MB]':>15} "
+          f"{'Private RSS [MB]':>18} {'Samples':>10}")
+
+    context = get_context("spawn")
+    for name, mmap in [("fromfile", False), ("memmap", True)]:
+        results = context.Queue()
+        process = context.Process(target=_run,
+                                  args=(files, args.start, args.end, mmap, results))
+        process.start()
+        time, peak_rss, private_rss, n_samples = results.get()
+        process.join()
+        print(f"{name:>10} {1e3 * time / len(files):18.2f} {peak_rss / 1e3:15.1f} "
+              f"{private_rss / 1e3:18.1f} {n_samples:10}")
@@ -0,0 +1,174 @@
+"""
+Throughput benchmarks for the processing of the GPROF binary file formats.
+
+The benchmarks are run on synthetic files generated using the
+regn.data.csu.synthetic module, so that they can be run at production scale
+without access to the GPROF data. For each benchmark the throughput in files
+per second and MB per second of input data is reported. The results can be
+written to a JSON file to compare them across revisions.
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import numpy as np
+
+from regn.data.csu import synthetic
+from regn.data.csu.bin import FileProcessor
+from regn.data.csu.preprocessor import PreprocessorFile
+from regn.data.csu.retrieval import RetrievalFile
+from regn.data.csu.sim import GPROFGMISimFile
+
+
+def _setup_bin(path, args):
+    path.mkdir()
+    files = []
+    for i in range(args.n_files):
+        files.append(synthetic.write_bin_file(path,
+                                              temperature=250 + i,
+                                              n_profiles=args.n_profiles,
+                                              seed=i))
+    return files
+
+
+def _run_bin(files, args):
+    processor = FileProcessor(files[0].parent)
+    output_file = files[0].parent.parent / "bin.nc"
+    processor.run_async(output_file, 0.0, 1.0, args.n_processes)
+    output_file.unlink()
+
+
+def _setup_preprocessor(path, args):
+    path.mkdir()
+    return [synthetic.write_preprocessor_file(path / f"{i:06}.pp",
+                                              n_scans=args.n_scans,
+                                              granule=i,
+                                              seed=i)
+            for i in range(args.n_files)]
+
+
+def _run_preprocessor(files, args):
+    for f in files:
+        PreprocessorFile(f).to_xarray_dataset()
+
+
+def _setup_retrieval(path, args):
+    path.mkdir()
+    return [synthetic.write_retrieval_file(path / f"{i:06}.BIN.gz",
+                                           n_scans=args.n_scans,
+                                           granule=i,
+                                           seed=i)
+            for i in range(args.n_files)]
+
+
+def _run_retrieval(files, args):
+    for f in files:
+        RetrievalFile(f).to_xarray_dataset()
+
+
+def _sample_scans(files, cache=None, n_scans=100):
+    rng = np.random.default_rng(0)
+    for f in files:
+        retrieval_file = RetrievalFile(f, cache=cache)
+        for i in rng.choice(retrieval_file.n_scans, n_scans):
+            retrieval_file.get_scan(i)
+
+
+def _run_retrieval_sample(files, args):
+    _sample_scans(files)
+
+
+def _run_retrieval_sample_cached(files, args):
+    _sample_scans(files, cache=files[0].parent / "cache")
+
+
+def _setup_sim(path, args):
+    path.mkdir()
+    start = datetime(2019, 1, 1)
+    files = []
+    for i in range(args.n_files):
+        files.append(synthetic.write_sim_file(path,
+                                              n_scans=args.n_scans,
+                                              granule=i,
+                                              start_time=start + timedelta(days=i),
+                                              seed=i))
+    return files
+
+
+def _run_sim(files, args):
+    for f in files:
+        sim_file = GPROFGMISimFile(f)
+        preprocessor_file = f.parent / synthetic.get_preprocessor_filename(
+            sim_file.granule,
+            datetime(sim_file.year, sim_file.month, sim_file.day)
+        )
+        data = PreprocessorFile(preprocessor_file).to_xarray_dataset()
+        sim_file.match_surface_precip(data)
+
+
+BENCHMARKS = {
+    "bin": (_setup_bin, _run_bin),
+    "preprocessor": (_setup_preprocessor, _run_preprocessor),
+    "retrieval": (_setup_retrieval, _run_retrieval),
+    "retrieval_sample": (_setup_retrieval, _run_retrieval_sample),
+    "retrieval_sample_cached": (_setup_retrieval, _run_retrieval_sample_cached),
+    "sim": (_setup_sim, _run_sim),
+}
+
+
+if __name__ == "__main__":
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(
+        description="Benchmark the processing of GPROF binary files."
+    )
+    parser.add_argument('benchmarks', metavar='benchmark', type=str, nargs='*',
+                        default=list(BENCHMARKS.keys()),
+                        help=f'The benchmarks to run: {list(BENCHMARKS.keys())}')
+    parser.add_argument('--n_files', metavar='n', type=int, default=8,
+                        help='Number of files to generate for each benchmark.')
+    parser.add_argument('--n_profiles', metavar='n', type=int, default=100_000,
+                        help='Number of profiles in each bin file.')
+    parser.add_argument('--n_scans', metavar='n', type=int, default=2963,
+                        help='Number of scans in each orbit file.')
+    parser.add_argument('--n_processes', metavar='n', type=int, default=4,
+                        help='Number of processes used by the FileProcessor.')
+    parser.add_argument('--repeats', metavar='n', type=int, default=3,
+                        help='Number of times to run each benchmark. The '
+                        'fastest run is reported.')
+    parser.add_argument('--output', metavar='file', type=str,
+                        help='JSON file to write the results to.')
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'Benchmark':>24} {'Files':>6} {'Size [MB]':>10} {'Time [s]':>9} "
+          f"{'Files / s':>10} {'MB / s':>8}")
+    with TemporaryDirectory() as tmp:
+        for name in args.benchmarks:
+            setup, run = BENCHMARKS[name]
+            files = setup(Path(tmp) / name, args)
+            size = sum([f.stat().st_size for f in files]) / 1e6
+
+            times = []
+            for i in range(args.repeats):
+                t_start = perf_counter()
+                run(files, args)
+                times.append(perf_counter() - t_start)
+            time = min(times)
+
+            results[name] = {"n_files": len(files),
+                             "size": size,
+                             "time": time,
+                             "files_per_second": len(files) / time,
+                             "mb_per_second": size / time}
+            print(f"{name:>24} {len(files):6} {size:10.1f} {time:9.2f} "
+                  f"{len(files) / time:10.2f} {size / time:8.1f}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"arguments": vars(args), "results": results},
+                      output,
+                      indent=2)
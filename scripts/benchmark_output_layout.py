@@ -0,0 +1,69 @@
+"""
+Benchmark comparing the layouts of the NetCDF files produced by the
+FileProcessor.
+
+For each layout the data from the bin files in the given folder is
+extracted and the write time, the size of the output file and the
+throughput of loading the file into a GPROFDataset are reported.
+"""
+import argparse
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from regn.data.csu.bin import CHUNK_SIZE, FileProcessor
+from regn.data.csu.training_data import GPROFDataset
+
+LAYOUTS = {
+    "default": {"chunk_size": None},
+    "chunked": {"chunk_size": CHUNK_SIZE},
+    "preallocated": {"chunk_size": CHUNK_SIZE, "preallocate": True},
+    "compressed": {"chunk_size": CHUNK_SIZE,
+                   "preallocate": True,
+                   "compression": 4},
+}
+
+if __name__ == "__main__":
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(
+        description="Benchmark output file layouts for extracted bin data."
+    )
+    parser.add_argument('input_path', metavar='path', type=str, nargs=1,
+                        help='Path to folder containing the bin files.')
+    parser.add_argument('--start', metavar='start_fraction', type=float, default=0.0,
+                        help='Fractional start of sample range to extract from each bin file.')
+    parser.add_argument('--end', metavar='end_fraction', type=float, default=1.0,
+                        help='Fractional end of sample range to extract from each bin file.')
+    parser.add_argument('-n', metavar='n_procs', type=int, default=4,
+                        help='Number of processes to use.')
+    args = parser.parse_args()
+
+    processor = FileProcessor(args.input_path[0])
+    print(f"\nFound {len(processor.files)} matching files in "
+          f"{args.input_path[0]}.\n")
+
+    results = []
+    with TemporaryDirectory() as tmp:
+        for name, layout in LAYOUTS.items():
+            output_file = Path(tmp) / f"{name}.nc"
+
+            t_start = perf_counter()
+            processor.run_async(output_file, args.start, args.end, args.n, **layout)
+            t_write = perf_counter() - t_start
+            size = output_file.stat().st_size / 1e6
+
+            t_start = perf_counter()
+            dataset = GPROFDataset(output_file,
+                                   normalize=False,
+                                   transform_zero_rain=False,
+                                   shuffle=False)
+            t_read = perf_counter() - t_start
+            n_samples = dataset.x.shape[0]
+            results.append((name, t_write, size, n_samples / t_read / 1e3))
+
+    print()
+    print(f"{'Layout':>14} {'Write time [s]':>16} {'Size [MB]':>11} "
+          f"{'Read [1000 samples / s]':>24}")
+    for name, t_write, size, throughput in results:
+        print(f"{name:>14} {t_write:16.2f} {size:11.1f} {throughput:24.1f}")
@@ -3,31 +3,68 @@ Command line program to extract training, validation and test data from GPROF
 binary files.
 """
 import argparse
-from regn.data.csu import FileProcessor
+from regn.data.csu.bin import FileProcessor
 
 # Parse arguments
 parser = argparse.ArgumentParser(description="Extract data from GPROF files.")
 parser.add_argument('input_path', metavar='path', type=str, nargs=1,
                     help='Path to folder containing input data.')
-parser.add_argument('output_file', metavar="output_file", type=str, nargs=1,
+parser.add_argument('output_file', metavar="output_file", type=str, nargs='?',
                     help='Filename to store extracted data to.')
 parser.add_argument('--start', metavar='start_fraction', type=float, nargs=1,
                     help='Fractional start of sample range to extract from each bin file.')
 parser.add_argument('--end', metavar='start_fraction', type=float, nargs=1,
                     help='Fractional end of sample range to extract from each bin file.')
+parser.add_argument('--split', metavar=('output_file', 'start', 'end'), nargs=3,
+                    action='append',
+                    help='Output file and fractional sample range of a split to '
+                    'extract. Can be given multiple times to extract several '
+                    'splits in one pass over the input files.')
 parser.add_argument('-n', metavar='n_procs', type=int, nargs=1,
                     help='Number of processes to use.')
+parser.add_argument('--shards', metavar='n_shards', type=int, nargs=1,
+                    help='Write data to this number of shards, which are merged '
+                    'after the extraction.')
+parser.add_argument('--max_samples', metavar='n', type=int, nargs=1,
+                    help='Maximum number of samples to extract for each '
+                    '(surface type, temperature, tpw) bin.')
+parser.add_argument('--resume', action='store_true',
+                    help='Resume an interrupted extraction into the same output '
+                    'files.')
+parser.add_argument('--preallocate', action='store_true',
+                    help='Preallocate the samples dimension of the output files.')
+parser.add_argument('--compression', metavar='level', type=int, nargs=1,
+                    help='Compress output files using zlib with this level.')
+parser.add_argument('--profiles', action='store_true',
+                    help='Include the hydrometeor and latent heat profiles.')
+parser.add_argument('--compact_profiles', action='store_true',
+                    help='Store profiles quantized and compressed.')
 args = parser.parse_args()
 input_path = args.input_path[0]
-output_file = args.output_file[0]
-start = args.start[0]
-end = args.end[0]
 n  = args.n[0]
+n_shards = args.shards[0] if args.shards else None
+max_samples = args.max_samples[0] if args.max_samples else None
+compression = args.compression[0] if args.compression else None
+
+splits = {}
+if args.output_file:
+    splits[args.output_file] = (args.start[0], args.end[0])
+if args.split:
+    for output_file, start, end in args.split:
+        splits[output_file] = (float(start), float(end))
 
 # Run processing.
 processor = FileProcessor(input_path)
 print(f"\nFound {len(processor.files)} matching files in {input_path}.\n")
 print(f"Starting extraction of data:")
-processor.run_async(output_file, start, end, n)
+processor.run_async_splits(splits,
+                           n,
+                           n_shards=n_shards,
+                           resume=args.resume,
+                           max_samples=max_samples,
+                           preallocate=args.preallocate,
+                           compression=compression,
+                           include_profiles=args.profiles,
+                           compact_profiles=args.compact_profiles)
 
 
@@ -13,18 +13,47 @@ parser.add_argument('l1c_path', metavar="path", type=str, nargs=1,
                     help='Path to the root of the directory tree containing the L1C files.')
 parser.add_argument('output_file', metavar="path", type=str, nargs=1,
                     help='Name of the outputfile to store the extracted data to')
-parser.add_argument('--days', metavar='[...]', type=float, nargs="+",
+parser.add_argument('--days', metavar='[...]', type=int, nargs="+",
                     help='Day indices for which to extract data for each month.')
+parser.add_argument('--resume', action='store_true',
+                    help='Resume an interrupted extraction into the same output '
+                    'file.')
+parser.add_argument('--cache', metavar='path', type=str, nargs=1,
+                    help='Directory in which to cache the preprocessor data.')
+parser.add_argument('--cache_size', metavar='GB', type=float, nargs=1,
+                    default=[50.0], help='Maximum size of the cache.')
+parser.add_argument('--n_workers', metavar='n', type=int, nargs=1,
+                    default=[4], help='Number of matching worker processes.')
+parser.add_argument('--n_preprocessors', metavar='n', type=int, nargs=1,
+                    default=[4], help='Maximum number of concurrently '
+                    'running preprocessor processes.')
+parser.add_argument('--scratch', metavar='path', type=str, nargs=1,
+                    help='Directory for the temporary preprocessor output.')
+parser.add_argument('--stride', metavar='n', type=int, nargs=1,
+                    help='Number of scans between consecutive scenes. Scenes '
+                    'overlap if it is smaller than the scene size of 128.')
+parser.add_argument('--min_coverage', metavar='fraction', type=float, nargs=1,
+                    default=[0.0], help='Minimum fraction of pixels with '
+                    'valid surface precipitation in each scene.')
 args = parser.parse_args()
-sim_file_path = args.sim_file.path[0]
+sim_file_path = args.sim_file_path[0]
 l1c_path = args.l1c_path[0]
 output_file = args.output_file[0]
 days = args.days
+cache = args.cache[0] if args.cache else None
+cache_size = int(args.cache_size[0] * 2 ** 30)
 
 # Run processing.
 processor = SimFileProcessor(sim_file_path,
                              l1c_path,
                              output_file,
-                             days)
-processor.run(output_file)
+                             n_workers=args.n_workers[0],
+                             days=days,
+                             resume=args.resume,
+                             cache=cache,
+                             cache_size=cache_size,
+                             scene_stride=args.stride[0] if args.stride else None,
+                             min_coverage=args.min_coverage[0])
+processor.run_async(n_preprocessors=args.n_preprocessors[0],
+                    scratch=args.scratch[0] if args.scratch else None)
 
@@ -0,0 +1,38 @@
+"""
+Command line program to index GPROF preprocessor and retrieval files and
+to find the files covering a given time range or granules.
+"""
+import argparse
+from datetime import datetime
+
+from regn.data.csu.index import GranuleIndex
+
+# Parse arguments
+parser = argparse.ArgumentParser(
+    description="Find GPROF preprocessor and retrieval files."
+)
+parser.add_argument('path', metavar='path', type=str, nargs=1,
+                    help='Root of the directory tree containing the files.')
+parser.add_argument('--start', metavar='start', type=str, nargs=1,
+                    help='Start of the time range in ISO format.')
+parser.add_argument('--end', metavar='end', type=str, nargs=1,
+                    help='End of the time range in ISO format.')
+parser.add_argument('--granules', metavar='granule', type=int, nargs='+',
+                    help='Granule numbers to find.')
+parser.add_argument('--type', metavar='type', type=str, nargs=1,
+                    help="File type to find: 'preprocessor' or 'retrieval'.")
+parser.add_argument('--no-update', dest='update', action='store_false',
+                    help='Use the stored index without scanning the '
+                    'directory tree for new or modified files.')
+args = parser.parse_args()
+
+start = datetime.fromisoformat(args.start[0]) if args.start else None
+end = datetime.fromisoformat(args.end[0]) if args.end else None
+file_type = args.type[0] if args.type else None
+
+index = GranuleIndex(args.path[0], update=args.update)
+for f in index.find_files(start=start,
+                          end=end,
+                          granules=args.granules,
+                          file_type=file_type):
+    print(f)
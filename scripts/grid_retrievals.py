@@ -0,0 +1,52 @@
+"""
+Command line program to accumulate GPROF retrieval files on a regular
+latitude-longitude grid and write the gridded means and counts to a
+NetCDF file.
+"""
+import argparse
+from datetime import datetime
+
+from regn.data.csu.index import GranuleIndex
+from regn.data.csu.level3 import Level3Grid, grid_retrieval_files
+
+# Parse arguments
+parser = argparse.ArgumentParser(
+    description="Grid GPROF retrieval files."
+)
+parser.add_argument('path', metavar='path', type=str, nargs=1,
+                    help='Root of the directory tree containing the files.')
+parser.add_argument('output', metavar='output', type=str, nargs=1,
+                    help='The NetCDF file to write the gridded data to.')
+parser.add_argument('--start', metavar='start', type=str, nargs=1,
+                    help='Start of the time range in ISO format.')
+parser.add_argument('--end', metavar='end', type=str, nargs=1,
+                    help='End of the time range in ISO format.')
+parser.add_argument('--resolution', metavar='degrees', type=float, nargs=1,
+                    default=[1.0], help='The size of the grid cells.')
+parser.add_argument('--n_processes', metavar='n', type=int, nargs=1,
+                    default=[4], help='The number of processes to use.')
+parser.add_argument('--partial', metavar='file', type=str, nargs='+',
+                    help='Grids saved by previous runs to merge into the '
+                    'output.')
+parser.add_argument('--save', metavar='file', type=str, nargs=1,
+                    help='File to save the accumulated grid to, so that it '
+                    'can be merged with other runs.')
+parser.add_argument('--no-update', dest='update', action='store_false',
+                    help='Use the stored index without scanning the '
+                    'directory tree for new or modified files.')
+args = parser.parse_args()
+
+start = datetime.fromisoformat(args.start[0]) if args.start else None
+end = datetime.fromisoformat(args.end[0]) if args.end else None
+
+index = GranuleIndex(args.path[0], update=args.update)
+files = index.find_files(start=start, end=end, file_type="retrieval")
+grid = grid_retrieval_files(files,
+                            resolution=args.resolution[0],
+                            n_processes=args.n_processes[0])
+for f in args.partial or []:
+    grid.merge(Level3Grid.load(f))
+
+if args.save:
+    grid.save(args.save[0])
+grid.to_xarray_dataset().to_netcdf(args.output[0])
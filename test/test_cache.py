@@ -0,0 +1,65 @@
+"""
+Tests for the preprocessor cache.
+"""
+import os
+
+from regn.data.csu.cache import PreprocessorCache, get_preprocessor_version
+from regn.data.csu.preprocessor import PreprocessorFile
+from regn.data.csu.sim import GPROFGMISimFile, _run_preprocessor
+from regn.data.csu.synthetic import get_preprocessor_filename, write_sim_file
+
+
+def test_preprocessor_cache(tmp_path):
+    """
+    Ensure that cached data is identical to the decoded data, that the
+    cache is keyed by the preprocessor version and that the least recently
+    used entries are evicted.
+    """
+    sim_file = GPROFGMISimFile(write_sim_file(tmp_path, n_scans=20, seed=0))
+    preprocessor_file = tmp_path / get_preprocessor_filename(1)
+    data = PreprocessorFile(preprocessor_file).to_xarray_dataset()
+    l1c_files = []
+    for i in range(3):
+        l1c_files.append(tmp_path / f"{i}.HDF5")
+        l1c_files[-1].write_bytes(bytes([i]))
+
+    cache = PreprocessorCache(tmp_path / "cache", "v1")
+    assert cache.get(l1c_files[0]) is None
+    assert _run_preprocessor(sim_file, l1c_files[0], cache=cache).identical(data)
+
+    # Cached data is used even if the preprocessor output is gone.
+    preprocessor_file.unlink()
+    cached = _run_preprocessor(sim_file, l1c_files[0], cache=cache)
+    assert cached.identical(data)
+    assert PreprocessorCache(tmp_path / "cache", "v2").get(l1c_files[0]) is None
+
+    size = cache.get_filename(l1c_files[0]).stat().st_size
+    cache = PreprocessorCache(tmp_path / "cache", "v1", max_size=2 * size)
+    cache.put(l1c_files[1], data)
+    os.utime(cache.get_filename(l1c_files[0]), (0, 0))
+    os.utime(cache.get_filename(l1c_files[1]), (1, 1))
+    assert cache.get(l1c_files[0]) is not None
+    cache.put(l1c_files[2], data)
+    assert cache.get(l1c_files[1]) is None
+    assert cache.get(l1c_files[0]) is not None
+    assert cache.get(l1c_files[2]) is not None
+    assert not list((tmp_path / "cache").glob("*.tmp"))
+
+
+def test_get_preprocessor_version(tmp_path):
+    """
+    Ensure that the preprocessor version changes when the executable is
+    replaced.
+    """
+    executable = tmp_path / "preprocessor"
+    executable.write_text("#!/bin/sh\n")
+    executable.chmod(0o755)
+    link = tmp_path / "link"
+    link.symlink_to(executable)
+
+    version = get_preprocessor_version(executable)
+    assert get_preprocessor_version(link) == version
+
+    os.utime(executable, (0, 0))
+    assert get_preprocessor_version(executable) != version
+    assert get_preprocessor_version("no_such_preprocessor") == "no_such_preprocessor"
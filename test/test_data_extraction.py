@@ -3,10 +3,19 @@ Tests to test the extraction of training data from the GPROF
 retrieval database.
 """
 from pathlib import Path
+import shutil
 
 import numpy as np
-from regn.data.csu.bin import (FileProcessor,
-                               GPROFGMIBinFile)
+import pytest
+from regn.data.csu.bin import (BinFileCatalog,
+                               FileProcessor,
+                               GPROFGMIBinFile,
+                               GPROFGMIOutputFile,
+                               GMI_BIN_RECORD_TYPES,
+                               PROFILE_SIGNIFICANT_DIGITS,
+                               PROFILE_NAMES,
+                               get_quotas)
+from regn.data.csu.manifest import truncate_samples
 from regn.data.csu.training_data import GPROFDataset
 from regn.data.csu.retrieval import (ORBIT_HEADER_TYPES,
                                      PROFILE_INFO_TYPES,
@@ -14,6 +23,23 @@ from regn.data.csu.retrieval import (ORBIT_HEADER_TYPES,
                                      DATA_RECORD_TYPES)
 from netCDF4 import Dataset
 
+BIN_FILE = Path(__file__).parent / "data" / "gpm_300_40_00_18.bin"
+
+
+@pytest.fixture
+def bin_files(tmp_path):
+    """
+    Factory that copies the test bin file to the given names in a new
+    folder and returns the folder.
+    """
+    def make_bin_files(names):
+        input_path = tmp_path / "input"
+        input_path.mkdir(exist_ok=True)
+        for name in names:
+            shutil.copy(BIN_FILE, input_path / name)
+        return input_path
+    return make_bin_files
+
 
 def test_file_processor(tmp_path):
     """
@@ -46,6 +72,260 @@ def test_file_processor(tmp_path):
                              airmass_types))
 
 
+def test_bin_file_mmap():
+    """
+    Ensure that data loaded from a memory-mapped bin file matches the
+    data loaded from the file read into memory.
+    """
+    path = Path(__file__).parent
+    filename = path / "data" / "gpm_300_40_00_18.bin"
+    input_file = GPROFGMIBinFile(filename, include_profiles=True)
+    input_file_mmap = GPROFGMIBinFile(filename,
+                                      include_profiles=True,
+                                      mmap=True)
+    assert input_file.n_profiles == input_file_mmap.n_profiles
+
+    data = input_file.load_data(0.2, 0.8)
+    data_mmap = input_file_mmap.load_data(0.2, 0.8)
+    for k in data:
+        assert np.all(np.isclose(data[k], data_mmap[k]))
+
+
+def test_output_file_buffering(tmp_path):
+    """
+    Ensure that buffered writing to the output file yields the same
+    data as writing the data directly.
+    """
+    path = Path(__file__).parent
+    input_file = GPROFGMIBinFile(path / "data" / "gpm_300_40_00_18.bin")
+    data = [input_file.load_data(0.0, 0.5), input_file.load_data(0.5, 1.0)]
+
+    output_file = GPROFGMIOutputFile(tmp_path / "direct.nc")
+    for d in data:
+        output_file.add_data(d)
+
+    output_file_buffered = GPROFGMIOutputFile(tmp_path / "buffered.nc",
+                                              buffer_size=4)
+    with output_file_buffered:
+        for d in data:
+            output_file_buffered.add_data(d)
+
+    with Dataset(tmp_path / "direct.nc") as direct:
+        with Dataset(tmp_path / "buffered.nc") as buffered:
+            assert direct.dimensions["samples"].size == input_file.n_profiles
+            for k in direct.variables:
+                assert np.all(np.isclose(direct[k][:], buffered[k][:]))
+
+
+def test_file_processor_shards(tmp_path, bin_files):
+    """
+    Ensure that extracting data into merged shards yields the same
+    data as extracting into a single file.
+    """
+    input_path = bin_files(["gpm_300_40_00_18.bin",
+                 "gpm_290_40_00_18.bin",
+                 "gpm_300_30_01_18.bin"])
+
+    processor = FileProcessor(input_path)
+    processor.run_async(tmp_path / "single.nc", 0.0, 1.0, 1)
+    shards = processor.run_async(tmp_path / "sharded.nc", 0.0, 1.0, 2,
+                                 n_shards=2, merge=False)
+    assert len(shards) == 2
+    assert all([shard.exists() for shard in shards])
+    processor.run_async(tmp_path / "merged.nc", 0.0, 1.0, 2, n_shards=2)
+    assert not any([shard.exists() for shard in tmp_path.glob("merged_*")])
+
+    with Dataset(tmp_path / "single.nc") as single:
+        with Dataset(tmp_path / "merged.nc") as merged:
+            assert (single.dimensions["samples"].size
+                    == merged.dimensions["samples"].size)
+            assert np.all(single.frequencies == merged.frequencies)
+            for k in single.variables:
+                assert np.isclose(single[k][:].sum(), merged[k][:].sum())
+
+
+def test_file_processor_splits(tmp_path):
+    """
+    Ensure that extracting several splits in one pass yields the same
+    data as extracting each split separately.
+    """
+    path = Path(__file__).parent
+    processor = FileProcessor(path / "data")
+    splits = {tmp_path / "training.nc": (0.0, 0.5),
+              tmp_path / "test.nc": (0.5, 1.0)}
+    processor.run_async_splits(splits, n_processes=1)
+    processor.run_async_splits({tmp_path / "test_sharded.nc": (0.5, 1.0)},
+                               n_processes=1,
+                               n_shards=1)
+    processor.run_async(tmp_path / "training_ref.nc", 0.0, 0.5, 1)
+    processor.run_async(tmp_path / "test_ref.nc", 0.5, 1.0, 1)
+
+    for name, ref in [("training.nc", "training_ref.nc"),
+                      ("test.nc", "test_ref.nc"),
+                      ("test_sharded.nc", "test_ref.nc")]:
+        with Dataset(tmp_path / name) as split:
+            with Dataset(tmp_path / ref) as split_ref:
+                for k in split_ref.variables:
+                    assert np.all(np.isclose(split[k][:], split_ref[k][:]))
+
+
+def test_bin_file_catalog(tmp_path, bin_files):
+    """
+    Ensure that the bin file catalog records the file metadata and is
+    updated when files change.
+    """
+    input_path = bin_files(["gpm_300_40_00_18.bin", "gpm_290_30_01_02.bin"])
+
+    catalog = BinFileCatalog(input_path)
+    assert catalog.filename.exists()
+    assert len(catalog) == 2
+
+    input_file = GPROFGMIBinFile(input_path / "gpm_300_40_00_18.bin")
+    assert np.all(catalog.entries["n_profiles"] == input_file.n_profiles)
+    assert np.all(np.isclose(catalog.entries["frequencies"],
+                             input_file.get_attributes()["frequencies"]))
+
+    entries = catalog.select(surface_types=[2])
+    assert entries.size == 1
+    assert entries["airmass_type"][0] == 1
+    assert entries["temperature"][0] == 290.0
+
+    # Truncate file and add new one.
+    with open(input_path / "gpm_300_40_00_18.bin", "r+b") as file:
+        file.truncate(file.seek(0, 2) - 2 * GMI_BIN_RECORD_TYPES.itemsize)
+    bin_files(["gpm_250_40_00_18.bin"])
+    catalog = BinFileCatalog(input_path)
+    assert len(catalog) == 3
+    entries = catalog.select(st_min=300.0)
+    assert entries["n_profiles"][0] == input_file.n_profiles - 2
+
+    processor = FileProcessor(input_path, surface_types=[18])
+    assert len(processor.files) == 2
+
+
+def test_file_processor_resume(tmp_path, bin_files):
+    """
+    Ensure that resuming an interrupted extraction skips processed files
+    and discards uncommitted data.
+    """
+    input_path = bin_files(["gpm_300_40_00_18.bin",
+                 "gpm_290_40_00_18.bin",
+                 "gpm_280_30_01_18.bin"])
+
+    processor = FileProcessor(input_path)
+    processor.run_async(tmp_path / "reference.nc", 0.0, 1.0, 1)
+
+    # Interrupted run: Only two files processed and partially written
+    # data from a third.
+    output_file = tmp_path / "resumed.nc"
+    FileProcessor(input_path, st_min=285).run_async(output_file, 0.0, 1.0, 1)
+    with Dataset(output_file, "r+") as handle:
+        n = handle.dimensions["samples"].size
+        handle["surface_precip"][n:n + 3] = 1.0
+
+    processor.run_async(output_file, 0.0, 1.0, 1, resume=True)
+    with Dataset(tmp_path / "reference.nc") as reference:
+        with Dataset(output_file) as resumed:
+            assert (reference.dimensions["samples"].size
+                    == resumed.dimensions["samples"].size)
+            assert np.all(reference.frequencies == resumed.frequencies)
+            for k in reference.variables:
+                assert np.isclose(reference[k][:].sum(), resumed[k][:].sum())
+
+
+def test_file_processor_quotas(tmp_path, bin_files):
+    """
+    Ensure that the number of extracted samples per bin is limited to
+    the requested quota.
+    """
+    input_path = bin_files(["gpm_300_40_00_18.bin",
+                 "gpm_300_40_01_18.bin",
+                 "gpm_290_40_00_18.bin"])
+
+    processor = FileProcessor(input_path)
+    n = processor.entries["n_profiles"][0]
+    quotas = get_quotas(processor.entries, [(0.0, 1.0)], n - 2)
+    assert quotas.sum() == 2 * (n - 2)
+    temperatures = processor.entries["temperature"]
+    assert np.all(quotas[temperatures == 300.0].ravel() == (n - 2) // 2)
+
+    output_file = tmp_path / "output.nc"
+    processor.run_async(output_file, 0.0, 1.0, 1, max_samples=n - 2)
+    with Dataset(output_file) as handle:
+        assert handle.dimensions["samples"].size == 2 * (n - 2)
+        assert np.sum(handle["temperature"][:] == 290.0) == n - 2
+
+
+def test_file_processor_preallocate(tmp_path, bin_files):
+    """
+    Ensure that extracting data into preallocated, compressed files yields
+    the same data as extracting into a file with unlimited dimension.
+    """
+    input_path = bin_files(["gpm_300_40_00_18.bin",
+                 "gpm_290_40_00_18.bin",
+                 "gpm_280_30_01_18.bin"])
+
+    processor = FileProcessor(input_path)
+    processor.run_async(tmp_path / "reference.nc", 0.1, 0.9, 1)
+    processor.run_async(tmp_path / "preallocated.nc", 0.1, 0.9, 1,
+                        preallocate=True,
+                        chunk_size=16,
+                        compression=4)
+    processor.run_async(tmp_path / "sharded.nc", 0.1, 0.9, 2,
+                        n_shards=2,
+                        preallocate=True,
+                        max_samples=8)
+
+    with Dataset(tmp_path / "reference.nc") as reference:
+        with Dataset(tmp_path / "preallocated.nc") as preallocated:
+            samples = preallocated.dimensions["samples"]
+            assert not samples.isunlimited()
+            assert samples.size == reference.dimensions["samples"].size
+            v = preallocated["brightness_temps"]
+            assert v.chunking() == [16, 15]
+            assert v.filters()["zlib"]
+            for k in reference.variables:
+                assert np.isclose(reference[k][:].sum(), preallocated[k][:].sum())
+
+    with Dataset(tmp_path / "sharded.nc") as sharded:
+        samples = sharded.dimensions["samples"]
+        assert not samples.isunlimited()
+        assert samples.size == 24
+        assert not np.any(np.ma.getmaskarray(sharded["surface_precip"][:]))
+
+
+def test_file_processor_compact_profiles(tmp_path, bin_files):
+    """
+    Ensure that compact profiles match the extracted profiles up to the
+    relative precision of the quantization.
+    """
+    input_path = bin_files(["gpm_300_40_00_18.bin", "gpm_290_40_00_18.bin"])
+
+    processor = FileProcessor(input_path)
+    processor.run_async(tmp_path / "reference.nc", 0.0, 1.0, 1,
+                        include_profiles=True)
+    processor.run_async(tmp_path / "compact.nc", 0.0, 1.0, 2,
+                        n_shards=2,
+                        include_profiles=True,
+                        compact_profiles=True)
+
+    max_error = 10.0 ** -(PROFILE_SIGNIFICANT_DIGITS - 1)
+    with Dataset(tmp_path / "reference.nc") as reference:
+        with Dataset(tmp_path / "compact.nc") as compact:
+            for k in PROFILE_NAMES:
+                assert compact[k].filters()["zlib"]
+                x_ref = np.sort(reference[k][:].ravel())
+                x = np.sort(compact[k][:].ravel())
+                assert x.dtype == np.float32
+                non_zero = x_ref != 0
+                assert np.any(non_zero)
+                error = np.abs(x[non_zero] - x_ref[non_zero])
+                assert np.all(error <= max_error * np.abs(x_ref[non_zero]))
+                # Zeros and missing values are preserved exactly.
+                assert np.all(x[x_ref == 0] == 0)
+                assert np.all(x[x_ref == -999] == -999)
+
+
 def test_retrieval_file_types():
     """
     Ensure that struct type defintions match the expected sizes.
@@ -55,3 +335,28 @@ def test_retrieval_file_types():
     assert SCAN_HEADER_TYPES.itemsize == 28
     assert DATA_RECORD_TYPES.itemsize == 88
 
+
+
+def test_truncate_samples(tmp_path):
+    """
+    Ensure that truncating a file keeps the leading samples and its
+    permissions and that no temporary files are left behind, also if
+    the truncation fails.
+    """
+    filename = tmp_path / "output.nc"
+    with Dataset(filename, "w") as handle:
+        handle.createDimension("samples", None)
+        handle.createVariable("x", np.float32, ("samples",))[:] = np.arange(10)
+    filename.chmod(0o644)
+
+    truncate_samples(filename, 4)
+    with Dataset(filename) as handle:
+        assert np.all(handle["x"][:] == np.arange(4))
+    assert filename.stat().st_mode & 0o777 == 0o644
+
+    invalid = tmp_path / "invalid.nc"
+    invalid.write_text("not a NetCDF file")
+    with pytest.raises(OSError):
+        truncate_samples(invalid, 4)
+    assert invalid.read_text() == "not a NetCDF file"
+    assert not list(tmp_path.glob("*.tmp"))
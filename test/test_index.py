@@ -0,0 +1,90 @@
+"""
+Tests for the granule index.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from regn.data.csu.index import GranuleIndex
+from regn.data.csu.retrieval import RetrievalFile
+from regn.data.csu.synthetic import (write_preprocessor_file,
+                                     write_retrieval_file)
+
+
+def test_granule_index(tmp_path):
+    """
+    Ensure that the index finds files by time and granule number and
+    that it is updated incrementally.
+    """
+    start = datetime(2019, 1, 1)
+    for i in range(4):
+        day = start + timedelta(days=i)
+        path = tmp_path / f"{day:%Y%m%d}"
+        path.mkdir()
+        write_preprocessor_file(path / f"{i:06}.pp",
+                                n_scans=10,
+                                granule=i,
+                                start_time=day)
+        write_retrieval_file(path / f"{i:06}.BIN.gz",
+                             n_scans=10,
+                             granule=i,
+                             start_time=day)
+
+    index = GranuleIndex(tmp_path)
+    assert len(index) == 8
+    assert (tmp_path / ".granule_index.npz").exists()
+
+    entries = index.select(file_type="preprocessor")
+    assert np.all(entries["granule"] == np.arange(4))
+    assert np.all(entries["n_scans"] == 10)
+    assert entries["start_time"][1] == np.datetime64("2019-01-02T00:00:00")
+    # 10 scans with a scan period of 1.875 s.
+    assert entries["end_time"][1] == np.datetime64("2019-01-02T00:00:16")
+
+    files = index.find_files(start=datetime(2019, 1, 2, 12),
+                             end=datetime(2019, 1, 3, 12))
+    assert sorted([f.name for f in files]) == ["000002.BIN.gz", "000002.pp"]
+    files = index.find_files(granules=[1, 3], file_type="retrieval")
+    assert [f.name for f in files] == ["000001.BIN.gz", "000003.BIN.gz"]
+
+    # Only new or modified files are read when the index is updated.
+    (tmp_path / "20190101" / "000000.pp").unlink()
+    write_retrieval_file(tmp_path / "20190104" / "000003.BIN.gz",
+                         n_scans=10,
+                         granule=5,
+                         start_time=start)
+    index = GranuleIndex(tmp_path)
+    assert len(index) == 7
+    assert sorted(index.select(file_type="retrieval")["granule"]) == [0, 1, 2, 5]
+
+
+def test_retrieval_file_without_granule_dates(tmp_path):
+    """
+    Ensure that the scan dates are used for retrieval files whose orbit
+    header doesn't contain granule dates.
+    """
+    filename = write_retrieval_file(tmp_path / "input.BIN.gz",
+                                    n_scans=10,
+                                    granule=1,
+                                    start_time=datetime(2019, 1, 2))
+    retrieval_file = RetrievalFile(filename)
+    orbit_header = retrieval_file.orbit_header.copy()
+    orbit_header["granule_start_date"] = 0
+    orbit_header["granule_end_date"] = 0
+    for name, compress in [("000001.BIN", False), ("000001.BIN.gz", True)]:
+        RetrievalFile.write(tmp_path / name,
+                            orbit_header,
+                            retrieval_file.scan_data,
+                            profile_info=retrieval_file.profile_info,
+                            compress=compress)
+    filename.unlink()
+
+    index = GranuleIndex(tmp_path)
+    entries = index.select(file_type="retrieval")
+    assert len(entries) == 2
+    assert np.all(entries["start_time"] == np.datetime64("2019-01-02T00:00:00"))
+    assert np.all(entries["end_time"] == np.datetime64("2019-01-02T00:00:16"))
+
+    files = index.find_files(start=datetime(2019, 1, 2),
+                             end=datetime(2019, 1, 3))
+    assert len(files) == 2
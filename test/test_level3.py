@@ -0,0 +1,69 @@
+"""
+Tests for the accumulation of retrieval results on Level 3 grids.
+"""
+import numpy as np
+import pytest
+
+from regn.data.csu.level3 import Level3Grid, grid_retrieval_files
+from regn.data.csu.retrieval import RetrievalFile
+from regn.data.csu.synthetic import write_retrieval_file
+
+
+def test_add():
+    """
+    Ensure that values are accumulated in the right cells and that
+    missing values are ignored.
+    """
+    grid = Level3Grid(resolution=10.0, variables=["surface_precip"])
+    lats = np.array([-90.0, -85.0, 5.0, 5.0, 89.0, 90.0])
+    lons = np.array([-180.0, -175.0, 5.0, 185.0, 179.0, 180.0])
+    precip = np.array([1.0, 3.0, 2.0, 4.0, -9999.0, np.nan])
+    grid.add(lats, lons, {"surface_precip": precip})
+
+    counts = grid.counts["surface_precip"]
+    assert counts.sum() == 4
+    assert counts[0, 0] == 2
+    assert counts[9, 18] == 1
+    assert counts[9, 0] == 1
+
+    data = grid.to_xarray_dataset()
+    assert data["surface_precip"].data[0, 0] == 2.0
+    assert data["surface_precip"].data[9, 0] == 4.0
+    assert np.isnan(data["surface_precip"].data[1, 1])
+
+    with pytest.raises(ValueError):
+        Level3Grid(resolution=7.0)
+
+
+def test_grid_retrieval_files(tmp_path):
+    """
+    Ensure that grids accumulated in parallel, or saved and merged, are
+    identical to the grid accumulated serially.
+    """
+    files = [write_retrieval_file(tmp_path / f"{i}.BIN.gz",
+                                  n_scans=20,
+                                  granule=i,
+                                  seed=i)
+             for i in range(3)]
+
+    grid = grid_retrieval_files(files, resolution=2.0)
+    total = sum([RetrievalFile(f).n_scans * RetrievalFile(f).n_pixels
+                 for f in files])
+    assert grid.counts["surface_precip"].sum() == total
+    precip = np.concatenate([
+        RetrievalFile(f).get_variable("surface_precip").ravel() for f in files
+    ])
+    assert np.isclose(grid.sums["surface_precip"].sum(), precip.sum())
+
+    grid_parallel = grid_retrieval_files(files, resolution=2.0, n_processes=2)
+    for k in grid.variables:
+        assert np.all(grid.counts[k] == grid_parallel.counts[k])
+        assert np.allclose(grid.sums[k], grid_parallel.sums[k])
+
+    partial = grid_retrieval_files(files[:1], resolution=2.0)
+    partial.save(tmp_path / "partial.npz")
+    merged = Level3Grid.load(tmp_path / "partial.npz")
+    merged += grid_retrieval_files(files[1:], resolution=2.0)
+    for k in grid.variables:
+        assert np.all(grid.counts[k] == merged.counts[k])
+        assert np.allclose(grid.sums[k], merged.sums[k])
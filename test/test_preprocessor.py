@@ -0,0 +1,138 @@
+"""
+Tests for reading and writing of preprocessor files.
+"""
+import gzip
+
+import numpy as np
+import pytest
+
+from regn.data.csu.preprocessor import DATA_RECORD_TYPES, PreprocessorFile
+from regn.data.csu.retrieval import RetrievalFile
+from regn.data.csu.synthetic import write_preprocessor_file
+
+
+def test_to_xarray_dataset(tmp_path):
+    """
+    Ensure that decoding the file into an xarray dataset yields the
+    same data as reading it scan by scan.
+    """
+    filename = write_preprocessor_file(tmp_path / "test.pp",
+                                       n_scans=20,
+                                       seed=0)
+    input_file = PreprocessorFile(filename)
+    data = input_file.to_xarray_dataset()
+    for k in DATA_RECORD_TYPES.fields:
+        assert data[k].dtype == DATA_RECORD_TYPES[k].base
+        for i, scan in enumerate(input_file.scans):
+            assert np.all(data[k].data[i] == scan[k])
+
+
+def test_mmap_variable_selection(tmp_path):
+    """
+    Ensure that memory-mapped files yield the same data and that only
+    selected variables are decoded.
+    """
+    filename = write_preprocessor_file(tmp_path / "test.pp",
+                                       n_scans=20,
+                                       seed=0)
+    reference = PreprocessorFile(filename).to_xarray_dataset()
+    input_file = PreprocessorFile(filename, mmap=True)
+    variables = ["brightness_temperatures", "surface_type"]
+    data = input_file.to_xarray_dataset(variables=variables)
+    assert set(data.variables) == set(variables)
+    for k in variables:
+        assert np.all(data[k].data == reference[k].data)
+
+    t2m = input_file.get_variable("two_meter_temperature")
+    assert np.all(t2m == reference["two_meter_temperature"].data)
+    with pytest.raises(ValueError):
+        input_file.get_variable("surface_precip")
+
+
+def test_write_retrieval_results(tmp_path):
+    """
+    Ensure that retrieval results written to a folder or an open file
+    can be read back.
+    """
+    filename = write_preprocessor_file(tmp_path / "test.pp",
+                                       n_scans=20,
+                                       granule=7,
+                                       seed=0)
+    input_file = PreprocessorFile(filename)
+    shape = (input_file.n_scans, input_file.n_pixels)
+    results = {"precip_mean": np.random.rand(*shape),
+               "precip_1st_tertial": np.random.rand(*shape),
+               "precip_3rd_tertial": np.random.rand(*shape),
+               "precip_pop": np.random.rand(*shape)}
+
+    output_file = input_file.write_retrieval_results(tmp_path, results)
+    assert output_file.name == input_file._get_retrieval_filename()
+
+    with open(output_file, "rb") as source:
+        with gzip.open(tmp_path / "output.BIN.gz", "wb") as target:
+            target.write(source.read())
+    with gzip.open(tmp_path / "streamed.BIN.gz", "wb") as target:
+        input_file.write_retrieval_results(target, results)
+
+    for name in ["output.BIN.gz", "streamed.BIN.gz"]:
+        retrieval_file = RetrievalFile(tmp_path / name)
+        assert retrieval_file.n_scans == input_file.n_scans
+        assert retrieval_file.orbit_header["granule_number"][0] == 7
+        assert retrieval_file.orbit_header["algorithm"][0] == b"QPROF"
+        for i in [0, -1]:
+            header = retrieval_file.get_scan_header(i)
+            assert header["scan_date"]["second"] == \
+                input_file.get_scan_header(i)["scan_date"]["second"]
+        orbit_header = retrieval_file.orbit_header[0]
+        for k, i in [("granule_start_date", 0), ("granule_end_date", -1)]:
+            scan_date = input_file.get_scan_header(i)["scan_date"]
+            for f in orbit_header[k].dtype.names:
+                assert orbit_header[k][f] == scan_date[f]
+        assert orbit_header["creation_date"]["year"] >= 2020
+        scan = retrieval_file.get_scan(3)
+        assert np.allclose(scan["surface_precip"], results["precip_mean"][3])
+        assert np.all(scan["latitude"] == input_file.get_scan(3)["latitude"])
+
+
+def test_get_input_blocks(tmp_path):
+    """
+    Ensure that the input blocks match the batches of the InputData class.
+    """
+    from regn.gprof import InputData
+
+    filename = write_preprocessor_file(tmp_path / "test.pp",
+                                       n_scans=10,
+                                       seed=0)
+    input_file = PreprocessorFile(filename)
+    blocks = list(input_file.get_input_blocks(scans_per_block=4))
+    assert len(blocks) == 3
+    assert blocks[-1].shape == (2 * input_file.n_pixels, 40)
+
+    input_data = InputData(filename, lambda x: x, scans_per_batch=4)
+    for i, block in enumerate(blocks):
+        assert np.all(block == input_data.get_batch(i))
+    # One-hot encoded surface and airmass types.
+    assert np.all(blocks[0][:, 17:36].sum(axis=1) == 1.0)
+    assert np.all(blocks[0][:, 36:].sum(axis=1) == 1.0)
+
+
+def test_write_compressed_retrieval_results(tmp_path):
+    """
+    Ensure that compressed retrieval results can be read.
+    """
+    filename = write_preprocessor_file(tmp_path / "test.pp",
+                                       n_scans=20,
+                                       seed=0)
+    input_file = PreprocessorFile(filename)
+    shape = (input_file.n_scans, input_file.n_pixels)
+    results = {"precip_mean": np.random.rand(*shape),
+               "precip_1st_tertial": np.random.rand(*shape),
+               "precip_3rd_tertial": np.random.rand(*shape),
+               "precip_pop": np.random.rand(*shape)}
+    output_file = input_file.write_retrieval_results(tmp_path,
+                                                     results,
+                                                     compress=True)
+    assert output_file.name.endswith(".BIN.gz")
+    retrieval_file = RetrievalFile(output_file)
+    assert np.allclose(retrieval_file.get_variable("surface_precip"),
+                       results["precip_mean"])
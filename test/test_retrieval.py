@@ -0,0 +1,139 @@
+"""
+Tests for reading GPROF retrieval files.
+"""
+import gzip
+import os
+
+import numpy as np
+import pytest
+
+from regn.data.csu.retrieval import (DATA_RECORD_TYPES,
+                                     RetrievalFile,
+                                     get_cache_filename,
+                                     write_gzip)
+from regn.data.csu.synthetic import write_retrieval_file
+
+
+def test_retrieval_file_cache(tmp_path):
+    """
+    Ensure that reading a retrieval file through the cache yields the same
+    data and that the file is decompressed only once.
+    """
+    filename = write_retrieval_file(tmp_path / "test.BIN.gz",
+                                    n_scans=20,
+                                    seed=0)
+    cache = tmp_path / "cache"
+    reference = RetrievalFile(filename)
+    retrieval_file = RetrievalFile(filename, cache=cache)
+
+    cache_file = get_cache_filename(filename, cache)
+    assert cache_file.exists()
+    assert len(list(cache.iterdir())) == 1
+    inode = cache_file.stat().st_ino
+
+    retrieval_file = RetrievalFile(filename, cache=cache)
+    assert cache_file.stat().st_ino == inode
+    for i in [0, 7, reference.n_scans - 1]:
+        assert np.all(retrieval_file.get_scan(i) == reference.get_scan(i))
+        assert retrieval_file.get_scan_header(i) == reference.get_scan_header(i)
+    assert np.all(reference.get_scan(-1) == reference.scan_data["data"][-1])
+
+    # Uncompressed files are read directly.
+    with gzip.open(filename, "rb") as source:
+        with open(tmp_path / "test.BIN", "wb") as target:
+            target.write(source.read())
+    retrieval_file = RetrievalFile(tmp_path / "test.BIN")
+    assert np.all(retrieval_file.get_scan(3) == reference.get_scan(3))
+
+
+def test_retrieval_file_cache_eviction(tmp_path):
+    """
+    Ensure that the least recently used files are removed from the cache
+    when it exceeds its size limit.
+    """
+    cache = tmp_path / "cache"
+    files = [write_retrieval_file(tmp_path / f"{i:06}.BIN.gz",
+                                  n_scans=20,
+                                  granule=i,
+                                  seed=i) for i in range(3)]
+    RetrievalFile(files[0], cache=cache)
+    cache_file = get_cache_filename(files[0], cache)
+    size = cache_file.stat().st_size
+    # Other files in the cache directory are not evicted.
+    other_file = cache / "other.npz"
+    other_file.write_bytes(bytes(size))
+    os.utime(other_file, (0, 0))
+    (cache / "subdirectory").mkdir()
+
+    cache_files = [get_cache_filename(f, cache) for f in files]
+    RetrievalFile(files[1], cache=cache, cache_size=2 * size)
+    os.utime(cache_files[0], (0, 0))
+    os.utime(cache_files[1], (1, 1))
+    # Using a cached file marks it as recently used.
+    RetrievalFile(files[0], cache=cache, cache_size=2 * size)
+    RetrievalFile(files[2], cache=cache, cache_size=2 * size)
+
+    assert cache_files[0].exists()
+    assert not cache_files[1].exists()
+    assert cache_files[2].exists()
+    assert other_file.exists()
+
+
+def test_to_xarray_dataset(tmp_path):
+    """
+    Ensure that the dataset contains the data of all scans in the native
+    data types and that variables can be selected.
+    """
+    filename = write_retrieval_file(tmp_path / "test.BIN.gz",
+                                    n_scans=20,
+                                    seed=0)
+    retrieval_file = RetrievalFile(filename)
+    data = retrieval_file.to_xarray_dataset()
+    for k in DATA_RECORD_TYPES.fields:
+        assert data[k].dtype == DATA_RECORD_TYPES[k].base
+        for i, scan in enumerate(retrieval_file.scans):
+            assert np.all(data[k].data[i] == scan[k])
+
+    data = retrieval_file.to_xarray_dataset(variables=["surface_precip"])
+    assert list(data.variables) == ["surface_precip"]
+    with pytest.raises(ValueError):
+        retrieval_file.get_variable("brightness_temperatures")
+
+
+def test_write(tmp_path):
+    """
+    Ensure that writing the data of a retrieval file, with and without
+    parallel compression, reproduces the file.
+    """
+    filename = write_retrieval_file(tmp_path / "test.BIN.gz",
+                                    n_scans=20,
+                                    seed=0)
+    retrieval_file = RetrievalFile(filename)
+
+    output_file = tmp_path / "output.BIN"
+    RetrievalFile.write(output_file,
+                        retrieval_file.orbit_header,
+                        retrieval_file.scan_data,
+                        retrieval_file.profile_info)
+    with gzip.open(filename, "rb") as file:
+        assert output_file.read_bytes() == file.read()
+
+    output_file = tmp_path / "output.BIN.gz"
+    RetrievalFile.write(output_file,
+                        retrieval_file.orbit_header,
+                        retrieval_file.scan_data,
+                        n_threads=4)
+    written = RetrievalFile(output_file)
+    assert written.n_scans == 20
+    assert np.all(written.scan_data == retrieval_file.scan_data)
+
+
+def test_write_gzip(tmp_path):
+    """
+    Ensure that data compressed in parallel blocks is decompressed
+    correctly.
+    """
+    data = np.random.randint(0, 4, size=10_000, dtype=np.uint8).tobytes()
+    write_gzip(tmp_path / "test.gz", data, n_threads=3, block_size=999)
+    with gzip.open(tmp_path / "test.gz", "rb") as file:
+        assert file.read() == data
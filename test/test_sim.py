@@ -0,0 +1,327 @@
+"""
+Tests for the processing of .sim files.
+"""
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+import numpy as np
+import xarray
+
+from regn.data.csu.manifest import Manifest
+from regn.data.csu.sim import (SimFileProcessor,
+                              _extract_scenes,
+                              _get_preprocessor_command,
+                              match_swath,
+                              merge_scene_files)
+from regn.data.csu.synthetic import (get_preprocessor_filename,
+                                     get_swath_geometry,
+                                     write_sim_file)
+
+
+def test_match_swath():
+    """
+    Ensure that points are matched to the right swath pixels, also when
+    the expected indices are wrong, and that distant points are rejected.
+    """
+    lats_swath, lons_swath, _, _ = get_swath_geometry(200, 221)
+    scans, pixels = np.meshgrid(np.arange(200), np.arange(90, 131),
+                                indexing="ij")
+    scans = scans.ravel()
+    pixels = pixels.ravel()
+    lats = lats_swath[scans, pixels]
+    lons = lons_swath[scans, pixels]
+
+    scans_m, pixels_m = match_swath(lats, lons, scans, pixels,
+                                    lats_swath, lons_swath)
+    assert np.all(scans_m == scans)
+    assert np.all(pixels_m == pixels)
+
+    # Wrong expected indices are resolved by the full search.
+    scans_m, pixels_m = match_swath(lats, lons, scans + 20, pixels - 10,
+                                    lats_swath, lons_swath)
+    assert np.all(scans_m == scans)
+    assert np.all(pixels_m == pixels)
+
+    # Points far from the swath are rejected.
+    lons = lons.copy()
+    lons[:10] += 180.0
+    scans_m, pixels_m = match_swath(lats, lons, scans, pixels,
+                                    lats_swath, lons_swath)
+    assert np.all(scans_m[:10] == -1)
+    assert np.all(pixels_m[:10] == -1)
+    assert np.all(scans_m[10:] == scans[10:])
+
+
+def _write_test_files(tmp_path, n_files=3):
+    """
+    Write .sim files, corresponding L1C files and a stub preprocessor,
+    which copies the L1C file to the output file. The L1C files are the
+    preprocessor files corresponding to the .sim files.
+
+    Returns:
+        Tuple ``(sim_path, l1c_path, preprocessor)``.
+    """
+    preprocessor = tmp_path / "preprocessor.sh"
+    preprocessor.write_text('#!/bin/sh\ncp "$3" "$7"\n')
+    preprocessor.chmod(0o755)
+
+    sim_path = tmp_path / "sim"
+    sim_path.mkdir()
+    l1c_path = tmp_path / "l1c" / "1901" / "190101"
+    l1c_path.mkdir(parents=True)
+    # Granule numbers start at 1, since the L1C file pattern for granule 0
+    # would match the files of all granules.
+    for granule in range(1, n_files + 1):
+        write_sim_file(sim_path, n_scans=300, granule=granule, seed=granule)
+        preprocessor_file = sim_path / get_preprocessor_filename(granule)
+        preprocessor_file.rename(l1c_path / f"1C-R.GPM.GMI.{granule:06}.HDF5")
+    return sim_path, tmp_path / "l1c", preprocessor
+
+
+def test_run_async(tmp_path):
+    """
+    Ensure that the asynchronous processing runs the preprocessor and
+    extracts scenes from all .sim files.
+    """
+    sim_path, l1c_path, preprocessor = _write_test_files(tmp_path)
+
+    output_file = tmp_path / "output.nc"
+    processor = SimFileProcessor(sim_path,
+                                 l1c_path,
+                                 output_file,
+                                 n_workers=2,
+                                 preprocessor=preprocessor)
+    processor.run_async(n_preprocessors=2)
+    assert len(processor.processed) == 3
+    assert not list(sim_path.glob("*.pp"))
+
+    data = xarray.load_dataset(output_file)
+    assert data.samples.size == 6
+    assert np.all(np.any(np.isfinite(data["surface_precip"].data), axis=(1, 2)))
+    assert len(Manifest(output_file)) == 3
+
+
+def test_run_async_bounded(tmp_path):
+    """
+    Ensure that the preprocessor outputs are written to the scratch
+    directory and that the preprocessor doesn't get ahead of the matching
+    by more than the number of worker processes.
+    """
+    sim_path, l1c_path, preprocessor = _write_test_files(tmp_path)
+    log = tmp_path / "preprocessor.log"
+    preprocessor.write_text(
+        '#!/bin/sh\n'
+        f'ls "$(dirname "$7")" | wc -l >> {log}\n'
+        f'dirname "$7" >> {log}\n'
+        'cp "$3" "$7"\n'
+    )
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+
+    processor = SimFileProcessor(sim_path,
+                                 l1c_path,
+                                 tmp_path / "output.nc",
+                                 n_workers=1,
+                                 preprocessor=preprocessor)
+    processor.run_async(n_preprocessors=1, scratch=scratch)
+    assert len(processor.processed) == 3
+
+    lines = log.read_text().split()
+    assert all([int(n) <= 1 for n in lines[::2]])
+    assert all([Path(d).parent == scratch for d in lines[1::2]])
+
+
+def test_run_async_failure(tmp_path):
+    """
+    Ensure that files whose processing fails are skipped.
+    """
+    sim_path, l1c_path, preprocessor = _write_test_files(tmp_path)
+    next(l1c_path.glob("**/*000002.HDF5")).write_bytes(b"corrupt")
+
+    output_file = tmp_path / "output.nc"
+    processor = SimFileProcessor(sim_path,
+                                 l1c_path,
+                                 output_file,
+                                 n_workers=1,
+                                 preprocessor=preprocessor)
+    processor.run_async()
+    assert len(processor.processed) == 2
+    assert len(Manifest(output_file)) == 2
+
+
+def test_run_async_cache(tmp_path):
+    """
+    Ensure that the cached preprocessor data is keyed by the version of
+    the preprocessor executable.
+    """
+    sim_path, l1c_path, preprocessor = _write_test_files(tmp_path)
+    cache = tmp_path / "cache"
+
+    def run(output_file):
+        processor = SimFileProcessor(sim_path,
+                                     l1c_path,
+                                     tmp_path / output_file,
+                                     n_workers=1,
+                                     cache=cache,
+                                     preprocessor=preprocessor)
+        processor.run_async()
+        assert len(processor.processed) == 3
+
+    run("output_1.nc")
+    assert len(list(cache.glob("*.npz"))) == 3
+    run("output_2.nc")
+    assert len(list(cache.glob("*.npz"))) == 3
+
+    # A modified executable doesn't use the data of the previous one.
+    os.utime(preprocessor, (0, 0))
+    run("output_3.nc")
+    assert len(list(cache.glob("*.npz"))) == 6
+
+
+def test_preprocessor_job_ids():
+    """
+    Ensure that concurrent preprocessor runs get separate job IDs.
+    """
+    commands = [_get_preprocessor_command("preprocessor", "input.HDF5", f)
+                for f in ["output_1.pp", "output_2.pp"]]
+    assert commands[0][1] != commands[1][1]
+
+
+def test_processor_exits(tmp_path):
+    """
+    Ensure that the interpreter exits after a processor for many files
+    was created but not run with worker processes.
+    """
+    sim_path = tmp_path / "sim"
+    sim_path.mkdir()
+    for i in range(3000):
+        (sim_path / f"GMI.dbsatTb.20190101.{i:06}.sim").touch()
+    script = ("from regn.data.csu.sim import SimFileProcessor\n"
+              f"processor = SimFileProcessor('{sim_path}', '{tmp_path}', "
+              f"'{tmp_path / 'output.nc'}')\n"
+              "assert len(processor.files) == 3000\n")
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=60)
+
+
+def test_extract_scenes():
+    """
+    Ensure that overlapping scenes are extracted at the right positions
+    and that scenes with too little valid surface precipitation are
+    discarded.
+    """
+    n_scans, n_pixels = 100, 60
+    data = xarray.Dataset({
+        "latitude": (("scans", "pixels"),
+                     np.arange(n_scans * n_pixels).reshape(n_scans, n_pixels)),
+        "brightness_temperatures": (("scans", "pixels", "channels"),
+                                    np.random.rand(n_scans, n_pixels, 15)),
+        "surface_precip": (("scans", "pixels"),
+                           np.full((n_scans, n_pixels), np.nan)),
+    })
+    data["surface_precip"].data[10:90, 20:40] = 1.0
+    data["surface_precip"].data[55:88] = np.nan
+
+    scenes = _extract_scenes(data, size=20, stride=10)
+    assert scenes.samples.size == 6
+    assert np.all(scenes["latitude"].data[1]
+                  == data["latitude"].data[20:40, 20:40])
+    assert np.all(scenes["brightness_temperatures"].data[4]
+                  == data["brightness_temperatures"].data[50:70, 20:40])
+
+    scenes = _extract_scenes(data, size=20, stride=10, min_coverage=0.5)
+    assert scenes.samples.size == 4
+    assert np.all(scenes["latitude"].data[-1]
+                  == data["latitude"].data[40:60, 20:40])
+
+    # Swaths shorter than the scene size yield no scenes.
+    scenes = _extract_scenes(data, size=128)
+    assert scenes.samples.size == 0
+    assert scenes["brightness_temperatures"].shape[:2] == (0, 128)
+
+
+def test_run_sharded(tmp_path):
+    """
+    Ensure that the worker processes write to separate shards and that
+    the shards are merged into the output file.
+    """
+    sim_path, l1c_path, preprocessor = _write_test_files(tmp_path)
+
+    output_file = tmp_path / "output.nc"
+    processor = SimFileProcessor(sim_path,
+                                 l1c_path,
+                                 output_file,
+                                 n_workers=2,
+                                 preprocessor=preprocessor)
+    shards = processor.run(merge=False)
+    assert len(processor.processed) == 3
+    assert sum([len(Manifest(f)) for f in shards]) == 3
+    assert sum([xarray.load_dataset(f).samples.size for f in shards]) == 6
+
+    processor = SimFileProcessor(sim_path,
+                                 l1c_path,
+                                 output_file,
+                                 n_workers=2,
+                                 preprocessor=preprocessor)
+    processor.run()
+    assert not [f for f in processor.shards if f.exists()]
+    data = xarray.load_dataset(output_file)
+    assert data.samples.size == 6
+    manifest = Manifest(output_file)
+    assert len(manifest) == 3
+    assert manifest.n_samples == 6
+
+
+def test_run_sharded_failure(tmp_path):
+    """
+    Ensure that the worker processes skip files whose processing fails.
+    """
+    sim_path, l1c_path, preprocessor = _write_test_files(tmp_path)
+    next(l1c_path.glob("**/*000002.HDF5")).unlink()
+
+    output_file = tmp_path / "output.nc"
+    processor = SimFileProcessor(sim_path,
+                                 l1c_path,
+                                 output_file,
+                                 n_workers=2,
+                                 preprocessor=preprocessor)
+    processor.run()
+    assert len(processor.processed) == 2
+    assert len(Manifest(output_file)) == 2
+
+
+def test_resume_interrupted_merge(tmp_path):
+    """
+    Ensure that shards that were merged before an interruption are not
+    merged again when the extraction is resumed.
+    """
+    sim_path, l1c_path, preprocessor = _write_test_files(tmp_path)
+
+    output_file = tmp_path / "output.nc"
+    processor = SimFileProcessor(sim_path,
+                                 l1c_path,
+                                 output_file,
+                                 n_workers=2,
+                                 preprocessor=preprocessor)
+    shards = processor.run(merge=False)
+
+    # Interrupt the merge after the first shard has been committed but
+    # before it was removed.
+    merge_scene_files(shards[:1], output_file)
+    assert shards[0].exists()
+
+    processor = SimFileProcessor(sim_path,
+                                 l1c_path,
+                                 output_file,
+                                 n_workers=2,
+                                 resume=True,
+                                 preprocessor=preprocessor)
+    assert not processor.files
+    processor.run_async()
+    assert not [f for f in processor.shards if f.exists()]
+    data = xarray.load_dataset(output_file)
+    assert data.samples.size == 6
+    manifest = Manifest(output_file)
+    assert len(manifest) == 3
+    assert manifest.n_samples == 6
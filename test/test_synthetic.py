@@ -0,0 +1,82 @@
+"""
+Tests for the generation of synthetic GPROF files.
+"""
+import numpy as np
+
+from regn.data.csu.bin import FileProcessor, GPROFGMIBinFile
+from regn.data.csu.preprocessor import PreprocessorFile
+from regn.data.csu.retrieval import RetrievalFile
+from regn.data.csu.sim import GPROFGMISimFile
+from regn.data.csu.synthetic import (get_preprocessor_filename,
+                                     write_bin_file,
+                                     write_preprocessor_file,
+                                     write_retrieval_file,
+                                     write_sim_file)
+
+
+def test_synthetic_bin_files(tmp_path):
+    """
+    Ensure that synthetic bin files are found and processed by the
+    file processor.
+    """
+    for i in range(3):
+        write_bin_file(tmp_path, temperature=280 + i, n_profiles=100, seed=i)
+    write_bin_file(tmp_path, airmass_type=1, n_profiles=50)
+
+    input_file = GPROFGMIBinFile(tmp_path / "gpm_300_40_01_18.bin")
+    assert input_file.n_profiles == 50
+    assert input_file.airmass_type == 1
+
+    processor = FileProcessor(tmp_path)
+    assert len(processor.files) == 4
+    processor.run_async(tmp_path / "output.nc", 0.0, 1.0, 1)
+
+
+def test_synthetic_preprocessor_file(tmp_path):
+    """
+    Ensure that synthetic preprocessor files can be read and contain
+    consistent scan times.
+    """
+    filename = write_preprocessor_file(tmp_path / "test.pp",
+                                       n_scans=100,
+                                       granule=123,
+                                       seed=0)
+    input_file = PreprocessorFile(filename)
+    assert input_file.n_scans == 100
+    assert input_file.n_pixels == 221
+
+    data = input_file.to_xarray_dataset()
+    assert np.all(np.abs(data["latitude"].data) <= 70)
+    assert np.all(data["brightness_temperatures"].data > 0)
+    name = input_file._get_retrieval_filename()
+    assert name == "2A.QCORE.GMI.V7.20190101-S000000-E000305.000123.BIN"
+
+
+def test_synthetic_retrieval_file(tmp_path):
+    """
+    Ensure that synthetic retrieval files can be read.
+    """
+    filename = write_retrieval_file(tmp_path / "test.BIN.gz",
+                                    n_scans=50,
+                                    seed=0)
+    retrieval_file = RetrievalFile(filename)
+    assert retrieval_file.n_scans == 50
+    data = retrieval_file.to_xarray_dataset()
+    assert np.all(data["surface_precip"].data >= 0)
+    assert np.any(data["surface_precip"].data > 0)
+
+
+def test_synthetic_sim_file(tmp_path):
+    """
+    Ensure that synthetic sim files match the corresponding preprocessor
+    file exactly.
+    """
+    filename = write_sim_file(tmp_path, n_scans=100, granule=42, seed=0)
+    sim_file = GPROFGMISimFile(filename)
+    assert sim_file.granule == 42
+
+    preprocessor_file = tmp_path / get_preprocessor_filename(42)
+    data = PreprocessorFile(preprocessor_file).to_xarray_dataset()
+    data = sim_file.match_surface_precip(data)
+    surface_precip = data["surface_precip"].data[:, 90:131].ravel()
+    assert np.all(surface_precip == sim_file.data["surface_precip"])
@@ -0,0 +1,53 @@
+"""
+Tests for the regn.utils module.
+"""
+import numpy as np
+import pytest
+
+from regn.utils import WGS84_A, WGS84_F, atomic_write, to_ecef
+
+
+def test_to_ecef():
+    """
+    Ensure that the conversion to ECEF coordinates yields the expected
+    coordinates and that it agrees with pyproj.
+    """
+    lats = np.array([0.0, 0.0, 90.0, -45.0])
+    lons = np.array([0.0, 90.0, 0.0, 180.0])
+    coords = to_ecef(lats, lons)
+    assert coords.dtype == np.float64
+    assert np.allclose(coords[0], [WGS84_A, 0, 0])
+    assert np.allclose(coords[1], [0, WGS84_A, 0])
+    assert np.allclose(coords[2], [0, 0, WGS84_A * (1.0 - WGS84_F)])
+
+    coords_32 = to_ecef(lats.astype(np.float32), lons.astype(np.float32))
+    assert coords_32.dtype == np.float32
+    assert np.allclose(coords_32, coords, atol=1.0)
+
+    pyproj = pytest.importorskip("pyproj")
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(-90, 90, size=1000)
+    lons = rng.uniform(-180, 180, size=1000)
+    alts = rng.uniform(0, 1e4, size=1000)
+    transformer = pyproj.Transformer.from_crs("EPSG:4979", "EPSG:4978")
+    x, y, z = transformer.transform(lats, lons, alts)
+    coords = to_ecef(lats, lons, alts)
+    assert np.allclose(coords, np.stack([x, y, z], axis=-1), atol=1e-3)
+
+
+def test_atomic_write(tmp_path):
+    """
+    Ensure that the target file is only replaced if writing succeeds and
+    that no temporary files are left behind.
+    """
+    filename = tmp_path / "test.txt"
+    with atomic_write(filename, mode="w") as file:
+        file.write("first")
+    assert filename.read_text() == "first"
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(filename, mode="w") as file:
+            file.write("second")
+            raise RuntimeError()
+    assert filename.read_text() == "first"
+    assert list(tmp_path.iterdir()) == [filename]